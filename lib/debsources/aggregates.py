@@ -0,0 +1,214 @@
+# Copyright (C) 2026  The Debsources developers
+# <qa-debsources@lists.alioth.debian.org>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/AUTHORS
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/COPYING
+
+"""incrementally maintained per-suite aggregates of package statistics
+
+The suite_aggregates table (see `models.SuiteAggregate`) stores, for each suite
+and archive area, the sum of the contributions of the packages in that suite to
+the following statistics: source_packages, source_files, disk_usage, ctags, and
+sloccount.LANGUAGE for each language. The pseudo-suite ALL_SUITES aggregates
+all packages, whatever their suites.
+
+Aggregates are updated by deltas: the contributions of packages are added (or
+subtracted) when packages are added to (or removed from) the DB, and when they
+enter (or leave) a suite. `check` recomputes aggregates from scratch, to
+verify them.
+
+"""
+
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+
+from sqlalchemy import sql
+
+from debsources.models import SuiteAggregate
+
+# pseudo-suite aggregating all packages, as in the history_* tables
+ALL_SUITES = "ALL"
+
+STATS = ["source_packages", "source_files", "disk_usage", "ctags"]
+SLOCCOUNT_PREFIX = "sloccount."
+
+# contributions of packages to aggregates, per package and statistic
+CONTRIBUTIONS_Q = """
+  SELECT p.id AS package_id, p.area AS area, 'source_packages' AS stat,
+    1 AS value
+  FROM packages p
+  WHERE %(filter)s
+UNION ALL
+  SELECT p.id, p.area, 'source_files', x.value
+  FROM package_counters x JOIN packages p ON p.id = x.package_id
+  WHERE x.counter = 'checksums' AND %(filter)s
+UNION ALL
+  SELECT p.id, p.area, 'disk_usage', sum(x.value_)
+  FROM metrics x JOIN packages p ON p.id = x.package_id
+  WHERE x.metric = 'size' AND %(filter)s
+  GROUP BY p.id
+UNION ALL
+  SELECT p.id, p.area, 'ctags', x.value
+  FROM package_counters x JOIN packages p ON p.id = x.package_id
+  WHERE x.counter = 'ctags' AND %(filter)s
+UNION ALL
+  SELECT p.id, p.area, 'sloccount.' || x.language::text, sum(x.count)
+  FROM sloccounts x JOIN packages p ON p.id = x.package_id
+  WHERE %(filter)s
+  GROUP BY p.id, x.language
+"""
+
+# add the contributions of the packages identified by :package_ids to the
+# aggregates of the suites listed by the %(suites)s query
+UPDATE_Q = """
+  INSERT INTO suite_aggregates (suite, area, stat, value)
+  SELECT s.suite, c.area, c.stat, :sign * sum(c.value)
+  FROM (%(contributions)s) AS c, (%(suites)s) AS s (suite)
+  GROUP BY s.suite, c.area, c.stat
+  HAVING sum(c.value) != 0
+  ON CONFLICT (suite, area, stat)
+  DO UPDATE SET value = suite_aggregates.value + EXCLUDED.value
+"""
+
+# compute aggregates from scratch
+COMPUTE_Q = """
+  WITH c AS (%(contributions)s)
+  SELECT :all AS suite, c.area, c.stat, sum(c.value) AS value
+  FROM c
+  GROUP BY c.area, c.stat
+UNION ALL
+  SELECT s.suite, c.area, c.stat, sum(c.value)
+  FROM c JOIN suites s ON s.package_id = c.package_id
+  GROUP BY s.suite, c.area, c.stat
+"""
+
+
+def _contributions_q(package_ids=True):
+    """contributions of the packages identified by the :package_ids query
+    parameter or, if `package_ids` is False, of all packages"""
+    if package_ids:
+        return CONTRIBUTIONS_Q % {"filter": "p.id = ANY(:package_ids)"}
+    return CONTRIBUTIONS_Q % {"filter": "TRUE"}
+
+
+def _prune(session):
+    session.execute(sql.delete(SuiteAggregate).where(SuiteAggregate.value == 0))
+
+
+def update_suite(session, suite, package_ids, sign=1):
+    """add the contributions of the packages identified by `package_ids` to
+    the aggregates of `suite`, e.g., when they enter the suite; if `sign` is
+    -1, subtract them instead, e.g., when they leave the suite
+
+    """
+    package_ids = list(package_ids)
+    if not package_ids:
+        return
+    q = UPDATE_Q % {"contributions": _contributions_q(), "suites": "SELECT :suite"}
+    session.execute(q, {"package_ids": package_ids, "suite": suite, "sign": sign})
+    if sign < 0:
+        _prune(session)
+
+
+def update_package(session, package_id, sign=1):
+    """add the contributions of the package identified by `package_id` to the
+    aggregates of ALL_SUITES and of all suites it currently belongs to, e.g.,
+    when it is added to the DB; if `sign` is -1, subtract them instead, e.g.,
+    before it is removed from the DB
+
+    """
+    suites_q = "SELECT :all UNION SELECT suite FROM suites WHERE package_id = :id"
+    q = UPDATE_Q % {"contributions": _contributions_q(), "suites": suites_q}
+    session.execute(
+        q,
+        {
+            "package_ids": [package_id],
+            "id": package_id,
+            "all": ALL_SUITES,
+            "sign": sign,
+        },
+    )
+    if sign < 0:
+        _prune(session)
+
+
+@contextmanager
+def package_changes(session, package_id):
+    """account for changes to the statistics of the package identified by
+    `package_id` (e.g., re-running hooks on it) made within the context"""
+    update_package(session, package_id, -1)
+    try:
+        yield
+    finally:
+        update_package(session, package_id)
+
+
+def compute(session):
+    """compute aggregates from scratch
+
+    return a dictionary mapping <suite, area, stat> triples to (non-zero)
+    values
+
+    """
+    q = COMPUTE_Q % {"contributions": _contributions_q(package_ids=False)}
+    aggregates = defaultdict(int)
+    for suite, area, stat, value in session.execute(q, {"all": ALL_SUITES}):
+        if value:
+            aggregates[(suite, area, stat)] += int(value)
+    return dict(aggregates)
+
+
+def load(session):
+    """load aggregates from the DB, in the same format of `compute`"""
+    q = session.query(
+        SuiteAggregate.suite,
+        SuiteAggregate.area,
+        SuiteAggregate.stat,
+        SuiteAggregate.value,
+    ).filter(SuiteAggregate.value != 0)
+    return {(suite, area, stat): value for suite, area, stat, value in q}
+
+
+def check(session, fix=False):
+    """verify aggregates in the DB, recomputing them from scratch
+
+    log and return the list of <suite, area, stat> triples whose value is
+    wrong. If `fix` is given, replace aggregates with the recomputed ones
+
+    """
+    expected = compute(session)
+    actual = load(session)
+    wrong = sorted(
+        key
+        for key in set(expected) | set(actual)
+        if expected.get(key, 0) != actual.get(key, 0)
+    )
+    for suite, area, stat in wrong:
+        logging.warn(
+            "wrong aggregate %s for suite %s, area %s: %d instead of %d"
+            % (
+                stat,
+                suite,
+                area,
+                actual.get((suite, area, stat), 0),
+                expected.get((suite, area, stat), 0),
+            )
+        )
+    if wrong and fix:
+        logging.info("rebuilding suite aggregates")
+        session.query(SuiteAggregate).delete()
+        session.execute(
+            sql.insert(SuiteAggregate.__table__),
+            [
+                {"suite": suite, "area": area, "stat": stat, "value": value}
+                for (suite, area, stat), value in expected.items()
+            ],
+        )
+    return wrong
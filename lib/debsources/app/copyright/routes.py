@@ -17,6 +17,7 @@ from debsources.excepts import Http404Error
 
 from ..helper import bind_render, generic_before_request
 from ..views import (
+    ChartView,
     ErrorHandler,
     IndexView,
     ListPackagesView,
@@ -25,6 +26,7 @@ from ..views import (
     Ping,
     PrefixView,
     SearchView,
+    send_chart,
 )
 from . import bp_copyright
 from .views import ChecksumLicenseView, LicenseView, SearchFileView, StatsView
@@ -276,3 +278,16 @@ bp_copyright.add_url_rule(
         get_objects="stats_suite",
     ),
 )
+
+
+# license trend charts, e.g. /copyright/stats/sid/trends/1-year.png
+bp_copyright.add_url_rule(
+    "/stats/<suite>/trends/<period>.<fmt>",
+    defaults={"metric": "license"},
+    view_func=ChartView.as_view(
+        "stats_trend",
+        render_func=send_chart,
+        err_func=ErrorHandler("copyright"),
+        metrics=["license"],
+    ),
+)
@@ -14,7 +14,14 @@
 from flask import current_app, url_for
 
 from debsources.excepts import Http404Error, Http500Error
-from debsources.models import Ctag, Metric, Package, PackageName, SlocCount, Suite
+from debsources.models import (
+    Metric,
+    Package,
+    PackageCounter,
+    PackageName,
+    SlocCount,
+    Suite,
+)
 
 PTS_PREFIX = "https://tracker.debian.org/pkg/"
 # XXX move this to configuration file?
@@ -119,19 +126,20 @@ class Infobox(object):
         """ctags counts"""
         try:
             ctags_count = (
-                self.session.query(Ctag)
+                self.session.query(PackageCounter.value)
                 .filter(
-                    Ctag.package_id == Package.id,
+                    PackageCounter.counter == "ctags",
+                    PackageCounter.package_id == Package.id,
                     Package.version == self.version,
                     Package.name_id == PackageName.id,
                     PackageName.name == self.package,
                 )
-                .count()
+                .scalar()
             )
         except Exception as e:  # pragma: no cover
             raise Http500Error(e)
 
-        return ctags_count
+        return ctags_count or 0
 
     def _get_license_link(self):
         """Returns the license link in the copyright BP"""
@@ -13,10 +13,12 @@
 
 from flask import current_app, jsonify, render_template, request
 
+from debsources.consts import TREND_METRICS
 from debsources.excepts import Http404Error
 
 from ..helper import bind_render, generic_before_request
 from ..views import (
+    ChartView,
     ChecksumView,
     CtagView,
     ErrorHandler,
@@ -28,6 +30,7 @@ from ..views import (
     Ping,
     PrefixView,
     SearchView,
+    send_chart,
 )
 from . import bp_sources
 from .views import SourceView, StatsView
@@ -141,6 +144,18 @@ bp_sources.add_url_rule(
 )
 
 
+# trend charts, e.g. /stats/sid/trends/ctags/1-year.png
+bp_sources.add_url_rule(
+    "/stats/<suite>/trends/<metric>/<period>.<fmt>",
+    view_func=ChartView.as_view(
+        "stats_trend",
+        render_func=send_chart,
+        err_func=ErrorHandler("sources"),
+        metrics=[metric for metric in TREND_METRICS if metric != "license"],
+    ),
+)
+
+
 # SEARCHVIEW
 bp_sources.add_url_rule(
     "/search/",
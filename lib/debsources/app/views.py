@@ -13,12 +13,20 @@
 
 from pathlib import Path
 
-from flask import current_app, jsonify, redirect, render_template, request, url_for
+from flask import (
+    current_app,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    send_file,
+    url_for,
+)
 from flask.views import View
 
 import debsources.query as qry
-from debsources import local_info
-from debsources.consts import SUITES
+from debsources import local_info, statistics
+from debsources.consts import SUITES, TREND_METRICS, TREND_PERIODS
 from debsources.excepts import (
     Http403Error,
     Http404Error,
@@ -524,3 +532,52 @@ class InfoPackageView(GeneralView):
     def get_objects(self, package, version):
         pkg_infos = Infobox(current_app.session, package, version).get_infos()
         return dict(pkg_infos=pkg_infos, package=package, version=version)
+
+
+# TREND CHARTS #
+
+# directory, in CACHE_DIR, where trend charts are cached
+CHARTS_CACHE_DIR = "charts"
+
+CHART_MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def send_chart(path, mimetype):
+    return send_file(path, mimetype=mimetype)
+
+
+class ChartView(GeneralView):
+    """trend charts, drawn on first request from the history_* tables, and
+    cached on disk until the next update run (as per the last-update file)"""
+
+    def get_objects(self, suite, metric, period, fmt):
+        # lazy import: charts pull in matplotlib
+        from debsources import charts
+
+        period = period.replace("-", " ")
+        if (
+            metric not in self.d.get("metrics", TREND_METRICS)
+            or period not in dict(TREND_PERIODS)
+            or fmt not in CHART_MIMETYPES
+        ):
+            raise Http404Error()
+        if suite != "ALL" and suite not in statistics.suites(
+            current_app.session, "all"
+        ):
+            raise Http404Error()  # security, to avoid suite='../../foo'
+
+        cache_dir = current_app.config["CACHE_DIR"] / CHARTS_CACHE_DIR
+        chart_file = cache_dir / charts.trend_chart_name(suite, metric, period, fmt)
+        update_ts_file = current_app.config["CACHE_DIR"] / "last-update"
+        try:
+            fresh = chart_file.stat().st_mtime >= update_ts_file.stat().st_mtime
+        except FileNotFoundError:
+            fresh = chart_file.exists()
+        if not fresh:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            plot, kwargs = charts.trend_chart(
+                current_app.session, suite, metric, period
+            )
+            charts.draw_chart(plot, chart_file, kwargs)
+
+        return dict(path=chart_file, mimetype=CHART_MIMETYPES[fmt])
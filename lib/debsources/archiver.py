@@ -15,9 +15,9 @@
 
 import logging
 
-from sqlalchemy import sql
+from sqlalchemy import not_, sql
 
-from debsources import db_storage, statistics, updater
+from debsources import aggregates, db_storage, statistics, updater
 from debsources.debmirror import SourcePackage
 from debsources.models import Package, Suite
 
@@ -82,38 +82,53 @@ def add_suite(conf, session, suite, archive):
     else:
         logging.warn("sticky suite %s already exist, looking for new packages" % suite)
 
+    package_ids = db_storage.package_ids(session)
+
     if updater.STAGE_EXTRACT in conf["stages"]:
+        sticky_ids = []  # IDs of already known packages, to be made sticky
         for pkg in archive.ls(suite):
-            db_package = db_storage.lookup_package(
-                session, pkg["package"], pkg["version"]
-            )
-            if db_package:  # avoid GC upon removal from a non-sticky suite
-                if not db_package.sticky and not conf["dry_run"]:
-                    logging.debug("setting sticky bit on %s" % pkg)
-                    db_package.sticky = True
+            package_id = package_ids.get((pkg["package"], pkg["version"]))
+            if package_id:  # avoid GC upon removal from a non-sticky suite
+                sticky_ids.append(package_id)
             else:
                 if not conf["single_transaction"]:
                     with session.begin():
-                        updater._add_package(pkg, conf, session, sticky=True)
+                        updater._add_package(
+                            pkg, conf, session, sticky=True, package_ids=package_ids
+                        )
                 else:
-                    updater._add_package(pkg, conf, session, sticky=True)
+                    updater._add_package(
+                        pkg, conf, session, sticky=True, package_ids=package_ids
+                    )
+        if sticky_ids and not conf["dry_run"]:
+            logging.debug("setting sticky bit on %d packages" % len(sticky_ids))
+            session.query(Package).filter(Package.id.in_(sticky_ids)).filter(
+                not_(Package.sticky)
+            ).update({"sticky": True}, synchronize_session=False)
         session.flush()  # to fill Package.id-s
 
     if updater.STAGE_SUITES in conf["stages"]:
         suitemap_q = sql.insert(Suite.__table__)
         suitemaps = []
+        mapped_ids = set(
+            row[0] for row in session.query(Suite.package_id).filter_by(suite=suite)
+        )
         for pkg, version in archive.suites[suite]:
-            db_package = db_storage.lookup_package(session, pkg, version)
-            if not db_package:
+            package_id = package_ids.get((pkg, version))
+            if not package_id:
                 logging.warn(
                     "package %s/%s not found in sticky suite"
                     " %s, skipping" % (pkg, version, suite)
                 )
                 continue
-            if not db_storage.lookup_suitemapping(session, db_package, suite):
-                suitemaps.append({"package_id": db_package.id, "suite": suite})
+            if package_id not in mapped_ids:
+                suitemaps.append({"package_id": package_id, "suite": suite})
+                mapped_ids.add(package_id)
         if suitemaps and not conf["dry_run"]:
             session.execute(suitemap_q, suitemaps)
+            aggregates.update_suite(
+                session, suite, [suitemap["package_id"] for suitemap in suitemaps]
+            )
 
     _add_stats_for(conf, session, suite)
 
@@ -160,6 +175,7 @@ def remove_suite(conf, session, suite):
 
             suitemap = db_storage.lookup_suitemapping(session, package, suite)
             if suitemap and not conf["dry_run"]:
+                aggregates.update_suite(session, suite, [package.id], -1)
                 session.delete(suitemap)
 
         if not conf["dry_run"]:
@@ -11,9 +11,16 @@
 # https://salsa.debian.org/qa/debsources/blob/master/COPYING
 
 
+import hashlib
+import json
 import logging
+import multiprocessing
 import operator
+import os
+import tempfile
+import threading
 from itertools import cycle
+from pathlib import Path
 
 import matplotlib
 
@@ -22,6 +29,12 @@ import matplotlib.cm as cm  # NOQA
 import matplotlib.pyplot as plt  # NOQA
 import numpy as np  # NOQA
 
+from debsources import statistics  # NOQA
+from debsources.consts import TREND_PERIODS  # NOQA
+
+# pyplot has global state: draw one chart at a time in each process
+_draw_lock = threading.Lock()
+
 
 def _split_series(series):
     """split a time `series` (list of <x,y> points) into two lists --- one of x
@@ -208,3 +221,130 @@ def bottom_sum(items, n):
         for z, i in enumerate(item):
             b_sum[z] += i
     return b_sum
+
+
+# extension of the files storing, next to each chart, the digest of the inputs
+# it has been drawn from (see `render_charts`)
+DIGEST_EXT = ".sha256"
+
+# part of chart digests: bump it to redraw all charts, e.g., after changing
+# how they look
+CHARTS_VERSION = 1
+
+
+def digest_path(fname: Path) -> Path:
+    return Path(str(fname) + DIGEST_EXT)
+
+
+def chart_digest(plot, kwargs):
+    """digest of the inputs of the chart drawn by `plot(fname=fname, **kwargs)`
+
+    dictionaries are hashed in iteration order, which might affect how they
+    are drawn (e.g., pie chart colors)
+
+    """
+    inputs = [CHARTS_VERSION, plot.__name__, kwargs]
+    return hashlib.sha256(json.dumps(inputs, default=str).encode()).hexdigest()
+
+
+def _render_chart(job):
+    """draw a chart job (see `render_charts`) and store its digest
+
+    return whether the chart has been drawn
+
+    """
+    plot, fname, kwargs, digest = job
+    plot(fname=fname, **kwargs)
+    if not fname.exists():  # nothing to draw, e.g., bar chart of a single suite
+        return False
+    digest_file = digest_path(fname)
+    digest_tmp = Path(str(digest_file) + ".new")
+    digest_tmp.write_text(digest + "\n")
+    os.rename(digest_tmp, digest_file)
+    return True
+
+
+def render_charts(jobs, workers=1):
+    """draw the charts described by `jobs`, an iterable of <plot, fname,
+    kwargs> triples, each one drawn by calling `plot(fname=fname, **kwargs)`
+
+    charts whose file exists and has been drawn from the same inputs, as per
+    the digest stored next to it, are reused as they are. Charts to be drawn
+    are drawn by a pool of `workers` processes, if `workers` is greater than 1
+
+    return a pair <rendered, reused> with the number of drawn and reused charts
+
+    """
+    todo, reused = [], 0
+    for plot, fname, kwargs in jobs:
+        digest = chart_digest(plot, kwargs)
+        try:
+            if digest_path(fname).read_text().strip() == digest and fname.exists():
+                reused += 1
+                continue
+        except FileNotFoundError:
+            pass
+        todo.append((plot, fname, kwargs, digest))
+
+    if workers > 1 and len(todo) > 1:
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool(workers) as pool:
+            drawn = pool.map(_render_chart, todo, chunksize=1)
+    else:
+        drawn = [_render_chart(job) for job in todo]
+    return sum(drawn), reused
+
+
+def trend_chart_name(suite, metric, period, fmt="png"):
+    """file name of the trend chart of `metric` over `period`, for `suite`"""
+    name = "%s-%s-%s.%s" % (suite, metric, period.replace(" ", "-"), fmt)
+    if metric == "license":
+        name = "copyright_" + name
+    return name
+
+
+def trend_chart(session, suite, metric, period):
+    """query the history of `metric` (one of consts.TREND_METRICS) over
+    `period` (one of consts.TREND_PERIODS) for `suite` ("ALL" for all suites)
+
+    return a pair <plot, kwargs>, the chart being drawn by calling
+    `plot(fname=fname, **kwargs)`
+
+    """
+    granularity = dict(TREND_PERIODS)[period]
+    if metric == "sloc":
+        mseries = getattr(statistics, "history_sloc_" + granularity)(
+            session, interval=period, suite=suite
+        )
+        return multiseries_plot, {"multiseries": mseries}
+    elif metric == "license":
+        mseries = getattr(statistics, "history_copyright_" + granularity)(
+            session, interval=period, suite=suite
+        )
+        return multiseries_plot, {"multiseries": mseries, "cols": 3}
+    else:
+        series = getattr(statistics, "history_size_" + granularity)(
+            session, metric, interval=period, suite=suite
+        )
+        return size_plot, {"series": series}
+
+
+def draw_chart(plot, fname: Path, kwargs):
+    """draw to `fname` the chart drawn by `plot(fname=fname, **kwargs)`, in the
+    format given by the extension of `fname` (e.g., .png or .svg)
+
+    `fname` is replaced atomically, and only one chart at a time is drawn by
+    concurrent threads
+
+    """
+    fd, tmp = tempfile.mkstemp(
+        dir=fname.parent, prefix="." + fname.name + ".", suffix=fname.suffix
+    )
+    os.close(fd)
+    try:
+        with _draw_lock:
+            plot(fname=tmp, **kwargs)
+        os.rename(tmp, fname)
+    except BaseException:
+        os.unlink(tmp)
+        raise
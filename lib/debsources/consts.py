@@ -118,7 +118,31 @@ CTAGS_LANGUAGES = (
 # TODO uniform CTAGS_* language naming (possibly without blessing any of the
 # two, but using a 3rd, Debsources specific, canonical form)
 
-METRIC_TYPES = ("size",)
+# package metrics, see the metrics hook: disk usage in KiB (as per du), number
+# of files, size in bytes of the largest file, and apparent size in bytes
+METRIC_TYPES = ("size", "files", "max_file_size", "apparent_size")
+
+# trend charts (see `charts.trend_chart`): <period, granularity> pairs, and
+# metrics, i.e., size metrics (from the history_size table), SLOCs per language
+# (history_sloccount), and files per license (history_copyright)
+TREND_PERIODS = (
+    ("1 month", "hourly"),
+    ("1 year", "daily"),
+    ("5 years", "weekly"),
+    ("20 years", "monthly"),
+)
+TREND_METRICS = (
+    "source_packages",
+    "disk_usage",
+    "source_files",
+    "ctags",
+    "sloc",
+    "license",
+)
+
+# per-package counters of DB rows, written together with the counted rows:
+# files (File table), checksums, ctags, and SLOCs (sum over all languages)
+COUNTER_TYPES = ("files", "checksums", "ctags", "sloc")
 
 
 # debian package areas
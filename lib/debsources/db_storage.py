@@ -11,10 +11,74 @@
 # https://salsa.debian.org/qa/debsources/blob/master/COPYING
 
 
+import itertools
 import logging
 
+from sqlalchemy import sql
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
 from debsources import fs_storage
-from debsources.models import VCS_TYPES, File, Package, PackageName, Suite, SuiteInfo
+from debsources.models import (
+    VCS_TYPES,
+    File,
+    Package,
+    PackageCounter,
+    PackageName,
+    Suite,
+    SuiteInfo,
+)
+
+# maximum number of files inserted at once, using a single multi-row INSERT
+FILES_INSERT_BATCH = 10000
+
+# default maximum number of rows after which a (bulk) insert is sent to the DB,
+# see `bulk_insert`; configurable via the "bulk_flush_threshold" setting
+BULK_FLUSH_THRESHOLD = 20000
+
+
+def bulk_insert(session, table, rows, threshold=BULK_FLUSH_THRESHOLD):
+    """Insert `rows` into `table`, bypassing the ORM.
+
+    `rows` is an iterable of dictionaries mapping column names to values; it is
+    consumed lazily and sent to the DB in batches of (at most) `threshold` rows,
+    each batch as a single (bulk) insert. Return the number of inserted rows.
+
+    """
+    insert_q = sql.insert(table)
+    rows = iter(rows)
+    count = 0
+    while True:
+        batch = list(itertools.islice(rows, threshold))
+        if not batch:
+            break
+        session.execute(insert_q, batch)
+        count += len(batch)
+    if count:
+        session.flush()
+    return count
+
+
+def set_counter(session, db_package, counter, value):
+    """Set the per-package `counter` (see `models.PackageCounter`) of
+    `db_package` to `value`, replacing its previous value, if any.
+
+    """
+    insert_q = pg_insert(PackageCounter.__table__).values(
+        package_id=db_package.id, counter=counter, value=value
+    )
+    session.execute(
+        insert_q.on_conflict_do_update(
+            index_elements=["package_id", "counter"],
+            set_={"value": insert_q.excluded.value},
+        )
+    )
+
+
+def rm_counter(session, db_package, counter):
+    """Remove the per-package `counter` of `db_package`, if any."""
+    session.query(PackageCounter).filter_by(
+        package_id=db_package.id, counter=counter
+    ).delete()
 
 
 def add_package(session, pkg, pkgdir, sticky=False):
@@ -55,13 +119,24 @@ def add_package(session, pkg, pkgdir, sticky=False):
         session.add(db_package)
         session.flush()  # to get a version.id, needed by File below
 
-        # add individual source files to the File table
+        # add individual source files to the File table, in bulk. File IDs
+        # are retrieved together with file paths, as the order of rows
+        # returned by a multi-row INSERT is not guaranteed
         file_table = {}
-        for relpath, _abspath in fs_storage.walk_pkg_files(pkgdir):
-            file = File(db_package, relpath)
-            session.add(file)
-            session.flush()
-            file_table[relpath] = file.id
+        files_t = File.__table__
+        files = [
+            {"package_id": db_package.id, "path": relpath}
+            for relpath, _abspath in fs_storage.walk_pkg_files(pkgdir)
+        ]
+        for i in range(0, len(files), FILES_INSERT_BATCH):
+            insert_q = (
+                sql.insert(files_t)
+                .values(files[i : i + FILES_INSERT_BATCH])
+                .returning(files_t.c.id, files_t.c.path)
+            )
+            for file_id, relpath in session.execute(insert_q):
+                file_table[relpath] = file_id
+        set_counter(session, db_package, "files", len(file_table))
 
         return file_table
 
@@ -86,6 +161,20 @@ def lookup_package(session, package, version):
     )
 
 
+def package_ids(session):
+    """Index all packages in the Debsources db
+
+    Return a dictionary mapping <package, version> pairs to package IDs. It is
+    meant to replace repeated calls to `lookup_package`, e.g. during update
+    runs
+
+    """
+    q = session.query(PackageName.name, Package.version, Package.id).join(
+        Package, Package.name_id == PackageName.id
+    )
+    return {(name, version): package_id for name, version, package_id in q}
+
+
 def lookup_db_suite(session, suite, sticky=False):
     return session.query(SuiteInfo).filter_by(name=suite, sticky=sticky).first()
 
@@ -94,6 +183,20 @@ def lookup_suitemapping(session, db_package, suite):
     return session.query(Suite).filter_by(package_id=db_package.id, suite=suite).first()
 
 
+def suite_mappings(session, suites):
+    """Return the package suite mappings currently in the Debsources db
+
+    Return value is a dictionary mapping each suite in `suites` to the set of
+    IDs of the packages it contains
+
+    """
+    mappings = {suite: set() for suite in suites}
+    q = session.query(Suite.suite, Suite.package_id).filter(Suite.suite.in_(suites))
+    for suite, package_id in q:
+        mappings[suite].add(package_id)
+    return mappings
+
+
 def pkg_prefixes(session):
     """extract Debian package prefixes from DB via `session`
 
@@ -125,3 +228,9 @@ def rm_file(session, package, relpath, file_table=None):
             .first()
         )
     session.delete(file)
+    session.execute(
+        sql.update(PackageCounter.__table__)
+        .where(PackageCounter.package_id == file.package_id)
+        .where(PackageCounter.counter == "files")
+        .values(value=PackageCounter.value - 1)
+    )
@@ -11,19 +11,51 @@
 # https://salsa.debian.org/qa/debsources/blob/master/COPYING
 
 
+import gzip
+import json
 import logging
 import lzma
+import multiprocessing
 import os
+import re
+from array import array
+from collections.abc import Mapping, Sequence, Set
 from pathlib import Path
-from typing import Optional
+from typing import FrozenSet, Optional, Tuple
 
-import magic
 from debian import deb822
 
+from debsources import hashutil
+from debsources.consts import VCS_TYPES
+
 # supported compression formats for Sources files. Order does matter: formats
 # appearing early in the list will be preferred to those appearing later
 SOURCES_COMP_FMTS = ["gz", "xz"]
 
+# name of the (optional) on-disk cache of Sources indexes, see SourceMirror
+SOURCES_CACHE_FILE = "sources-indexes.json"
+SOURCES_CACHE_VERSION = 1
+
+# Sources fields stored in the Sources indexes cache, i.e., those that are
+# actually used by Debsources
+SOURCES_CACHE_FIELDS = [
+    "package",
+    "version",
+    "section",
+    "directory",
+    "checksums-sha256",
+    "files",
+    "vcs-browser",
+] + ["vcs-" + vcs_type for vcs_type in VCS_TYPES]
+
+
+# upstream tarballs (including additional component ones) and Debian tarballs
+# of source packages, see `SourcePackage.orig_tarballs`
+ORIG_TARBALL_RE = re.compile(
+    r"\.orig(-[A-Za-z0-9][A-Za-z0-9-]*)?\.tar\.(gz|bz2|lzma|xz)$"
+)
+DEBIAN_TARBALL_RE = re.compile(r"\.debian\.tar\.(gz|bz2|lzma|xz)$")
+
 
 class DebmirrorError(RuntimeError):
     """runtime error when using a local Debian mirror"""
@@ -31,6 +63,42 @@ class DebmirrorError(RuntimeError):
     pass
 
 
+# magic numbers of the compressed formats Sources indexes might come in
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+
+def index_compression(src_index: Path) -> Optional[str]:
+    """detect the compression format of a Sources index from its magic number
+
+    Return one of "gz" or "xz", or `None` if the index is not compressed
+
+    """
+    with open(src_index, "rb") as f:
+        magic = f.read(len(XZ_MAGIC))
+    if magic.startswith(XZ_MAGIC):
+        return "xz"
+    elif magic.startswith(GZIP_MAGIC):
+        return "gz"
+    return None
+
+
+def open_index(src_index: Path, compression: Optional[str] = None):
+    """open a Sources index for reading, as a text file
+
+    compressed indexes (see `index_compression`) are decompressed
+    incrementally while being read, so that they never need to be held in
+    memory as a whole
+
+    """
+    if compression == "xz":
+        return lzma.open(src_index, "rt", encoding="utf-8")
+    elif compression == "gz":
+        return gzip.open(src_index, "rt", encoding="utf-8")
+    else:
+        return open(src_index, encoding="utf-8")
+
+
 class SourcePackage(deb822.Sources):
     """Debian source package, as it appears in a source mirror"""
 
@@ -144,22 +212,51 @@ class SourcePackage(deb822.Sources):
         """
         return self.pkg_prefix(self["package"])
 
-    def dsc_path(self) -> Path:
-        """return (absolute) path to .dsc file for this package"""
-        files_field = None
+    def _files_field(self) -> str:
+        """return the name of the field listing package components"""
         for field in ["checksums-sha256", "files"]:
             if field in self:
-                files_field = field
-                break
-        if not files_field:
-            raise ValueError("cannot list components of source package: %s" % self)
+                return field
+        raise ValueError("cannot list components of source package: %s" % self)
 
+    def dsc_path(self) -> Path:
+        """return (absolute) path to .dsc file for this package"""
+        files_field = self._files_field()
         dsc = next(filter(lambda f: f["name"].endswith(".dsc"), self[files_field]))[
             "name"
         ]
 
         return Path(self["x-debsources-mirror-root"]) / self["directory"] / dsc
 
+    def debian_tarball_path(self) -> Optional[Path]:
+        """return (absolute) path to the Debian tarball of this package, if
+        any (i.e., for "3.0 (quilt)" packages)"""
+        for f in self[self._files_field()]:
+            if DEBIAN_TARBALL_RE.search(f["name"]):
+                return (
+                    Path(self["x-debsources-mirror-root"])
+                    / self["directory"]
+                    / f["name"]
+                )
+        return None
+
+    def orig_tarballs(self) -> FrozenSet[Tuple[str, str]]:
+        """return the upstream tarballs of this package, as a set of <name,
+        checksum> pairs
+
+        checksums are sha256 sums, or md5 sums for packages lacking the
+        Checksums-Sha256 field. Packages sharing the same set of (non empty)
+        upstream tarballs only differ in their Debian changes
+
+        """
+        files_field = self._files_field()
+        checksum = "sha256" if files_field == "checksums-sha256" else "md5sum"
+        return frozenset(
+            (f["name"], f[checksum])
+            for f in self[files_field]
+            if ORIG_TARBALL_RE.search(f["name"])
+        )
+
     def extraction_dir(self, basedir: Path) -> Optional[Path]:
         """return package extraction dir, relative to debsources sources_dir
 
@@ -174,15 +271,176 @@ class SourcePackage(deb822.Sources):
         return basedir / area / self.prefix() / self["package"] / self["version"]
 
 
+def _cache_fields(pkg: "SourcePackage"):
+    """reduce a Sources paragraph to SOURCES_CACHE_FIELDS, as a dictionary"""
+    return {
+        field: pkg.get_as_string(field)
+        for field in SOURCES_CACHE_FIELDS
+        if field in pkg and not (field == "files" and "checksums-sha256" in pkg)
+    }
+
+
+def _parse_index(src_index: Path):
+    """parse a Sources index, returning its paragraphs reduced to
+    SOURCES_CACHE_FIELDS
+
+    Meant to be run in worker processes, as SourcePackage instances cannot be
+    pickled
+
+    """
+    compression = index_compression(src_index)
+    with open_index(src_index, compression) as f:
+        pkgs = SourcePackage.iter_paragraphs(f, use_apt_pkg=compression is None)
+        return [_cache_fields(pkg) for pkg in pkgs]
+
+
+class PackageTable(Set):
+    """compact table of the <package, version> pairs listed by mirror suites
+
+    Package names and versions are interned in a pool of strings, each pair is
+    stored only once as two arrays of string IDs, and suites are stored as
+    arrays of the (integer) IDs of the pairs they list.
+
+    The table itself behaves as a set of <package, version> pairs, its
+    `suites` attribute as a mapping from suite names to sequences of such
+    pairs, in the order they have been added
+
+    """
+
+    def __init__(self):
+        self._strings = []  # string ID -> string
+        self._string_ids = {}  # string -> string ID
+        self._names = array("I")  # pair ID -> string ID of package name
+        self._versions = array("I")  # pair ID -> string ID of package version
+        self._pair_ids = {}  # <name ID, version ID> (as a single int) -> pair ID
+        self._suites = {}  # suite name -> array of pair IDs
+        self.suites = _SuitesView(self)
+
+    def _intern(self, string):
+        string_id = self._string_ids.get(string)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._strings.append(string)
+            self._string_ids[string] = string_id
+        return string_id
+
+    def _pair_key(self, name_id, version_id):
+        return (name_id << 32) | version_id
+
+    def _pair(self, pair_id):
+        return (
+            self._strings[self._names[pair_id]],
+            self._strings[self._versions[pair_id]],
+        )
+
+    def add(self, suite, package, version):
+        """add a <package, version> pair to the listing of suite
+
+        Return True if the pair was not known before (in any suite), False
+        otherwise
+
+        """
+        name_id, version_id = self._intern(package), self._intern(version)
+        key = self._pair_key(name_id, version_id)
+        pair_id = self._pair_ids.get(key)
+        new = pair_id is None
+        if new:
+            pair_id = len(self._names)
+            self._names.append(name_id)
+            self._versions.append(version_id)
+            self._pair_ids[key] = pair_id
+
+        if suite not in self._suites:
+            self._suites[suite] = array("I")
+        self._suites[suite].append(pair_id)
+        return new
+
+    def __contains__(self, pkg_id):
+        try:
+            (package, version) = pkg_id
+        except (TypeError, ValueError):
+            return False
+        name_id = self._string_ids.get(package)
+        version_id = self._string_ids.get(version)
+        if name_id is None or version_id is None:
+            return False
+        return self._pair_key(name_id, version_id) in self._pair_ids
+
+    def __iter__(self):
+        return (self._pair(pair_id) for pair_id in range(len(self._names)))
+
+    def __len__(self):
+        return len(self._names)
+
+
+class _SuitePairs(Sequence):
+    """read-only sequence of the <package, version> pairs listed by a suite,
+    see PackageTable
+
+    pairs are built on access from the array of their IDs, rather than stored
+
+    """
+
+    def __init__(self, table, pair_ids):
+        self._table = table
+        self._pair_ids = pair_ids
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return _SuitePairs(self._table, self._pair_ids[index])
+        return self._table._pair(self._pair_ids[index])
+
+    def __iter__(self):
+        return map(self._table._pair, self._pair_ids)
+
+    def __len__(self):
+        return len(self._pair_ids)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+
+class _SuitesView(Mapping):
+    """read-only mapping from suite names to the <package, version> pairs
+    they list, see PackageTable
+
+    """
+
+    def __init__(self, table):
+        self._table = table
+
+    def __getitem__(self, suite):
+        return _SuitePairs(self._table, self._table._suites[suite])
+
+    def __iter__(self):
+        return iter(self._table._suites)
+
+    def __len__(self):
+        return len(self._table._suites)
+
+
 class SourceMirror(object):
     """Handle for a local Debian source mirror"""
 
-    def __init__(self, path: Path):
-        """create a handle to a local source mirror rooted at path"""
+    def __init__(self, path: Path, cache_dir: Optional[Path] = None, workers=1):
+        """create a handle to a local source mirror rooted at path
+
+        if `cache_dir` is given, the content of Sources indexes will be cached
+        there, so that unchanged indexes need not be parsed again by ls()
+
+        if `workers` is greater than 1, ls() will parse Sources indexes in a
+        pool of that many worker processes
+
+        """
         self.mirror_root = path
-        self._suites = None  # dict: suite name -> [<package, version>]
-        self._packages = None  # set(<package, version>)
+        self._workers = workers
+        self._table = None  # PackageTable of all suites
         self._dists_dir = path / "dists"
+        self._cache_file = None
+        if cache_dir is not None:
+            self._cache_file = cache_dir / SOURCES_CACHE_FILE
 
     @property
     def suites(self):
@@ -191,11 +449,11 @@ class SourceMirror(object):
         Note: for efficient use, this property is best accessed after having
         used the ls() method
         """
-        if self._suites is None:
+        if self._table is None:
             for pkg in self.ls():
                 pass  # hack: rely on ls' side-effects to populate suites
-        assert self._suites is not None
-        return self._suites
+        assert self._table is not None
+        return self._table.suites
 
     @property
     def packages(self):
@@ -204,11 +462,11 @@ class SourceMirror(object):
         Note: for efficient use, this property is best accessed after having
         used the ls() method
         """
-        if self._packages is None:
+        if self._table is None:
             for pkg in self.ls():
-                pass  # hack: rely on ls' side-effects to populate _packages
-        assert self._packages is not None
-        return self._packages
+                pass  # hack: rely on ls' side-effects to populate packages
+        assert self._table is not None
+        return self._table
 
     def __find_Sources(self):
         """Find Sources entries contained in the mirror, in various supported
@@ -241,6 +499,41 @@ class SourceMirror(object):
                 suite = f.parts[-4]  # wheezy, jessie, sid, ...
                 yield suite, f
 
+    @staticmethod
+    def _fingerprint(src_index: Path):
+        """fingerprint a Sources index, to detect changes across runs"""
+        stat = src_index.stat()
+        return [stat.st_size, stat.st_mtime_ns, hashutil.sha256sum(src_index)]
+
+    def _load_cache(self):
+        """load the Sources indexes cache, if any
+
+        Return a dictionary mapping Sources indexes (as paths relative to the
+        mirror root) to dictionaries with keys: "fingerprint" (see
+        `_fingerprint`) and "packages" (a list of Sources paragraphs, each
+        reduced to SOURCES_CACHE_FIELDS)
+
+        """
+        if self._cache_file is None or not self._cache_file.exists():
+            return {}
+        try:
+            with self._cache_file.open() as f:
+                cache = json.load(f)
+            if cache.get("version") != SOURCES_CACHE_VERSION:
+                return {}
+            return cache["indexes"]
+        except (ValueError, KeyError):
+            logging.warning("ignoring corrupted cache %s" % self._cache_file)
+            return {}
+
+    def _save_cache(self, indexes):
+        """atomically save the Sources indexes cache, see `_load_cache`"""
+        self._cache_file.parent.mkdir(parents=True, exist_ok=True)
+        cache_file_new = Path(str(self._cache_file) + ".new")
+        with cache_file_new.open("w") as f:
+            json.dump({"version": SOURCES_CACHE_VERSION, "indexes": indexes}, f)
+        cache_file_new.rename(self._cache_file)
+
     def pkg_prefixes(self):
         """Return the list of relevant package prefixes
 
@@ -268,41 +561,83 @@ class SourceMirror(object):
 
         """
 
-        def _iter_paragraphs(content):
-            for pkg in SourcePackage.iter_paragraphs(content):
-                pkg_id = (pkg["package"], pkg["version"])
-
-                if cursuite not in self._suites:
-                    self._suites[cursuite] = []
-                self._suites[cursuite].append(pkg_id)
+        def _iter_packages(cursuite, pkgs, cache_entries=None):
+            for pkg in pkgs:
+                if cache_entries is not None:
+                    cache_entries.append(_cache_fields(pkg))
 
-                if pkg_id not in self._packages:
-                    self._packages.add(pkg_id)
+                if self._table.add(cursuite, pkg["package"], pkg["version"]):
                     pkg["x-debsources-mirror-root"] = str(self.mirror_root)
                     yield pkg
 
-        self._suites = {}
-        self._packages = set()
+        self._table = PackageTable()
+        cache = self._load_cache()
+        seen_indexes = set()
 
+        # list of <suite, Sources index, cached paragraphs, cache entries>
+        # quadruples; cached paragraphs are None for indexes to be parsed
+        indexes = []
         for cursuite, src_index in self.__find_Sources():
-            logging.info("Dealing sources file {}".format(src_index))
             if suite is not None and cursuite != suite:
                 continue
 
-            # we check the type of the Sources file
-            mime = magic.open(magic.MIME_TYPE + magic.SYMLINK)
-            mime.load()
-            type_ = mime.file(src_index)
-            mime.close()
-
-            if type_ == "application/x-xz":
-                # we need to decompress ourselves xz files
-                with open(src_index, "rb") as f:
-                    content = lzma.decompress(f.read()).decode("utf-8")
-                    yield from _iter_paragraphs(content)
-            else:
-                with open(src_index) as f:
-                    yield from _iter_paragraphs(f)
+            cached_pkgs, cache_entries = None, None
+            if self._cache_file is not None:
+                index_key = str(src_index.relative_to(self.mirror_root))
+                seen_indexes.add(index_key)
+                fingerprint = self._fingerprint(src_index)
+                cached = cache.get(index_key)
+                if cached is not None and cached["fingerprint"] == fingerprint:
+                    cached_pkgs = cached["packages"]
+                else:
+                    cache_entries = []
+                    cache[index_key] = {
+                        "fingerprint": fingerprint,
+                        "packages": cache_entries,
+                    }
+            indexes.append((cursuite, src_index, cached_pkgs, cache_entries))
+
+        to_parse = [src_index for _, src_index, cached, _ in indexes if cached is None]
+        pool = None
+        if self._workers > 1 and len(to_parse) > 1:
+            # parse indexes concurrently, but consume results in mirror order,
+            # so that suites and first-seen packages are the same as when
+            # parsing sequentially
+            pool = multiprocessing.get_context("fork").Pool(self._workers)
+            parsed = pool.imap(_parse_index, to_parse)
+
+        try:
+            for cursuite, src_index, cached_pkgs, cache_entries in indexes:
+                logging.info("Dealing sources file {}".format(src_index))
+                if cached_pkgs is not None:
+                    logging.debug("Sources file %s is unchanged" % src_index)
+                    pkgs = (SourcePackage(fields) for fields in cached_pkgs)
+                    yield from _iter_packages(cursuite, pkgs)
+                elif pool is not None:
+                    fields_list = next(parsed)
+                    if cache_entries is not None:
+                        cache_entries.extend(fields_list)
+                    pkgs = (SourcePackage(fields) for fields in fields_list)
+                    yield from _iter_packages(cursuite, pkgs)
+                else:
+                    compression = index_compression(src_index)
+                    with open_index(src_index, compression) as f:
+                        # compressed indexes are parsed as a stream of
+                        # (decompressed) lines, not via their file descriptor,
+                        # that apt_pkg would otherwise read as is
+                        pkgs = SourcePackage.iter_paragraphs(
+                            f, use_apt_pkg=compression is None
+                        )
+                        yield from _iter_packages(cursuite, pkgs, cache_entries)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        if self._cache_file is not None:
+            if suite is None:  # forget about indexes gone from the mirror
+                cache = {k: v for k, v in cache.items() if k in seen_indexes}
+            self._save_cache(cache)
 
     def ls_suites(self, aliases=False):
         """list suites available in the archive
@@ -0,0 +1,199 @@
+# Copyright (C) 2026  The Debsources developers
+# <qa-debsources@lists.alioth.debian.org>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/AUTHORS
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/COPYING
+
+"""content-addressed deduplication of extracted source files
+
+Files of extracted packages can be hardlinked to the objects of a
+content-addressed store, located in DEDUP_DIR under sources_dir, so that files
+shared by several package versions are stored only once. Store objects are
+named after the sha256 of their content, e.g.,
+sources/.dedup/3f/3f5a...; an object whose link count drops to 1 is no longer
+used by any package and can be removed (see `release` and `store_stats`).
+
+Hardlinks share inode metadata: only files with the same permissions are linked
+together, and linked files get the modification time of the store object.
+
+"""
+
+import errno
+import os
+import re
+import stat
+from pathlib import Path
+
+from debsources import hashutil
+
+# name of the store directory, in sources_dir. It is a hidden directory, so
+# that FS storage walks (see `fs_storage.walk`) skip it
+DEDUP_DIR = ".dedup"
+
+# files smaller than this are not deduplicated (empty files use no disk blocks)
+DEDUP_MIN_SIZE = 1
+
+OBJECT_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def store_dir(sources_dir: Path) -> Path:
+    return sources_dir / DEDUP_DIR
+
+
+def object_path(store: Path, sha256: str) -> Path:
+    return store / sha256[:2] / sha256
+
+
+def disk_usage(st):
+    """disk space used by a file, in bytes, given its stat result"""
+    return st.st_blocks * 512
+
+
+def _replace_with_link(src: Path, dst: Path):
+    """atomically replace `dst` with a hardlink to `src`"""
+    tmp = dst.with_name("." + dst.name + ".dedup-new")
+    os.link(src, tmp)
+    try:
+        os.replace(tmp, dst)
+    except OSError:
+        tmp.unlink()
+        raise
+
+
+def _package_checksums(pkgdir: Path):
+    """yield (sha256, relpath) pairs for the regular files in `pkgdir`,
+    reading them from the checksums file of the package, if it exists"""
+    # not at module level: the checksums hook depends on fs_storage, via
+    # db_storage, which depends on this module
+    from debsources.plugins.hook_checksums import parse_checksums, sums_path
+
+    sumsfile = sums_path(pkgdir)
+    if sumsfile.exists():
+        yield from parse_checksums(sumsfile)
+        return
+    for root, _dirs, files in os.walk(pkgdir):
+        for f in files:
+            abspath = Path(root) / f
+            if not abspath.is_symlink() and abspath.is_file():
+                yield hashutil.sha256sum(abspath), abspath.relative_to(pkgdir)
+
+
+def dedup_package(pkgdir: Path, store: Path, checksums=None):
+    """deduplicate the files of package directory `pkgdir` against `store`
+
+    `checksums`, if given, is an iterable of (sha256, relpath) pairs for the
+    files to deduplicate; by default the checksums file of the package is used
+    (see the checksums hook), or checksums are computed on the fly. Files whose
+    content is already in the store are replaced by hardlinks to the store
+    object, the others are added to the store
+
+    Return a pair <files, bytes>: number of files replaced by links, and disk
+    space saved by doing so
+
+    """
+    if checksums is None:
+        checksums = _package_checksums(pkgdir)
+    linked, saved = 0, 0
+    for sha256, relpath in checksums:
+        path = pkgdir / relpath
+        st = path.lstat()
+        if not stat.S_ISREG(st.st_mode) or st.st_size < DEDUP_MIN_SIZE:
+            continue
+        obj = object_path(store, sha256)
+        try:
+            obj_st = obj.lstat()
+        except FileNotFoundError:
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(path, obj)
+                continue  # new content, the store now refers to it
+            except FileExistsError:  # added meanwhile by a concurrent extraction
+                obj_st = obj.lstat()
+        if os.path.samestat(st, obj_st):
+            continue  # already linked, e.g., hardlinks within the package
+        if obj_st.st_size != st.st_size or stat.S_IMODE(obj_st.st_mode) != stat.S_IMODE(
+            st.st_mode
+        ):
+            continue
+        try:
+            _replace_with_link(obj, path)
+        except OSError as e:
+            if e.errno == errno.EMLINK:  # too many links to the store object
+                continue
+            if e.errno == errno.ENOENT:  # object released meanwhile, by a reaper
+                continue
+            raise
+        linked += 1
+        saved += disk_usage(st)
+    return linked, saved
+
+
+def release(pkgdir: Path, store: Path):
+    """remove from `store` the objects only used by package directory `pkgdir`
+
+    to be called before removing `pkgdir`. Return the number of removed objects
+
+    """
+    removed = 0
+    for root, _dirs, files in os.walk(pkgdir):
+        for f in files:
+            path = Path(root) / f
+            st = path.lstat()
+            # only referenced by this package and by the store
+            if not stat.S_ISREG(st.st_mode) or st.st_nlink != 2:
+                continue
+            obj = object_path(store, hashutil.sha256sum(path))
+            try:
+                if os.path.samestat(st, obj.lstat()):
+                    obj.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def walk_store(store: Path):
+    """iterate over the entries of `store`, yielding (path, is_object) pairs,
+    where `is_object` tells whether the entry is a well-formed store object"""
+    for prefix in sorted(store.iterdir()):
+        if not prefix.is_dir() or prefix.is_symlink():
+            yield prefix, False
+            continue
+        for entry in sorted(prefix.iterdir()):
+            is_object = (
+                OBJECT_RE.match(entry.name) is not None
+                and entry.name[:2] == prefix.name
+                and not entry.is_symlink()
+                and entry.is_file()
+            )
+            yield entry, is_object
+
+
+def store_stats(store: Path):
+    """compute statistics about `store`
+
+    return a dictionary with keys "objects" (number of store objects),
+    "orphans" (objects no longer used by any package), "stored" (disk space
+    used by objects, in bytes) and "saved" (disk space saved by deduplication,
+    in bytes)
+
+    """
+    stats = {"objects": 0, "orphans": 0, "stored": 0, "saved": 0}
+    for path, is_object in walk_store(store):
+        if not is_object:
+            continue
+        st = path.lstat()
+        stats["objects"] += 1
+        stats["stored"] += disk_usage(st)
+        if st.st_nlink == 1:
+            stats["orphans"] += 1
+        else:
+            # one of the package copies would have been needed anyway
+            stats["saved"] += (st.st_nlink - 2) * disk_usage(st)
+    return stats
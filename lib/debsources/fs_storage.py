@@ -11,24 +11,175 @@
 # https://salsa.debian.org/qa/debsources/blob/master/COPYING
 
 
+import errno
 import glob
 import logging
 import os
 import shutil
+import stat
 import subprocess
+import tempfile
 from pathlib import Path
 
+from debsources import dedup
 from debsources.consts import DPKG_EXTRACT_UMASK
 from debsources.subprocess_workaround import subprocess_setup
 
 
-def extract_package(pkg, destdir: Path):
-    """extract a package to the FS storage"""
+# name of the trash directory, in sources_dir, where removed package
+# directories are moved to before being deleted. It is a hidden directory, so
+# that FS storage walks (see `walk`) skip it
+TRASH_DIR = ".trash"
 
-    def preexec_fn():
-        subprocess_setup()
-        os.umask(DPKG_EXTRACT_UMASK)
+# Perl snippet applying the patches of an unpacked "3.0 (quilt)" source
+# package, exactly as dpkg-source -x does. Arguments: .dsc file, source tree
+DPKG_APPLY_PATCHES = (
+    "use Dpkg::Source::Package;"
+    " my ($dsc, $dir) = @ARGV;"
+    " Dpkg::Source::Package->new(filename => $dsc)"
+    "->apply_patches($dir, usage => 'unpack');"
+)
 
+
+def _preexec_extract():
+    subprocess_setup()
+    os.umask(DPKG_EXTRACT_UMASK)
+
+
+def _fixperms_modes(umask):
+    """symbolic chmod(1) modes that dpkg-source uses to fix permissions of
+    files extracted from tarballs, according to `umask`"""
+    mode = 0o777 & ~umask
+    return ",".join(
+        who
+        + "".join(
+            ("+" if mode & (0o400 >> (i * 3 + j)) else "-") + perm
+            for j, perm in enumerate("rwX")
+        )
+        for i, who in enumerate("ugo")
+    )
+
+
+def _reusable_tree(basedir: Path) -> bool:
+    """check whether the "3.0 (quilt)" package extracted at `basedir` can be
+    used as the base of an incremental extraction"""
+    formatfile = basedir / "debian" / "source" / "format"
+    return (
+        Path(str(basedir) + ".done").exists()
+        and formatfile.is_file()
+        and formatfile.read_text().strip() == "3.0 (quilt)"
+    )
+
+
+def _clone_tree(basedir: Path, destdir: Path):
+    """clone the upstream part of the package tree at `basedir` to `destdir`,
+    hardlinking files, i.e., everything but the debian/ and .pc/ directories"""
+    for root, dirs, files in os.walk(basedir):
+        root = Path(root)
+        target = destdir / root.relative_to(basedir)
+        target.mkdir()
+        os.chmod(target, stat.S_IMODE(root.lstat().st_mode))
+        if root == basedir:
+            dirs[:] = [d for d in dirs if d not in ["debian", ".pc"]]
+            files = [f for f in files if f not in ["debian", ".pc"]]
+        for name in dirs + files:
+            path = root / name
+            if path.is_symlink():
+                os.symlink(os.readlink(path), target / name)
+            elif name in files:
+                if not path.is_file():
+                    raise ValueError("unexpected special file %s" % path)
+                os.link(path, target / name)
+
+
+def _unapply_patches(basedir: Path, destdir: Path):
+    """revert in `destdir` the changes made by the quilt patches applied to
+    `basedir`, using the backup files in its .pc/ directory"""
+    pcdir = basedir / ".pc"
+    applied_file = pcdir / "applied-patches"
+    if not applied_file.exists():
+        return
+    applied = applied_file.read_text().split()
+    for patch in reversed(applied):
+        patchdir = pcdir / patch
+        if not patchdir.is_dir():
+            raise ValueError("missing backup files of patch %s" % patch)
+        for root, _dirs, files in os.walk(patchdir):
+            for name in files:
+                backup = Path(root) / name
+                relpath = backup.relative_to(patchdir)
+                if relpath.parts[0] == "debian":
+                    continue  # the debian/ directory is replaced anyhow
+                target = destdir / relpath
+                if target.is_symlink() or target.exists():
+                    target.unlink()
+                if backup.is_symlink() or not backup.is_file():
+                    raise ValueError("unexpected backup file %s" % backup)
+                if backup.stat().st_size > 0:
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    os.link(backup, target)
+                else:
+                    # empty backups stand for files created by the patch;
+                    # drop the directories they might have required as well
+                    parent = target.parent
+                    while (
+                        parent != destdir
+                        and parent.is_dir()
+                        and not any(parent.iterdir())
+                    ):
+                        parent.rmdir()
+                        parent = parent.parent
+
+
+def _extract_incremental(pkg, basedir: Path, destdir: Path, log):
+    """extract package `pkg` to `destdir` reusing the tree of another version
+    of it, sharing the same upstream tarballs, extracted at `basedir`
+
+    the upstream part of the base tree is cloned and its patches reverted, then
+    the Debian tarball of `pkg` is unpacked and its patches applied, as
+    dpkg-source would do. Only "3.0 (quilt)" packages are supported
+
+    """
+    debian_tarball = pkg.debian_tarball_path()
+    if debian_tarball is None:
+        raise ValueError("no Debian tarball in %s" % pkg)
+    _clone_tree(basedir, destdir)
+    _unapply_patches(basedir, destdir)
+
+    tmpdir = Path(tempfile.mkdtemp(prefix="." + destdir.name, dir=destdir.parent))
+    try:
+        # same tar and chmod flags used by dpkg-source -x
+        tar = ["tar", "-xf", str(debian_tarball), "--no-same-permissions"]
+        tar += ["--no-same-owner", "-C", str(tmpdir)]
+        subprocess.check_call(
+            tar, stdout=log, stderr=subprocess.STDOUT, preexec_fn=_preexec_extract
+        )
+        chmod = ["chmod", "-R", "--", _fixperms_modes(DPKG_EXTRACT_UMASK), str(tmpdir)]
+        subprocess.check_call(chmod, stdout=log, stderr=subprocess.STDOUT)
+        if [entry.name for entry in tmpdir.iterdir()] != ["debian"]:
+            raise ValueError("unexpected content in %s" % debian_tarball)
+        (tmpdir / "debian").rename(destdir / "debian")
+    finally:
+        shutil.rmtree(tmpdir)
+    formatfile = destdir / "debian" / "source" / "format"
+    if not formatfile.is_file() or formatfile.read_text().strip() != "3.0 (quilt)":
+        raise ValueError("%s is not a 3.0 (quilt) package" % pkg)
+
+    cmd = ["perl", "-e", DPKG_APPLY_PATCHES, str(pkg.dsc_path()), str(destdir)]
+    subprocess.check_call(
+        cmd, stdout=log, stderr=subprocess.STDOUT, preexec_fn=_preexec_extract
+    )
+
+
+def extract_package(pkg, destdir: Path, bases=[]):
+    """extract a package to the FS storage
+
+    `bases`, if given, are directories where other versions of the same
+    package, sharing its upstream tarballs, have been extracted. If one of them
+    can be reused, the package is extracted incrementally from it (see
+    `_extract_incremental`), falling back to a full extraction on failure
+
+    """
     logging.debug("extract %s..." % pkg)
     parentdir = destdir.parent
     if not parentdir.is_dir():
@@ -40,16 +191,73 @@ def extract_package(pkg, destdir: Path):
     logfile = Path(str(destdir) + ".log")
     donefile = Path(str(destdir) + ".done")
     with logfile.open("w") as log:
-        subprocess.check_call(
-            cmd, stdout=log, stderr=subprocess.STDOUT, preexec_fn=preexec_fn
-        )
+        extracted = False
+        basedir = next(filter(_reusable_tree, bases), None)
+        if basedir is not None:
+            try:
+                log.write("incremental extraction from %s\n" % basedir)
+                log.flush()
+                _extract_incremental(pkg, basedir, destdir, log)
+                extracted = True
+            except Exception as e:
+                logging.warning(
+                    "incremental extraction of %s failed, extract it fully: %s"
+                    % (pkg, e)
+                )
+                log.write("incremental extraction failed: %s\n" % e)
+                log.flush()
+                if destdir.exists():
+                    shutil.rmtree(destdir)
+        if not extracted:
+            subprocess.check_call(
+                cmd, stdout=log, stderr=subprocess.STDOUT, preexec_fn=_preexec_extract
+            )
     donefile.touch()
 
 
-def remove_package(pkg, destdir: Path):
-    """dispose of a package from the Debsources file system storage"""
+def trash_dir(sources_dir: Path) -> Path:
+    return sources_dir / TRASH_DIR
+
+
+def _move_to_trash(destdir: Path, trash: Path) -> bool:
+    """atomically move package directory `destdir` to `trash`
+
+    the package directory is moved to a new trash entry, i.e., a directory of
+    `trash`, keeping its path relative to sources_dir (e.g.,
+    .trash/tmpXXXXXXXX/main/f/foo/1.0-1). Return False if `destdir` cannot be
+    renamed into `trash`, e.g., because they are on different file systems
+
+    """
+    trash.mkdir(exist_ok=True)
+    entry = Path(tempfile.mkdtemp(dir=trash))
+    target = entry / destdir.relative_to(trash.parent)
+    target.parent.mkdir(parents=True)
+    try:
+        os.rename(destdir, target)
+    except OSError as e:
+        shutil.rmtree(entry)
+        if e.errno == errno.EXDEV:
+            return False
+        raise
+    return True
+
+
+def remove_package(pkg, destdir: Path, store: Path = None, trash: Path = None):
+    """dispose of a package from the Debsources file system storage
+
+    if given, `store` is the deduplication store (see `dedup`): store objects
+    only used by the package will be removed as well
+
+    if given, `trash` is the trash directory (see `trash_dir`) where the
+    package directory is atomically moved to, instead of being deleted right
+    away; it will be deleted later on by `reap_trash`, together with store
+    objects only used by it
+    """
     if destdir.exists():
-        shutil.rmtree(str(destdir))
+        if trash is None or not _move_to_trash(destdir, trash):
+            if store is not None and store.is_dir():
+                dedup.release(destdir, store)
+            shutil.rmtree(str(destdir))
     for meta in ["log", "done"]:
         fname = Path(str(destdir) + "." + meta)
         if fname.exists():
@@ -60,6 +268,41 @@ def remove_package(pkg, destdir: Path):
         pass  # parent dir is likely non empty, due to other package versions
 
 
+def trash_entries(trash: Path):
+    """iterate over the entries of `trash`, yielding pairs <entry, pkgdirs>,
+    where `pkgdirs` are the paths, relative to sources_dir, of the package
+    directories moved to the entry"""
+    for entry in sorted(trash.iterdir()):
+        pkgdirs = []
+        if entry.is_dir() and not entry.is_symlink():
+            pkgdirs = [
+                Path(p).relative_to(entry) for p in glob.glob(f"{entry}/*/*/*/*")
+            ]
+        yield entry, pkgdirs
+
+
+def reap_trash(trash: Path, store: Path = None):
+    """delete the package directories moved to `trash` by `remove_package`
+
+    if given, `store` is the deduplication store: store objects only used by
+    the deleted packages are removed as well. Return the number of deleted
+    trash entries
+
+    """
+    if not trash.is_dir():
+        return 0
+    reaped = 0
+    for entry, _pkgdirs in trash_entries(trash):
+        if entry.is_dir() and not entry.is_symlink():
+            if store is not None and store.is_dir():
+                dedup.release(entry, store)
+            shutil.rmtree(entry)
+        else:
+            entry.unlink()
+        reaped += 1
+    return reaped
+
+
 def walk(sources_dir: Path, test=None):
     """iterate over FS storage files
 
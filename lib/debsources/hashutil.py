@@ -12,18 +12,43 @@
 
 
 import hashlib
+import mmap
+import os
 
-# should be a multiple of 64 (sha1/sha256's block size)
-# FWIW coreutils' sha1sum uses 32768
-HASH_BLOCK_SIZE = 32768
+# supported digest algorithms, see `checksums`
+DIGESTS = ["sha256", "sha1", "md5"]
 
+# files at least this large are hashed via mmap, in chunks of HASH_CHUNK_SIZE
+# bytes (hashlib releases the GIL while hashing them); smaller ones are hashed
+# with a single read
+HASH_MMAP_THRESHOLD = 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
 
-def sha256sum(path):
-    m = hashlib.sha256()
+
+def checksums(path, digests=DIGESTS):
+    """compute several checksums of the file at `path`, reading it only once
+
+    `digests` is a list of algorithm names, among DIGESTS. Return a dictionary
+    mapping them to hexadecimal digests
+
+    """
+    hashes = {digest: hashlib.new(digest) for digest in digests}
     with open(path, "rb") as f:
-        while True:
-            chunk = f.read(HASH_BLOCK_SIZE)
-            if not chunk:
-                break
-            m.update(chunk)
-    return m.hexdigest()
+        size = os.fstat(f.fileno()).st_size
+        if size >= HASH_MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    for offset in range(0, size, HASH_CHUNK_SIZE):
+                        chunk = view[offset : offset + HASH_CHUNK_SIZE]
+                        for m in hashes.values():
+                            m.update(chunk)
+                        chunk.release()
+        else:
+            chunk = f.read()
+            for m in hashes.values():
+                m.update(chunk)
+    return {digest: m.hexdigest() for digest, m in hashes.items()}
+
+
+def sha256sum(path):
+    return checksums(path, ["sha256"])["sha256"]
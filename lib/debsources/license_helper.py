@@ -12,6 +12,7 @@
 import io
 import logging
 import re
+from collections import defaultdict
 
 from debian import copyright
 from flask import url_for
@@ -99,11 +100,65 @@ def parse_license(sources_path):
         return copyright.Copyright(f)
 
 
+# characters starting a wildcard (or an escape sequence) in Files globs
+GLOB_SPECIALS = re.compile(r"[*?\\]")
+
+
+class FilesMatcher(object):
+    """Precompiled matcher of paths against the Files paragraphs of a parsed
+    debian/copyright file `c`.
+
+    `find_files_paragraph` is equivalent to the method of the same name of
+    `copyright.Copyright`: it returns the *last* Files paragraph matching a
+    path, or None. Instead of matching the path against the globs of each
+    paragraph in turn, literal globs (i.e., plain file names) are looked up in
+    a dictionary, and wildcard globs are indexed by their literal prefix
+    (e.g., "src/" for "src/*.c"), so that a path is only matched against the
+    globs whose prefix it starts with.
+
+    """
+
+    def __init__(self, c):
+        self.paragraphs = list(c.all_files_paragraphs())
+        self.literals = {}  # literal glob -> index of the last paragraph
+        # literal prefix -> [<index of the paragraph, compiled glob>]
+        self.wildcards = defaultdict(list)
+        for i, par in enumerate(self.paragraphs):
+            par.files_pattern()  # raises ValueError on invalid globs, as Copyright
+            for glob in par.files:
+                m = GLOB_SPECIALS.search(glob)
+                if m is None:
+                    self.literals[glob] = i
+                else:
+                    regex = copyright.globs_to_re([glob])
+                    self.wildcards[glob[: m.start()]].append((i, regex))
+        for globs in self.wildcards.values():
+            globs.reverse()  # last paragraphs first
+        self.prefix_lengths = sorted(set(len(prefix) for prefix in self.wildcards))
+
+    def find_files_paragraph(self, filename):
+        index = self.literals.get(filename, -1)
+        for length in self.prefix_lengths:
+            if length > len(filename):
+                break
+            for i, regex in self.wildcards.get(filename[:length], []):
+                if i <= index:
+                    break
+                if regex.fullmatch(filename):
+                    index = i
+                    break
+        if index < 0:
+            return None
+        return self.paragraphs[index]
+
+
 def license_url(package, version):
     return url_for(".license", packagename=package, version=version)
 
 
 def get_license(package, version, path, c):
+    # `c` is either a parsed debian/copyright file or, to find the license of
+    # many files of the same package, a `FilesMatcher` built from it
     # pathlib.Path uses a str to internally represent a path. In case of
     # invalid bytes for utf8 encoding, surrogate escape sequences are
     # used. debian.copyright seems to only work with utf8 when reading the
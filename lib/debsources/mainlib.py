@@ -33,6 +33,15 @@ DEFAULT_CONFIG.update(
             "stages": "extract suites gc stats cache charts",
             "log_level": "info",
             "expire_days": "0",
+            "extract_workers": "1",
+            "sources_workers": "1",
+            "hook_workers": "1",
+            "charts_workers": "1",
+            "bulk_flush_threshold": "20000",
+            "checksum_digests": "sha256 sha1 md5",
+            "metrics": "size",
+            "dedup": "false",
+            "extract_incremental": "false",
             "force_triggers": "",  # space-separated list
             "single_transaction": "true",
         },
@@ -98,14 +107,21 @@ def parse_conf_infra(items):
     """returns correct typing for the [infra] section"""
     typed = {}
     for key, value in items:
-        if key == "expire_days":
+        if key in [
+            "expire_days",
+            "extract_workers",
+            "sources_workers",
+            "hook_workers",
+            "charts_workers",
+            "bulk_flush_threshold",
+        ]:
             value = int(value)
-        elif key == "dry_run":
+        elif key in ["dry_run", "dedup", "extract_incremental"]:
             assert value in ["true", "false"]
             value = value == "true"
         elif key == "force_triggers":
             value = value.split()
-        elif key == "hooks":
+        elif key in ["hooks", "checksum_digests", "metrics"]:
             value = value.split()
         elif key == "log_level":
             value = LOG_LEVELS[value]
@@ -289,12 +305,14 @@ def load_hooks(conf):
     dictionary mapping per-package file extensions (to be found in the
     filesystem storage) to the owner plugin
     """
-    observers = updater.NO_OBSERVERS
+    observers = {event: [] for event in updater.KNOWN_EVENTS}
     file_exts = {}
 
-    def subscribe_callback(event, action, title=""):
+    def subscribe_callback(event, action, title="", fs_phase=None):
         if event not in updater.KNOWN_EVENTS:
             raise ValueError('unknown event type "%s"' % event)
+        if fs_phase is not None:
+            action = updater.PhasedHook(action, fs_phase)
         observers[event].append((title, action))
 
     def declare_ext_callback(ext, title=""):
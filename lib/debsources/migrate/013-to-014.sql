@@ -0,0 +1,6 @@
+-- store more checksums of source files than just sha256, see the
+-- checksum_digests configuration setting
+
+ALTER TABLE checksums
+	ADD COLUMN sha1 varchar(40),
+	ADD COLUMN md5 varchar(32);
@@ -0,0 +1,6 @@
+-- more package metrics than just disk usage, see the metrics configuration
+-- setting
+
+ALTER TYPE metric_types ADD VALUE 'files';
+ALTER TYPE metric_types ADD VALUE 'max_file_size';
+ALTER TYPE metric_types ADD VALUE 'apparent_size';
@@ -0,0 +1,45 @@
+-- per suite and archive area aggregates of package statistics, maintained
+-- incrementally by the updater; see debsources.aggregates
+
+CREATE TABLE suite_aggregates (
+	suite varchar NOT NULL,
+	area varchar NOT NULL,
+	stat varchar NOT NULL,
+	value bigint NOT NULL,
+	PRIMARY KEY (suite, area, stat)
+);
+
+-- initial content, computed from scratch as in debsources.aggregates.compute
+
+INSERT INTO suite_aggregates (suite, area, stat, value)
+WITH c AS (
+    SELECT p.id AS package_id, p.area AS area, 'source_packages' AS stat,
+      1 AS value
+    FROM packages p
+  UNION ALL
+    SELECT p.id, p.area, 'source_files', count(*)
+    FROM checksums x JOIN packages p ON p.id = x.package_id
+    GROUP BY p.id
+  UNION ALL
+    SELECT p.id, p.area, 'disk_usage', sum(x.value_)
+    FROM metrics x JOIN packages p ON p.id = x.package_id
+    WHERE x.metric = 'size'
+    GROUP BY p.id
+  UNION ALL
+    SELECT p.id, p.area, 'ctags', count(*)
+    FROM ctags x JOIN packages p ON p.id = x.package_id
+    GROUP BY p.id
+  UNION ALL
+    SELECT p.id, p.area, 'sloccount.' || x.language::text, sum(x.count)
+    FROM sloccounts x JOIN packages p ON p.id = x.package_id
+    GROUP BY p.id, x.language
+)
+  SELECT 'ALL', c.area, c.stat, sum(c.value)
+  FROM c
+  GROUP BY c.area, c.stat
+  HAVING sum(c.value) != 0
+UNION ALL
+  SELECT s.suite, c.area, c.stat, sum(c.value)
+  FROM c JOIN suites s ON s.package_id = c.package_id
+  GROUP BY s.suite, c.area, c.stat
+  HAVING sum(c.value) != 0;
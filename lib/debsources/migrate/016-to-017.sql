@@ -0,0 +1,30 @@
+-- per-package counters of the rows stored in other tables, written together
+-- with the counted rows; see debsources.models.PackageCounter
+
+CREATE TYPE counter_types AS ENUM ('files', 'checksums', 'ctags', 'sloc');
+
+CREATE TABLE package_counters (
+	package_id bigint NOT NULL REFERENCES packages(id) ON DELETE CASCADE,
+	counter counter_types NOT NULL,
+	value bigint NOT NULL,
+	PRIMARY KEY (package_id, counter)
+);
+
+-- initial content, counted from the tables
+
+INSERT INTO package_counters (package_id, counter, value)
+  SELECT package_id, 'files'::counter_types, count(*)
+  FROM files
+  GROUP BY package_id
+UNION ALL
+  SELECT package_id, 'checksums', count(*)
+  FROM checksums
+  GROUP BY package_id
+UNION ALL
+  SELECT package_id, 'ctags', count(*)
+  FROM ctags
+  GROUP BY package_id
+UNION ALL
+  SELECT package_id, 'sloc', sum(count)
+  FROM sloccounts
+  GROUP BY package_id;
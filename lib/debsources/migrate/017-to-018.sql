@@ -0,0 +1,32 @@
+-- downsampled index of the history_* tables, read by trend charts; see
+-- debsources.rollups and debsources.models.HistoryRollup
+
+CREATE TABLE history_rollups (
+	history character varying NOT NULL,
+	granularity character varying NOT NULL,
+	suite character varying NOT NULL,
+	bucket timestamp without time zone NOT NULL,
+	"timestamp" timestamp without time zone NOT NULL,
+	PRIMARY KEY (history, granularity, suite, bucket)
+);
+
+-- initial content, computed from the history tables (see rollups.RETENTION)
+
+WITH granularities (granularity, field, retention) AS (VALUES
+  ('hourly', 'hour', interval '1 month'),
+  ('daily', 'day', interval '1 year'),
+  ('weekly', 'week', interval '5 years'),
+  ('monthly', 'month', interval '20 years')
+), samples (history, suite, "timestamp") AS (
+    SELECT DISTINCT 'size', suite, "timestamp" FROM history_size
+  UNION
+    SELECT DISTINCT 'sloccount', suite, "timestamp" FROM history_sloccount
+  UNION
+    SELECT DISTINCT 'copyright', suite, "timestamp" FROM history_copyright
+)
+INSERT INTO history_rollups (history, granularity, suite, bucket, "timestamp")
+  SELECT s.history, g.granularity, s.suite, date_trunc(g.field, s."timestamp"),
+    max(s."timestamp")
+  FROM samples s, granularities g
+  GROUP BY s.history, g.granularity, s.suite, date_trunc(g.field, s."timestamp")
+  HAVING max(s."timestamp") >= now() - max(g.retention);
@@ -34,6 +34,7 @@ from sqlalchemy.orm import relationship
 
 from debsources.consts import (
     COPYRIGHT_ORACLES,
+    COUNTER_TYPES,
     CTAGS_LANGUAGES,
     METRIC_TYPES,
     SLOCCOUNT_LANGUAGES,
@@ -227,11 +228,15 @@ class Checksum(Base):
         BIGINT, ForeignKey("files.id", ondelete="CASCADE"), index=True, nullable=False
     )
     sha256 = Column(String(64), nullable=False, index=True)
+    sha1 = Column(String(40))
+    md5 = Column(String(32))
 
-    def __init__(self, version, file_id, sha256):
+    def __init__(self, version, file_id, sha256, sha1=None, md5=None):
         self.package_id = version.id
         self.file_id = file_id
         self.sha256 = sha256
+        self.sha1 = sha1
+        self.md5 = md5
 
 
 class BinaryName(Base):
@@ -364,6 +369,41 @@ class Metric(Base):
         self.value = value
 
 
+class PackageCounter(Base):
+    """per-package counters of the rows stored in other tables, e.g., ctags
+
+    written by the code adding rows for a package, in the same transaction;
+    see `db_storage.set_counter`
+    """
+
+    __tablename__ = "package_counters"
+    __table_args__ = (PrimaryKeyConstraint("package_id", "counter"),)
+
+    package_id = Column(
+        BIGINT,
+        ForeignKey("packages.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    counter = Column(Enum(*COUNTER_TYPES, name="counter_types"), nullable=False)
+    value = Column(BIGINT, nullable=False)
+
+
+class SuiteAggregate(Base):
+    """per suite and archive area aggregates of package statistics
+
+    maintained incrementally, as packages and suite mappings come and go; see
+    the `aggregates` module
+    """
+
+    __tablename__ = "suite_aggregates"
+    __table_args__ = (PrimaryKeyConstraint("suite", "area", "stat"),)
+
+    suite = Column(String, nullable=False)  # suite == "ALL" means all packages
+    area = Column(String, nullable=False)
+    stat = Column(String, nullable=False)  # e.g. "ctags", "sloccount.ansic"
+    value = Column(BIGINT, nullable=False)
+
+
 class HistorySize(Base):
     """historical record of debsources size"""
 
@@ -386,6 +426,25 @@ class HistorySize(Base):
         self.timestamp = timestamp
 
 
+class HistoryRollup(Base):
+    """downsampled index of the history_* tables: timestamp of the latest
+    sample of each time bucket, per history table, granularity and suite
+
+    see the `rollups` module
+    """
+
+    __tablename__ = "history_rollups"
+    __table_args__ = (
+        PrimaryKeyConstraint("history", "granularity", "suite", "bucket"),
+    )
+
+    history = Column(String, nullable=False)  # e.g. "size" for history_size
+    granularity = Column(String, nullable=False)  # e.g. "daily"
+    suite = Column(String, nullable=False)
+    bucket = Column(DateTime(timezone=False), nullable=False)
+    timestamp = Column(DateTime(timezone=False), nullable=False)
+
+
 class HistorySlocCount(Base):
     """historical record of debsources languages"""
 
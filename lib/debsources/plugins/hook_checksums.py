@@ -13,25 +13,66 @@
 
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from sqlalchemy import sql
+from sqlalchemy import or_
 
-from debsources import db_storage, hashutil
+from debsources import db_storage, fs_storage, hashutil
 from debsources.models import Checksum, File
 
 conf = None
 
 MY_NAME = "checksums"
 MY_EXT = "." + MY_NAME
+DIGESTS_EXT = ".digests"  # checksums other than sha256
 
 
 def sums_path(pkgdir: Path) -> Path:
     return Path(str(pkgdir) + MY_EXT)
 
 
-# maximum number of ctags after which a (bulk) insert is sent to the DB
-BULK_FLUSH_THRESHOLD = 100000
+def digests_path(pkgdir: Path) -> Path:
+    return Path(str(pkgdir) + DIGESTS_EXT)
+
+
+def extra_digests():
+    """configured digests other than sha256, which is always computed"""
+    return [digest for digest in conf["checksum_digests"] if digest != "sha256"]
+
+
+# number of threads used to hash the files of a package
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def compute_checksums(pkgdir: Path, relpaths, digests=["sha256"], workers=HASH_WORKERS):
+    """compute the checksums of the files at `relpaths` in `pkgdir`
+
+    all `digests` (see `hashutil.checksums`) of a file are computed reading it
+    only once; files are hashed concurrently by a pool of `workers` threads.
+    Yield (relpath, {digest: checksum}) pairs, in `relpaths` order. Symlinks
+    and special files are skipped: they shouldn't be there per policy, but
+    they might be (and they are in old releases), and non dangling / external
+    symlinks will have their target checksummed anyhow
+
+    """
+
+    def checksums(relpath):
+        return hashutil.checksums(bytes(pkgdir / relpath), digests)
+
+    relpaths = [
+        relpath
+        for relpath in relpaths
+        if not (pkgdir / relpath).is_symlink() and (pkgdir / relpath).is_file()
+    ]
+    if workers <= 1 or len(relpaths) <= 1:
+        for relpath in relpaths:
+            yield relpath, checksums(relpath)
+        return
+
+    with ThreadPoolExecutor(workers) as executor:
+        # map returns results in submission order: output is deterministic
+        yield from zip(relpaths, executor.map(checksums, relpaths))
 
 
 def parse_checksums(path):
@@ -49,81 +90,162 @@ def parse_checksums(path):
             yield (sha256, filepath)
 
 
-def add_package(session, pkg, pkgdir, file_table):
-    logging.debug("add-package %s" % pkg)
+def parse_digests(path):
+    """parse checksums other than sha256 from a digests file
 
+    the first line of the file is "# DIGEST..." and lists digest names, each
+    following line is "CHECKSUM...  PATH\n", with one checksum per digest
+
+    return a dictionary mapping pathlib.Path-s to {digest: checksum}
+    dictionaries
+    """
+    digests = {}
+    with open(path, "rb") as f:
+        names = f.readline().decode().split()[1:]
+        for line in f:
+            sums, path = line.rstrip(b"\n").split(b"  ", 1)
+            filepath = Path(path.decode("utf8", "surrogateescape"))
+            digests[filepath] = dict(zip(names, sums.decode().split()))
+    return digests
+
+
+def add_package_fs(pkg, pkgdir, file_table):
+    """FS phase of add_package, independent of other hooks"""
     sumsfile = sums_path(pkgdir)
     sumsfile_tmp = Path(str(sumsfile) + ".new")
-
-    def emit_checksum(out, relpath, abspath):
-        if abspath.is_symlink() or not abspath.is_file():
-            # Do not checksum symlinks, if they are not dangling / external we
-            # will checksum their target anyhow. Do not check special files
-            # either; they shouldn't be there per policy, but they might be
-            # (and they are in old releases)
-            return
-        sha256 = hashutil.sha256sum(bytes(abspath))
-        out.write(sha256.encode("ascii") + b"  " + bytes(relpath) + b"\n")
+    digestsfile = digests_path(pkgdir)
+    digestsfile_tmp = Path(str(digestsfile) + ".new")
 
     if "hooks.fs" in conf["backends"]:
-        if not sumsfile.exists():  # compute checksums only if needed
+        # compute checksums only if needed
+        write_sums = not sumsfile.exists()
+        extra = extra_digests() if not digestsfile.exists() else []
+        digests = (["sha256"] if write_sums else []) + extra
+        if not digests:
+            return
+        if file_table is None:  # e.g., when forcing triggers
+            relpaths = [relpath for relpath, _ in fs_storage.walk_pkg_files(pkgdir)]
+        else:
+            relpaths = list(file_table)
+        checksums = list(compute_checksums(pkgdir, relpaths, digests))
+        if write_sums:
             with open(sumsfile_tmp, "wb") as out:
-                for relpath in file_table:
-                    abspath = pkgdir / relpath
-                    emit_checksum(out, relpath, abspath)
+                for relpath, sums in checksums:
+                    out.write(
+                        sums["sha256"].encode("ascii") + b"  " + bytes(relpath) + b"\n"
+                    )
             os.rename(sumsfile_tmp, sumsfile)
+        if extra:
+            with open(digestsfile_tmp, "wb") as out:
+                out.write(("# " + " ".join(extra) + "\n").encode("ascii"))
+                for relpath, sums in checksums:
+                    line = " ".join(sums[digest] for digest in extra)
+                    out.write(line.encode("ascii") + b"  " + bytes(relpath) + b"\n")
+            os.rename(digestsfile_tmp, digestsfile)
+
+
+def backfill_digests(session, db_package, digestsfile):
+    """fill in the extra digests missing from the checksums of `db_package`
+    stored in the DB, e.g., before extra digests were introduced, reading them
+    from `digestsfile`. Return the number of updated checksums"""
+    extra = extra_digests()
+    missing = (
+        session.query(Checksum.id, File.path)
+        .join(File, File.id == Checksum.file_id)
+        .filter(Checksum.package_id == db_package.id)
+        .filter(or_(*[getattr(Checksum, digest).is_(None) for digest in extra]))
+        .all()
+    )
+    if not missing:
+        return 0
+    digests = parse_digests(digestsfile)
+    mappings = []
+    for checksum_id, relpath in missing:
+        sums = digests.get(relpath, {})
+        params = {digest: sums[digest] for digest in extra if digest in sums}
+        if params:
+            params["id"] = checksum_id
+            mappings.append(params)
+    session.bulk_update_mappings(Checksum, mappings)
+    return len(mappings)
+
+
+def add_package(session, pkg, pkgdir, file_table):
+    logging.debug("add-package %s" % pkg)
+
+    sumsfile = sums_path(pkgdir)
+    digestsfile = digests_path(pkgdir)
+    add_package_fs(pkg, pkgdir, file_table)
 
     if "hooks.db" in conf["backends"]:
         db_package = db_storage.lookup_package(session, pkg["package"], pkg["version"])
-        insert_q = sql.insert(Checksum.__table__)
-        insert_params = []
         if not session.query(Checksum).filter_by(package_id=db_package.id).first():
             # ASSUMPTION: if *a* checksum of this package has already
             # been added to the db in the past, then *all* of them have,
             # as additions are part of the same transaction
-            for sha256, relpath in parse_checksums(sumsfile):
-                params = {"package_id": db_package.id, "sha256": sha256}
-                if file_table:
-                    try:
-                        file_id = file_table[relpath]
-                        params["file_id"] = file_id
-                    except KeyError:
-                        continue
-                else:
-                    file_ = (
-                        session.query(File)
-                        .filter_by(package_id=db_package.id, path=relpath)
-                        .first()
-                    )
-                    if not file_:
-                        continue
-                    params["file_id"] = file_.id
-                insert_params.append(params)
-                if len(insert_params) >= BULK_FLUSH_THRESHOLD:
-                    session.execute(insert_q, insert_params)
-                    session.flush()
-                    insert_params = []
-            if insert_params:  # source packages shouldn't be empty but...
-                session.execute(insert_q, insert_params)
-                session.flush()
+            digests = {}
+            if extra_digests() and digestsfile.exists():
+                digests = parse_digests(digestsfile)
+
+            def rows():
+                for sha256, relpath in parse_checksums(sumsfile):
+                    params = {"package_id": db_package.id, "sha256": sha256}
+                    sums = digests.get(relpath, {})
+                    for digest in hashutil.DIGESTS:
+                        if digest != "sha256":
+                            params[digest] = sums.get(digest)
+                    if file_table:
+                        try:
+                            params["file_id"] = file_table[relpath]
+                        except KeyError:
+                            continue
+                    else:
+                        file_ = (
+                            session.query(File)
+                            .filter_by(package_id=db_package.id, path=relpath)
+                            .first()
+                        )
+                        if not file_:
+                            continue
+                        params["file_id"] = file_.id
+                    yield params
+
+            count = db_storage.bulk_insert(
+                session, Checksum.__table__, rows(), conf["bulk_flush_threshold"]
+            )
+            db_storage.set_counter(session, db_package, "checksums", count)
+        elif extra_digests() and digestsfile.exists():
+            # checksums added before the digests file has been written
+            backfill_digests(session, db_package, digestsfile)
 
 
 def rm_package(session, pkg, pkgdir, file_table):
     logging.debug("rm-package %s" % pkg)
 
     if "hooks.fs" in conf["backends"]:
-        sumsfile = sums_path(pkgdir)
-        if sumsfile.exists():
-            sumsfile.unlink()
+        for metafile in [sums_path(pkgdir), digests_path(pkgdir)]:
+            if metafile.exists():
+                metafile.unlink()
 
     if "hooks.db" in conf["backends"]:
         db_package = db_storage.lookup_package(session, pkg["package"], pkg["version"])
         session.query(Checksum).filter_by(package_id=db_package.id).delete()
+        db_storage.rm_counter(session, db_package, "checksums")
 
 
 def init_plugin(debsources):
     global conf
     conf = debsources["config"]
-    debsources["subscribe"]("add-package", add_package, title=MY_NAME)
+    digests = conf["checksum_digests"]
+    if "sha256" not in digests or not set(digests) <= set(hashutil.DIGESTS):
+        raise ValueError(
+            "checksum_digests must include sha256 and be among: %s"
+            % " ".join(hashutil.DIGESTS)
+        )
+    debsources["subscribe"](
+        "add-package", add_package, title=MY_NAME, fs_phase=add_package_fs
+    )
     debsources["subscribe"]("rm-package", rm_package, title=MY_NAME)
     debsources["declare_ext"](MY_EXT, MY_NAME)
+    if extra_digests():
+        debsources["declare_ext"](DIGESTS_EXT, MY_NAME)
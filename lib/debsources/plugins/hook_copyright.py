@@ -43,17 +43,15 @@ def parse_license_file(path):
     return license_list
 
 
-def add_package(session, pkg, pkgdir, file_table):
-    logging.debug("add-package %s" % pkg)
+def add_package_fs(pkg, pkgdir, file_table, c=None):
+    """FS phase of add_package, independent of other hooks
+
+    if given, `c` is the already parsed debian/copyright file of the package
 
+    """
     license_file = license_path(pkgdir)
     license_file_tmp = Path(str(license_file) + ".new")
 
-    try:
-        c = helper.parse_license(pkgdir / "debian/copyright")
-    except copyright.NotMachineReadableError:
-        return
-
     def emit_license(out, package, version, relpath, copyright):
         """Retrieve license of the file. We use `relpath` as we want the path
         inside the package directory which is used in the d/copyright files
@@ -66,11 +64,30 @@ def add_package(session, pkg, pkgdir, file_table):
 
     if "hooks.fs" in conf["backends"]:
         if not license_file.exists():  # run license only if needed
+            if c is None:
+                try:
+                    c = helper.parse_license(pkgdir / "debian/copyright")
+                except copyright.NotMachineReadableError:
+                    return
+            matcher = helper.FilesMatcher(c)
             with io.open(license_file_tmp, "wb") as out:
                 for relpath in file_table:
-                    emit_license(out, pkg["package"], pkg["version"], relpath, c)
+                    emit_license(out, pkg["package"], pkg["version"], relpath, matcher)
             os.rename(license_file_tmp, license_file)
 
+
+def add_package(session, pkg, pkgdir, file_table):
+    logging.debug("add-package %s" % pkg)
+
+    license_file = license_path(pkgdir)
+
+    try:
+        c = helper.parse_license(pkgdir / "debian/copyright")
+    except copyright.NotMachineReadableError:
+        return
+
+    add_package_fs(pkg, pkgdir, file_table, c)
+
     if "hooks.db" in conf["backends"]:
         db_package = db_storage.lookup_package(session, pkg["package"], pkg["version"])
         if (
@@ -83,23 +100,28 @@ def add_package(session, pkg, pkgdir, file_table):
             # added to the db in the past, then *all* of them have, as
             # additions are part of the same transaction
             licenses = parse_license_file(license_file)
-            for synopsis, path in licenses:
-                if file_table:
-                    try:
-                        file_id = file_table[path]
-                    except KeyError:
-                        continue
-                else:
-                    file_ = (
-                        session.query(File)
-                        .filter_by(package_id=db_package.id, path=path)
-                        .first()
-                    )
-                    if not file_:
-                        continue
-                    file_id = file_.id
-                license = FileCopyright(file_id, "debian", synopsis)
-                session.add(license)
+
+            def rows():
+                for synopsis, path in licenses:
+                    if file_table:
+                        try:
+                            file_id = file_table[path]
+                        except KeyError:
+                            continue
+                    else:
+                        file_ = (
+                            session.query(File)
+                            .filter_by(package_id=db_package.id, path=path)
+                            .first()
+                        )
+                        if not file_:
+                            continue
+                        file_id = file_.id
+                    yield {"file_id": file_id, "oracle": "debian", "license": synopsis}
+
+            db_storage.bulk_insert(
+                session, FileCopyright.__table__, rows(), conf["bulk_flush_threshold"]
+            )
 
 
 def rm_package(session, pkg, pkgdir, file_table):
@@ -125,6 +147,8 @@ def rm_package(session, pkg, pkgdir, file_table):
 def init_plugin(debsources):
     global conf
     conf = debsources["config"]
-    debsources["subscribe"]("add-package", add_package, title=MY_NAME)
+    debsources["subscribe"](
+        "add-package", add_package, title=MY_NAME, fs_phase=add_package_fs
+    )
     debsources["subscribe"]("rm-package", rm_package, title=MY_NAME)
     debsources["declare_ext"](MY_EXT, MY_NAME)
@@ -11,13 +11,12 @@
 # https://salsa.debian.org/qa/debsources/blob/master/COPYING
 
 
+import itertools
 import logging
 import os
 import subprocess
 from pathlib import Path
 
-from sqlalchemy import sql
-
 from debsources import db_storage
 from debsources.consts import MAX_KEY_LENGTH
 from debsources.models import Ctag, File
@@ -41,57 +40,53 @@ def ctags_path(pkgdir: Path) -> Path:
     return Path(str(pkgdir) + MY_EXT)
 
 
-# maximum number of ctags after which a (bulk) insert is sent to the DB
-BULK_FLUSH_THRESHOLD = 20000
-
 # maximum number of detailed warnings for malformed tags that will be emitted.
 # used to avoid flooding logs
 BAD_TAGS_THRESHOLD = 5
 
 
-def parse_ctags(path):
-    """parse exuberant ctags tags file
-
-    for each tag yield a tag dictionary::
+def _parse_tag(line):
+    """parse a single line of a ctags file, returning a tuple <tag, path, line,
+    kind, language>, where `path` is the (undecoded) path within the package
 
-      { 'tag':  'TAG_NAME',
-        'path': Path('path/within/package'),
-        'line': LINE_NUMBER, # int
-        'kind': 'TAG_KIND', # 1 letter
-        'language': 'TAG_LANGUAGE',
-      }
     """
+    kind, lineno, language = None, None, None
+    # initialize with extension fields which are not guaranteed to exist
 
-    def parse_tag(line):
-        tag = {"kind": None, "line": None, "language": None}
-        # initialize with extension fields which are not guaranteed to exist
-
-        fields = line.rstrip().split(b"\t")
-
-        try:
-            tag["tag"] = fields[0].decode()
-        except UnicodeDecodeError:
-            raise ValueError("Tag can not be decoded to utf-8.")
-        tag["path"] = Path(fields[1].decode("utf8", "surrogatescape"))
-        # note: ignore fields[2], ex_cmd
-
-        for ext in fields[3:]:  # parse extension fields
-            # caution: "typeref:struct:__RAW_R_INFO"
-            k, v = ext.decode().split(":", 1)
-            if k == "kind":
-                tag["kind"] = v
-            elif k == "line":
-                tag["line"] = int(v)
-            elif k == "language":
-                tag["language"] = v.lower()
-            else:
-                pass  # ignore other fields
+    fields = line.rstrip().split(b"\t")
+
+    try:
+        tag = fields[0].decode()
+    except UnicodeDecodeError:
+        raise ValueError("Tag can not be decoded to utf-8.")
+    # note: ignore fields[2], ex_cmd
+
+    for ext in fields[3:]:  # parse extension fields
+        # caution: "typeref:struct:__RAW_R_INFO"
+        k, v = ext.decode().split(":", 1)
+        if k == "kind":
+            kind = v
+        elif k == "line":
+            lineno = int(v)
+        elif k == "language":
+            language = v.lower()
+        else:
+            pass  # ignore other fields
 
-        if tag["line"] is None or len(tag["tag"]) > MAX_KEY_LENGTH:
-            raise ValueError("Tag is incomplete or malformed.")
+    if lineno is None or len(tag) > MAX_KEY_LENGTH:
+        raise ValueError("Tag is incomplete or malformed.")
 
-        return tag
+    return tag, fields[1], lineno, kind, language
 
+
+def iter_ctags(path):
+    """parse exuberant ctags tags file
+
+    for each tag yield a tuple <tag, path, line, kind, language>, where `path`
+    is the path within the package as bytes, as it appears in the tags file;
+    see `parse_ctags` for the other fields
+
+    """
     with open(path, "rb") as ctags:
         bad_tags = 0
         for line in ctags:
@@ -100,7 +95,7 @@ def parse_ctags(path):
             if line.startswith(b"!_TAG"):  # skip ctags metadata
                 continue
             try:
-                yield parse_tag(line)
+                yield _parse_tag(line)
             except ValueError:
                 bad_tags += 1
                 if bad_tags <= BAD_TAGS_THRESHOLD:
@@ -112,69 +107,159 @@ def parse_ctags(path):
             )
 
 
-def add_package(session, pkg, pkgdir, file_table):
-    logging.debug("add-package %s" % pkg)
+def parse_ctags(path):
+    """parse exuberant ctags tags file
+
+    for each tag yield a tag dictionary::
 
+      { 'tag':  'TAG_NAME',
+        'path': Path('path/within/package'),
+        'line': LINE_NUMBER, # int
+        'kind': 'TAG_KIND', # 1 letter
+        'language': 'TAG_LANGUAGE',
+      }
+    """
+    for tag, path, line, kind, language in iter_ctags(path):
+        yield {
+            "tag": tag,
+            "path": Path(path.decode("utf8", "surrogatescape")),
+            "line": line,
+            "kind": kind,
+            "language": language,
+        }
+
+
+# escaping of column values in the text format of PostgreSQL COPY
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+COPY_NULL = "\\N"
+
+COPY_CTAGS_Q = (
+    "COPY %s (package_id, tag, file_id, line, kind, language) FROM STDIN"
+    % Ctag.__tablename__
+)
+
+
+def _copy_value(value):
+    if value is None:
+        return COPY_NULL
+    return value.translate(COPY_ESCAPES)
+
+
+class CopyBuffer(object):
+    """file-like object streaming the rows yielded by `rows`, each a line in
+    the text format of PostgreSQL COPY, to be passed to psycopg2's
+    `cursor.copy_expert`. Lines are pulled from `rows` in batches of
+    `threshold`, only when needed to answer `read` calls
+
+    """
+
+    def __init__(self, rows, threshold=db_storage.BULK_FLUSH_THRESHOLD):
+        self._rows = iter(rows)
+        self._threshold = threshold
+        self._buf = ""
+
+    def read(self, size=-1):
+        chunks, length = [self._buf], len(self._buf)
+        while size < 0 or length < size:
+            chunk = "".join(itertools.islice(self._rows, self._threshold))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            length += len(chunk)
+        data = "".join(chunks)
+        if size < 0:
+            self._buf = ""
+            return data
+        self._buf = data[size:]
+        return data[:size]
+
+
+def copy_ctags(session, db_package, ctagsfile, file_id):
+    """load the tags of `ctagsfile` into the DB, for package `db_package`, by
+    streaming them through a single PostgreSQL COPY
+
+    `file_id` is a function mapping paths within the package (as
+    pathlib.Path) to file IDs, or to None for paths unknown to the DB, whose
+    tags are skipped. Return the number of loaded tags
+
+    """
+    package_id = str(db_package.id)
+    # poor man's cache for last <raw path, file_id>;
+    # rely on the fact that tags are grouped by path in ctags files
+    cur_path, cur_file_id = None, None
+    count = 0
+
+    def rows():
+        nonlocal cur_path, cur_file_id, count
+        for tag, path, line, kind, language in iter_ctags(ctagsfile):
+            if path != cur_path:
+                cur_path = path
+                cur_file_id = file_id(Path(path.decode("utf8", "surrogatescape")))
+                if cur_file_id is not None:
+                    cur_file_id = str(cur_file_id)
+            if cur_file_id is None:
+                continue
+            count += 1
+            yield "%s\t%s\t%s\t%d\t%s\t%s\n" % (
+                package_id,
+                _copy_value(tag),
+                cur_file_id,
+                line,
+                _copy_value(kind),
+                _copy_value(language),
+            )
+
+    session.flush()  # COPY bypasses the ORM, referred rows must be in the DB
+    cursor = session.connection().connection.cursor()
+    try:
+        buf = CopyBuffer(rows(), conf["bulk_flush_threshold"])
+        cursor.copy_expert(COPY_CTAGS_Q, buf)
+    finally:
+        cursor.close()
+    return count
+
+
+def add_package_fs(pkg, pkgdir, file_table):
+    """FS phase of add_package, independent of other hooks"""
     ctagsfile = ctags_path(pkgdir)
     ctagsfile_tmp = Path(str(ctagsfile) + ".new")
 
     if "hooks.fs" in conf["backends"]:
         if not ctagsfile.exists():  # extract tags only if needed
             cmd = ["ctags"] + CTAGS_FLAGS + ["-o", ctagsfile_tmp]
-            # ASSUMPTION: will be run under pkgdir as CWD, which is needed to
-            # get relative paths right. The assumption is enforced by the
-            # updater
+            # ctags must be run under pkgdir as CWD, which is needed to get
+            # relative paths right
             with open(os.devnull, "w") as null:
-                subprocess.check_call(cmd, stderr=null)
+                subprocess.check_call(cmd, stderr=null, cwd=pkgdir)
             os.rename(ctagsfile_tmp, ctagsfile)
 
+
+def add_package(session, pkg, pkgdir, file_table):
+    logging.debug("add-package %s" % pkg)
+
+    ctagsfile = ctags_path(pkgdir)
+    add_package_fs(pkg, pkgdir, file_table)
+
     if "hooks.db" in conf["backends"]:
         db_package = db_storage.lookup_package(session, pkg["package"], pkg["version"])
-        # poor man's cache for last <relpath, file_id>;
-        # rely on the fact that ctags file are path-sorted
-        curfile = {None: None}
-        insert_q = sql.insert(Ctag.__table__)
-        insert_params = []
         if not session.query(Ctag).filter_by(package_id=db_package.id).first():
             # ASSUMPTION: if *a* ctag of this package has already been added to
             # the db in the past, then *all* of them have, as additions are
             # part of the same transaction
-            for tag in parse_ctags(ctagsfile):
-                params = {
-                    "package_id": db_package.id,
-                    "tag": tag["tag"],
-                    # 'file_id': 	# will be filled below
-                    "line": tag["line"],
-                    "kind": tag["kind"],
-                    "language": tag["language"],
-                }
-                relpath = tag["path"]
-                if file_table:
-                    try:
-                        params["file_id"] = file_table[relpath]
-                    except KeyError:
-                        continue
-                else:
-                    try:
-                        params["file_id"] = curfile[relpath]
-                    except KeyError:
-                        file_ = (
-                            session.query(File)
-                            .filter_by(package_id=db_package.id, path=relpath)
-                            .first()
-                        )
-                        if not file_:
-                            continue
-                        curfile = {relpath: file_.id}
-                        params["file_id"] = file_.id
-                insert_params.append(params)
-                if len(insert_params) >= BULK_FLUSH_THRESHOLD:
-                    session.execute(insert_q, insert_params)
-                    session.flush()
-                    insert_params = []
-            if insert_params:  # might be empty if there are no ctags at all!
-                session.execute(insert_q, insert_params)
-                session.flush()
+            if file_table:
+                file_id = file_table.get
+            else:
+
+                def file_id(relpath):
+                    file_ = (
+                        session.query(File.id)
+                        .filter_by(package_id=db_package.id, path=relpath)
+                        .first()
+                    )
+                    return file_.id if file_ else None
+
+            count = copy_ctags(session, db_package, ctagsfile, file_id)
+            db_storage.set_counter(session, db_package, "ctags", count)
 
 
 def rm_package(session, pkg, pkgdir, file_table):
@@ -188,11 +273,14 @@ def rm_package(session, pkg, pkgdir, file_table):
     if "hooks.db" in conf["backends"]:
         db_package = db_storage.lookup_package(session, pkg["package"], pkg["version"])
         session.query(Ctag).filter_by(package_id=db_package.id).delete()
+        db_storage.rm_counter(session, db_package, "ctags")
 
 
 def init_plugin(debsources):
     global conf
     conf = debsources["config"]
-    debsources["subscribe"]("add-package", add_package, title=MY_NAME)
+    debsources["subscribe"](
+        "add-package", add_package, title=MY_NAME, fs_phase=add_package_fs
+    )
     debsources["subscribe"]("rm-package", rm_package, title=MY_NAME)
     debsources["declare_ext"](MY_EXT, MY_NAME)
@@ -13,10 +13,11 @@
 
 import logging
 import os
-import subprocess
+import stat
 from pathlib import Path
 
 from debsources import db_storage
+from debsources.consts import METRIC_TYPES
 from debsources.models import Metric
 
 conf = None
@@ -38,38 +39,90 @@ def parse_metrics(path):
     return metrics
 
 
-def add_package(session, pkg, pkgdir, file_table):
-    logging.debug("add-package %s" % pkg)
-
-    metric_type = "size"
-    metric_value = None
+def compute_metrics(pkgdir: Path):
+    """compute all METRIC_TYPES of the package tree at `pkgdir`, with a single
+    stat pass over it
+
+    return a dictionary mapping metric types to values. Disk usage ("size") is
+    accounted as `du --summarize` does: in KiB, rounded up, counting the blocks
+    of all directory entries (the tree root included), and hardlinked files
+    only once. "apparent_size" is the same, in bytes of file sizes
+
+    """
+    st = os.lstat(pkgdir)
+    blocks, apparent = st.st_blocks, st.st_size
+    files, max_file_size = 0, 0
+    inodes = set()  # hardlinked files already accounted
+    dirs = [pkgdir]
+    while dirs:
+        with os.scandir(dirs.pop()) as entries:
+            for entry in entries:
+                st = entry.stat(follow_symlinks=False)
+                if stat.S_ISDIR(st.st_mode):
+                    dirs.append(entry.path)
+                else:
+                    files += 1
+                    max_file_size = max(max_file_size, st.st_size)
+                    if st.st_nlink > 1:
+                        if (st.st_dev, st.st_ino) in inodes:
+                            continue
+                        inodes.add((st.st_dev, st.st_ino))
+                blocks += st.st_blocks
+                apparent += st.st_size
+    return {
+        "size": -(-blocks * 512 // 1024),
+        "files": files,
+        "max_file_size": max_file_size,
+        "apparent_size": apparent,
+    }
+
+
+def add_package_fs(pkg, pkgdir, file_table):
+    """FS phase of add_package, independent of other hooks
+
+    return the computed metrics, as a dictionary, or None if there was nothing
+    to do
+
+    """
+    metrics = None
     metricsfile = metricsfile_path(pkgdir)
     metricsfile_tmp = Path(str(metricsfile) + ".new")
 
     if "hooks.fs" in conf["backends"]:
-        if not metricsfile.exists():  # run du only if needed
-            cmd = ["du", "--summarize", pkgdir]
-            metric_value = int(subprocess.check_output(cmd).split()[0])
+        known = parse_metrics(metricsfile) if metricsfile.exists() else {}
+        # walk the package only if needed
+        if any(metric_type not in known for metric_type in conf["metrics"]):
+            metrics = compute_metrics(pkgdir)
             with open(metricsfile_tmp, "w") as out:
-                out.write("%s\t%d\n" % (metric_type, metric_value))
+                for metric_type in conf["metrics"]:
+                    out.write("%s\t%d\n" % (metric_type, metrics[metric_type]))
             os.rename(metricsfile_tmp, metricsfile)
+    return metrics
+
+
+def add_package(session, pkg, pkgdir, file_table):
+    logging.debug("add-package %s" % pkg)
+
+    metricsfile = metricsfile_path(pkgdir)
+    metrics = add_package_fs(pkg, pkgdir, file_table)
 
     if "hooks.db" in conf["backends"]:
-        if metric_value is None:
-            # hooks.db is enabled but hooks.fs is not, so we don't have a
-            # metric_value handy. Parse it from metrics file, hoping it exists
+        if metrics is None:
+            # hooks.db is enabled but hooks.fs is not, so we don't have
+            # metrics handy. Parse them from metrics file, hoping it exists
             # from previous runs...
-            metric_value = parse_metrics(metricsfile)[metric_type]
+            metrics = parse_metrics(metricsfile)
 
         db_package = db_storage.lookup_package(session, pkg["package"], pkg["version"])
-        metric = (
-            session.query(Metric)
-            .filter_by(package_id=db_package.id, metric=metric_type, value=metric_value)
-            .first()
+        db_metrics = set(
+            metric_type
+            for (metric_type,) in session.query(Metric.metric).filter_by(
+                package_id=db_package.id
+            )
         )
-        if not metric:
-            metric = Metric(db_package, metric_type, metric_value)
-            session.add(metric)
+        for metric_type in conf["metrics"]:
+            if metric_type not in db_metrics:
+                session.add(Metric(db_package, metric_type, metrics[metric_type]))
 
 
 def rm_package(session, pkg, pkgdir, file_table):
@@ -88,6 +141,13 @@ def rm_package(session, pkg, pkgdir, file_table):
 def init_plugin(debsources):
     global conf
     conf = debsources["config"]
-    debsources["subscribe"]("add-package", add_package, title=MY_NAME)
+    metrics = conf["metrics"]
+    if "size" not in metrics or not set(metrics) <= set(METRIC_TYPES):
+        raise ValueError(
+            "metrics must include size and be among: %s" % " ".join(METRIC_TYPES)
+        )
+    debsources["subscribe"](
+        "add-package", add_package, title=MY_NAME, fs_phase=add_package_fs
+    )
     debsources["subscribe"]("rm-package", rm_package, title=MY_NAME)
     debsources["declare_ext"](MY_EXT, MY_NAME)
@@ -70,9 +70,8 @@ def parse_sloccount(path):
     return slocs
 
 
-def add_package(session, pkg, pkgdir, file_table):
-    logging.debug("add-package %s" % pkg)
-
+def add_package_fs(pkg, pkgdir, file_table):
+    """FS phase of add_package, independent of other hooks"""
     slocfile = slocfile_path(pkgdir)
     slocfile_tmp = Path(str(slocfile) + ".new")
 
@@ -89,6 +88,13 @@ def add_package(session, pkg, pkgdir, file_table):
             finally:
                 os.rename(slocfile_tmp, slocfile)
 
+
+def add_package(session, pkg, pkgdir, file_table):
+    logging.debug("add-package %s" % pkg)
+
+    slocfile = slocfile_path(pkgdir)
+    add_package_fs(pkg, pkgdir, file_table)
+
     if "hooks.db" in conf["backends"]:
         slocs = parse_sloccount(slocfile)
         db_package = db_storage.lookup_package(session, pkg["package"], pkg["version"])
@@ -96,9 +102,14 @@ def add_package(session, pkg, pkgdir, file_table):
             # ASSUMPTION: if *a* loc count of this package has already been
             # added to the db in the past, then *all* of them have, as
             # additions are part of the same transaction
-            for lang, locs in slocs.items():
-                sloccount = SlocCount(db_package, lang, locs)
-                session.add(sloccount)
+            rows = (
+                {"package_id": db_package.id, "language": lang, "count": locs}
+                for lang, locs in slocs.items()
+            )
+            db_storage.bulk_insert(
+                session, SlocCount.__table__, rows, conf["bulk_flush_threshold"]
+            )
+            db_storage.set_counter(session, db_package, "sloc", sum(slocs.values()))
 
 
 def rm_package(session, pkg, pkgdir, file_table):
@@ -112,11 +123,14 @@ def rm_package(session, pkg, pkgdir, file_table):
     if "hooks.db" in conf["backends"]:
         db_package = db_storage.lookup_package(session, pkg["package"], pkg["version"])
         session.query(SlocCount).filter_by(package_id=db_package.id).delete()
+        db_storage.rm_counter(session, db_package, "sloc")
 
 
 def init_plugin(debsources):
     global conf
     conf = debsources["config"]
-    debsources["subscribe"]("add-package", add_package, title="sloccount")
+    debsources["subscribe"](
+        "add-package", add_package, title="sloccount", fs_phase=add_package_fs
+    )
     debsources["subscribe"]("rm-package", rm_package, title="sloccount")
     debsources["declare_ext"](MY_EXT, MY_NAME)
@@ -0,0 +1,88 @@
+# Copyright (C) 2026  The Debsources developers
+# <qa-debsources@lists.alioth.debian.org>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/AUTHORS
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/COPYING
+
+
+"""downsampled rollups of the history_* tables
+
+The history_* tables (see `models.HistorySize` and friends) grow by one sample
+per suite at each update run, while trend charts only show one sample per time
+bucket, e.g., the latest sample of each day for daily charts. The
+history_rollups table (see `models.HistoryRollup`) maps each history table,
+granularity (see GRANULARITIES), suite, and time bucket to the timestamp of the
+latest sample in the bucket, so that samples can be read without scanning
+whole history tables.
+
+Rollups are updated after each statistics update, and only kept for the period
+shown by the trend charts of their granularity (see RETENTION), e.g., hourly
+rollups are kept for a month.
+
+"""
+
+from debsources.consts import TREND_PERIODS
+from debsources.models import HistoryRollup
+
+# history tables, by their names in rollups
+HISTORIES = {
+    "size": "history_size",
+    "sloccount": "history_sloccount",
+    "copyright": "history_copyright",
+}
+
+# granularities of rollups, mapped to date_trunc() fields
+GRANULARITIES = {
+    "hourly": "hour",
+    "daily": "day",
+    "weekly": "week",
+    "monthly": "month",
+}
+
+# how long rollups are kept, per granularity
+RETENTION = {granularity: period for period, granularity in TREND_PERIODS}
+
+# add samples not older than :since to the rollups of a history table
+UPDATE_Q = """
+  INSERT INTO history_rollups (history, granularity, suite, bucket, timestamp)
+  SELECT :history, :granularity, suite, date_trunc('%(field)s', timestamp),
+    max(timestamp)
+  FROM %(table)s
+  WHERE timestamp >= :since
+  GROUP BY suite, date_trunc('%(field)s', timestamp)
+  ON CONFLICT (history, granularity, suite, bucket)
+  DO UPDATE SET timestamp = greatest(history_rollups.timestamp, EXCLUDED.timestamp)
+"""
+
+PRUNE_Q = """
+  DELETE FROM history_rollups
+  WHERE granularity = :granularity
+  AND timestamp < now() - interval '%(retention)s'
+"""
+
+
+def update(session, since):
+    """add to rollups the samples taken at or after `since`, e.g., by the
+    current update run, and drop rollups older than their retention period"""
+    for history, table in HISTORIES.items():
+        for granularity, field in GRANULARITIES.items():
+            session.execute(
+                UPDATE_Q % {"field": field, "table": table},
+                {"history": history, "granularity": granularity, "since": since},
+            )
+    for granularity, retention in RETENTION.items():
+        session.execute(
+            PRUNE_Q % {"retention": retention}, {"granularity": granularity}
+        )
+
+
+def rebuild(session):
+    """recompute rollups from scratch"""
+    session.query(HistoryRollup).delete()
+    update(session, since="-infinity")
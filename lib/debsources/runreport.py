@@ -0,0 +1,205 @@
+# Copyright (C) 2026  The Debsources developers
+# <qa-debsources@lists.alioth.debian.org>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/AUTHORS
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/COPYING
+
+"""timing reports of update runs"""
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# name of the run report file, in cache_dir
+REPORT_FILE = "update-report.json"
+
+# number of slowest packages retained in run reports
+TOP_PACKAGES = 20
+
+
+def _cpu_time():
+    """CPU time (user + system) consumed by this process and by its children
+    that have terminated, e.g., dpkg-source, shell hooks, or worker processes
+
+    """
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+class RunReport(object):
+    """timings collected during an update run
+
+    Collected timings are: wall-clock and CPU time per update stage, total
+    time and number of calls per hook, and the slowest packages to process,
+    with their per-hook time breakdown. The disk space saved by deduplicating
+    extracted files (see `dedup`) and the number of charts drawn or reused as
+    they were (see `charts.render_charts`) are reported as well
+
+    """
+
+    def __init__(self, top=TOP_PACKAGES):
+        self.started = datetime.utcnow()
+        self.stages = []  # [{"stage": name, "wall": seconds, "cpu": seconds}]
+        self.hooks = {}  # "event/hook" -> {"calls": int, "time": seconds}
+        self.dedup = {"files": 0, "bytes": 0}  # deduplicated files, saved bytes
+        self.charts = {"rendered": 0, "reused": 0}
+        self._top = top
+        self._slowest = []  # min-heap of <time, seq, package entry> triples
+        self._seq = itertools.count()  # tie breaker for heap entries
+        self._current = None  # timings of the package being processed
+
+    @contextmanager
+    def stage(self, name):
+        """time the execution of update stage `name`"""
+        wall, cpu = time.perf_counter(), _cpu_time()
+        try:
+            yield
+        finally:
+            self.stages.append(
+                {
+                    "stage": name,
+                    "wall": time.perf_counter() - wall,
+                    "cpu": _cpu_time() - cpu,
+                }
+            )
+
+    @contextmanager
+    def package(self, pkg, event, timings=None):
+        """time the processing of `event` (e.g., "add-package") for package
+        `pkg`; hook timings reported via `hook` in the meantime are accounted
+        to the package
+
+        Yield the package timings, as a dictionary with keys "time" (seconds)
+        and "hooks" (mapping hook names to seconds). `timings`, if given, are
+        timings of the same package measured elsewhere (e.g., by an extraction
+        worker) to be added to it, together with their deduplication results.
+        Hooks timed there are expected to be reported again via `hook`, when
+        their DB side is run: their time is added to hook totals, but their
+        calls are not counted twice
+
+        """
+        current = {"time": 0.0, "hooks": {}}
+        if timings is not None:
+            current["time"] = timings["time"]
+            for title, elapsed in timings["hooks"].items():
+                self._add_hook_time(event, title, elapsed, calls=0)
+                current["hooks"][title] = elapsed
+            if "dedup" in timings:
+                self.deduplicated(*timings["dedup"])
+        self._current = current
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            self._current = None
+            current["time"] += time.perf_counter() - start
+            entry = {
+                "package": str(pkg),
+                "event": event,
+                "time": current["time"],
+                "hooks": current["hooks"],
+            }
+            item = (current["time"], next(self._seq), entry)
+            if len(self._slowest) < self._top:
+                heapq.heappush(self._slowest, item)
+            else:
+                heapq.heappushpop(self._slowest, item)
+
+    def _add_hook_time(self, event, title, elapsed, calls=1):
+        totals = self.hooks.setdefault(event + "/" + title, {"calls": 0, "time": 0.0})
+        totals["calls"] += calls
+        totals["time"] += elapsed
+
+    def hook(self, event, title, elapsed):
+        """record that hook `title` took `elapsed` seconds to handle `event`"""
+        self._add_hook_time(event, title, elapsed)
+        if self._current is not None:
+            hooks = self._current["hooks"]
+            hooks[title] = hooks.get(title, 0.0) + elapsed
+
+    def deduplicated(self, files, nbytes):
+        """record that `files` files have been replaced by links to the
+        deduplication store, saving `nbytes` bytes of disk space"""
+        self.dedup["files"] += files
+        self.dedup["bytes"] += nbytes
+        if self._current is not None:
+            self._current["dedup"] = [files, nbytes]
+
+    def charts_rendered(self, rendered, reused):
+        """record that `rendered` charts have been drawn, and that `reused`
+        charts have been kept as they were, their inputs being unchanged"""
+        self.charts["rendered"] += rendered
+        self.charts["reused"] += reused
+
+    @property
+    def slowest_packages(self):
+        """slowest processed packages, slowest first"""
+        return [entry for _t, _seq, entry in sorted(self._slowest, reverse=True)]
+
+    def as_dict(self):
+        return {
+            "started": self.started.isoformat(),
+            "finished": datetime.utcnow().isoformat(),
+            "stages": self.stages,
+            "hooks": self.hooks,
+            "slowest_packages": self.slowest_packages,
+            "dedup": self.dedup,
+            "charts": self.charts,
+        }
+
+    def save(self, path: Path):
+        """atomically save the report, as JSON, to `path`"""
+        path_new = Path(str(path) + ".new")
+        with path_new.open("w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+        path_new.rename(path)
+
+    def log_summary(self):
+        """log a human-readable summary of the report"""
+        for stage in self.stages:
+            logging.info(
+                "stage %s: %.1fs wall, %.1fs CPU"
+                % (stage["stage"], stage["wall"], stage["cpu"])
+            )
+        for title, totals in sorted(
+            self.hooks.items(), key=lambda item: item[1]["time"], reverse=True
+        ):
+            logging.info(
+                "hook %s: %.1fs in %d calls" % (title, totals["time"], totals["calls"])
+            )
+        if self.dedup["files"]:
+            logging.info(
+                "dedup: %d files linked, %d bytes saved"
+                % (self.dedup["files"], self.dedup["bytes"])
+            )
+        if self.charts["rendered"] or self.charts["reused"]:
+            logging.info(
+                "charts: %d rendered, %d reused"
+                % (self.charts["rendered"], self.charts["reused"])
+            )
+        for entry in self.slowest_packages:
+            hooks = ", ".join(
+                "%s %.1fs" % (title, elapsed)
+                for title, elapsed in sorted(entry["hooks"].items())
+            )
+            logging.info(
+                "slow package %s (%s): %.1fs%s"
+                % (
+                    entry["package"],
+                    entry["event"],
+                    entry["time"],
+                    " (%s)" % hooks if hooks else "",
+                )
+            )
@@ -20,20 +20,22 @@ from pathlib import Path
 from sqlalchemy import desc, distinct
 from sqlalchemy import func as sql_func
 
+from debsources.aggregates import ALL_SUITES, SLOCCOUNT_PREFIX
 from debsources.consts import SLOCCOUNT_LANGUAGES, SUITES
 from debsources.license_helper import Licenses
 from debsources.models import (
-    Checksum,
-    Ctag,
     File,
     FileCopyright,
     Metric,
     Package,
+    PackageCounter,
     PackageName,
     SlocCount,
     Suite,
+    SuiteAggregate,
     SuiteInfo,
 )
+from debsources.rollups import GRANULARITIES
 
 
 def _count(query):
@@ -43,6 +45,32 @@ def _count(query):
     return count
 
 
+def _aggregate(session, stat, suite=None, areas=None):
+    """read statistic `stat` from the suite aggregates (see `aggregates`)"""
+    q = (
+        session.query(sql_func.sum(SuiteAggregate.value))
+        .filter(SuiteAggregate.suite == (suite or ALL_SUITES))
+        .filter(SuiteAggregate.stat == stat)
+    )
+    if areas:
+        q = q.filter(SuiteAggregate.area.in_(areas))
+    return int(_count(q))
+
+
+def _counter(session, counter, suite=None, areas=None):
+    """sum per-package `counter` (see `models.PackageCounter`) over packages"""
+    q = session.query(sql_func.sum(PackageCounter.value)).filter(
+        PackageCounter.counter == counter
+    )
+    if suite or areas:
+        q = q.join(Package, Package.id == PackageCounter.package_id)
+    if suite:
+        q = q.join(Suite, Suite.package_id == Package.id).filter(Suite.suite == suite)
+    if areas:
+        q = q.filter(Package.area.in_(areas))
+    return int(_count(q))
+
+
 def _time_series(query):
     return [(row["timestamp"], row["value"]) for row in query]
 
@@ -74,15 +102,19 @@ def sticky_suites(session):
     return [row[0] for row in q]
 
 
-def disk_usage(session, suite=None, areas=None):
+def disk_usage(session, suite=None, areas=None, aggregates=False):
     """disk space used by extracted source packages
 
     only count disk usage relative to suite, if given
 
     only count disk usage relative to archive `areas`, if given
 
+    read the result from suite aggregates if `aggregates` is given
+
     """
     logging.debug("compute disk usage for suite %s..." % suite)
+    if aggregates:
+        return _aggregate(session, "disk_usage", suite, areas)
     q = session.query(sql_func.sum(Metric.value)).filter(Metric.metric == "size")
     if suite or areas:
         q = q.join(Package, Package.id == Metric.package_id)
@@ -93,7 +125,7 @@ def disk_usage(session, suite=None, areas=None):
     return _count(q)
 
 
-def source_packages(session, suite=None, areas=None):
+def source_packages(session, suite=None, areas=None, aggregates=False):
     """(versioned) source package count
 
     only count packages in suite, if given
@@ -105,8 +137,12 @@ def source_packages(session, suite=None, areas=None):
     as each suite is (usually) guaranteed to contain at most one version of
     each packages
 
+    read the result from suite aggregates if `aggregates` is given
+
     """
     logging.debug("count source packages for suite %s..." % suite)
+    if aggregates:
+        return _aggregate(session, "source_packages", suite, areas)
     q = session.query(sql_func.count(Package.id))
     if suite:
         q = q.join(Suite, Suite.package_id == Package.id).filter(Suite.suite == suite)
@@ -115,7 +151,7 @@ def source_packages(session, suite=None, areas=None):
     return _count(q)
 
 
-def source_files(session, suite=None, areas=None):
+def source_files(session, suite=None, areas=None, aggregates=False):
     """source files count
 
     only count source files in suite, if given
@@ -124,18 +160,15 @@ def source_files(session, suite=None, areas=None):
 
     Return 0 if the checksum plugin is not enabled
 
+    read the result from suite aggregates if `aggregates` is given
+
     """
     # TODO when a separate File table will be present, this will need to be
     # adapted to use that instead of Checksum
     logging.debug("count source files for suite %s..." % suite)
-    q = session.query(sql_func.count(Checksum.id))
-    if suite or areas:
-        q = q.join(Package, Package.id == Checksum.package_id)
-    if suite:
-        q = q.join(Suite, Suite.package_id == Package.id).filter(Suite.suite == suite)
-    if areas:
-        q = q.filter(Package.area.in_(areas))
-    return _count(q)
+    if aggregates:
+        return _aggregate(session, "source_files", suite, areas)
+    return _counter(session, "checksums", suite, areas)
 
 
 def sloccount_lang(session, language, suite=None, areas=None):
@@ -159,7 +192,7 @@ def sloccount_lang(session, language, suite=None, areas=None):
     return _count(q)
 
 
-def sloccount_summary(session, suite=None, areas=None):
+def sloccount_summary(session, suite=None, areas=None, aggregates=False):
     """source lines of code (SLOCs), broken down per language
 
     return a language-indexed dictionary of SLOC counts
@@ -168,8 +201,20 @@ def sloccount_summary(session, suite=None, areas=None):
 
     only count packages in archive `areas`, if given
 
+    read the result from suite aggregates if `aggregates` is given
+
     """
     logging.debug("sloccount summary for suite %s..." % suite)
+    if aggregates:
+        q = (
+            session.query(SuiteAggregate.stat, sql_func.sum(SuiteAggregate.value))
+            .filter(SuiteAggregate.suite == (suite or ALL_SUITES))
+            .filter(SuiteAggregate.stat.startswith(SLOCCOUNT_PREFIX))
+        )
+        if areas:
+            q = q.filter(SuiteAggregate.area.in_(areas))
+        q = q.group_by(SuiteAggregate.stat)
+        return {stat[len(SLOCCOUNT_PREFIX) :]: int(slocs) for stat, slocs in q.all()}
     q = session.query(SlocCount.language, sql_func.sum(SlocCount.count))
     if suite or areas:
         q = q.join(Package, Package.id == SlocCount.package_id)
@@ -181,40 +226,63 @@ def sloccount_summary(session, suite=None, areas=None):
     return dict(q.all())
 
 
-def ctags(session, suite=None, areas=None):
+def ctags(session, suite=None, areas=None, aggregates=False):
     """ctags count
 
     only count ctags in suite, if given
 
     only count packages in archive `areas`, if given
 
+    read the result from suite aggregates if `aggregates` is given
+
     """
     logging.debug("count ctags for suite %s..." % suite)
-    q = session.query(sql_func.count(Ctag.id))
-    if suite or areas:
-        q = q.join(Package, Package.id == Ctag.package_id)
-    if suite:
-        q = q.join(Suite, Suite.package_id == Package.id).filter(Suite.suite == suite)
-    if areas:
-        q = q.filter(Package.area.in_(areas))
-    return _count(q)
+    if aggregates:
+        return _aggregate(session, "ctags", suite, areas)
+    return _counter(session, "ctags", suite, areas)
+
+
+# latest samples of history table %(table)s, one per %(granularity)s time
+# bucket, for the past %(interval)s, as per rollups (see `rollups`)
+ROLLUP_SAMPLES_Q = "\
+  FROM history_rollups r \
+  JOIN %(table)s h ON h.timestamp = r.timestamp AND h.suite = r.suite \
+  WHERE r.history = '%(history)s' AND r.granularity = '%(granularity)s' \
+  AND r.suite = '%(suite)s' \
+  AND r.timestamp >= now() - interval '%(interval)s' \
+  ORDER BY r.bucket DESC"
+
+
+def _rollup_samples_q(history, granularity, interval, suite):
+    return ROLLUP_SAMPLES_Q % {
+        "table": "history_" + history,
+        "history": history,
+        "granularity": granularity,
+        "interval": interval,
+        "suite": suite,
+    }
+
 
+def _projection(granularity):
+    return "date_trunc('%s', timestamp)" % GRANULARITIES[granularity]
 
-def _hist_size_sample(session, metric, interval, projection, suite=None):
+
+def _hist_size_sample(session, metric, interval, granularity, suite=None):
+    if suite:
+        q = "SELECT h.timestamp, h.%s AS value " % metric + _rollup_samples_q(
+            "size", granularity, interval, suite
+        )
+        return _time_series(session.execute(q))
     q = "\
       SELECT DISTINCT ON (%(projection)s) timestamp, %(metric)s AS VALUE \
       FROM history_size \
       WHERE timestamp >= now() - interval '%(interval)s' \
-      %(filter)s \
       ORDER BY %(projection)s DESC, timestamp DESC"
     kw = {
         "metric": metric,
-        "projection": projection,
+        "projection": _projection(granularity),
         "interval": interval,
-        "filter": "",
     }
-    if suite:
-        kw["filter"] = "AND suite = '%s'" % suite
     return _time_series(session.execute(q % kw))
 
 
@@ -222,7 +290,9 @@ def history_size_hourly(session, metric, interval, suite):
     """return recent size history of `metric`, over the past `interval`
 
     `interval` must be a valid Postgre time interval, see
-    http://www.postgresql.org/docs/9.1/static/functions-datetime.html
+    http://www.postgresql.org/docs/9.1/static/functions-datetime.html. Samples
+    of a suite are only available for the retention period of their rollups,
+    see `rollups.RETENTION`
 
     """
     logging.debug(
@@ -232,7 +302,7 @@ def history_size_hourly(session, metric, interval, suite):
         session,
         metric,
         interval,
-        projection="date_trunc('hour', timestamp)",
+        granularity="hourly",
         suite=suite,
     )
 
@@ -244,7 +314,7 @@ def history_size_daily(session, metric, interval, suite):
         session,
         metric,
         interval,
-        projection="date_trunc('day', timestamp)",
+        granularity="daily",
         suite=suite,
     )
 
@@ -258,7 +328,7 @@ def history_size_weekly(session, metric, interval, suite):
         session,
         metric,
         interval,
-        projection="date_trunc('week', timestamp)",
+        granularity="weekly",
         suite=suite,
     )
 
@@ -272,24 +342,24 @@ def history_size_monthly(session, metric, interval, suite):
         session,
         metric,
         interval,
-        projection="date_trunc('month', timestamp)",
+        granularity="monthly",
         suite=suite,
     )
 
 
-def _hist_sloc_sample(session, interval, projection, suite=None):
-    q = "\
-      SELECT DISTINCT ON (%(projection)s) * \
-      FROM history_sloccount \
-      WHERE timestamp >= now() - interval '%(interval)s' \
-      %(filter)s \
-      ORDER BY %(projection)s DESC, timestamp DESC"
-    kw = {"projection": projection, "interval": interval, "filter": ""}
+def _hist_sloc_sample(session, interval, granularity, suite=None):
     if suite:
-        kw["filter"] = "AND suite = '%s'" % suite
+        q = "SELECT h.* " + _rollup_samples_q("sloccount", granularity, interval, suite)
+    else:
+        q = "\
+          SELECT DISTINCT ON (%(projection)s) * \
+          FROM history_sloccount \
+          WHERE timestamp >= now() - interval '%(interval)s' \
+          ORDER BY %(projection)s DESC, timestamp DESC"
+        q = q % {"projection": _projection(granularity), "interval": interval}
 
     series = dict([(lang, []) for lang in SLOCCOUNT_LANGUAGES])
-    samples = session.execute(q % kw)
+    samples = session.execute(q)
     for row in samples:
         for lang in SLOCCOUNT_LANGUAGES:
             series[lang].append((row["timestamp"], row["lang_" + lang]))
@@ -306,33 +376,25 @@ def history_sloc_hourly(session, interval, suite):
 
     """
     logging.debug("take hourly sloccount sample for suite %s" % suite)
-    return _hist_sloc_sample(
-        session, interval, projection="date_trunc('hour', timestamp)", suite=suite
-    )
+    return _hist_sloc_sample(session, interval, granularity="hourly", suite=suite)
 
 
 def history_sloc_daily(session, interval, suite):
     """like `history_sloc_full`, but taking daily samples"""
     logging.debug("take daily sloccount sample for suite %s" % suite)
-    return _hist_sloc_sample(
-        session, interval, projection="date_trunc('day', timestamp)", suite=suite
-    )
+    return _hist_sloc_sample(session, interval, granularity="daily", suite=suite)
 
 
 def history_sloc_weekly(session, interval, suite):
     """like `history_sloc_full`, but taking weekly samples"""
     logging.debug("take weekly sloccount sample for suite %s" % suite)
-    return _hist_sloc_sample(
-        session, interval, projection="date_trunc('week', timestamp)", suite=suite
-    )
+    return _hist_sloc_sample(session, interval, granularity="weekly", suite=suite)
 
 
 def history_sloc_monthly(session, interval, suite):
     """like `history_sloc_full`, but taking monthly samples"""
     logging.debug("take monthly sloccount sample for suite %s" % suite)
-    return _hist_sloc_sample(
-        session, interval, projection="date_trunc('month', timestamp)", suite=suite
-    )
+    return _hist_sloc_sample(session, interval, granularity="monthly", suite=suite)
 
 
 def sloc_per_package(session, suite=None, areas=None):
@@ -365,13 +427,50 @@ def sloc_per_package(session, suite=None, areas=None):
     return q.all()
 
 
-def stats_grouped_by(session, stat, areas=None):
+def _aggregates_grouped_by(session, stat, areas=None):
+    """like `stats_grouped_by`, reading from suite aggregates"""
+    if stat == "sloccount":
+        language = sql_func.substr(SuiteAggregate.stat, len(SLOCCOUNT_PREFIX) + 1)
+        q = (
+            session.query(
+                SuiteAggregate.suite.label("suite"),
+                language.label("language"),
+                sql_func.sum(SuiteAggregate.value),
+            )
+            .filter(SuiteAggregate.stat.startswith(SLOCCOUNT_PREFIX))
+            .group_by(SuiteAggregate.suite, SuiteAggregate.stat)
+        )
+    else:
+        q = (
+            session.query(
+                SuiteAggregate.suite.label("suite"), sql_func.sum(SuiteAggregate.value)
+            )
+            .filter(SuiteAggregate.stat == stat)
+            .group_by(SuiteAggregate.suite)
+        )
+    q = q.filter(SuiteAggregate.suite != ALL_SUITES)
+    if areas:
+        q = q.filter(SuiteAggregate.area.in_(areas))
+    return [tuple(row[:-1]) + (int(row[-1]),) for row in q]
+
+
+def stats_grouped_by(session, stat, areas=None, aggregates=False):
     """Compute statistics `stat` query using grouped by
     to minimize time execution.
 
     Reference doc/update-stats-query.bench.sql
+
+    read results from suite aggregates if `aggregates` is given
     """
     logging.debug("Compute %s stats for all suites" % stat)
+    if aggregates and stat in [
+        "source_packages",
+        "source_files",
+        "disk_usage",
+        "ctags",
+        "sloccount",
+    ]:
+        return _aggregates_grouped_by(session, stat, areas)
     if stat == "source_packages":
         q = (
             session.query(Suite.suite.label("suite"), sql_func.count(Package.id))
@@ -380,9 +479,12 @@ def stats_grouped_by(session, stat, areas=None):
         )
     elif stat == "source_files":
         q = (
-            session.query(Suite.suite.label("suite"), sql_func.count(Checksum.id))
+            session.query(
+                Suite.suite.label("suite"), sql_func.sum(PackageCounter.value)
+            )
+            .filter(PackageCounter.counter == "checksums")
             .join(Package, Package.id == Suite.package_id)
-            .join(Checksum, Checksum.package_id == Package.id)
+            .join(PackageCounter, PackageCounter.package_id == Package.id)
             .group_by(Suite.suite)
         )
     elif stat == "disk_usage":
@@ -395,9 +497,12 @@ def stats_grouped_by(session, stat, areas=None):
         )
     elif stat == "ctags":
         q = (
-            session.query(Suite.suite.label("suite"), sql_func.count(Ctag.id))
+            session.query(
+                Suite.suite.label("suite"), sql_func.sum(PackageCounter.value)
+            )
+            .filter(PackageCounter.counter == "ctags")
             .join(Package, Package.id == Suite.package_id)
-            .join(Ctag, Ctag.package_id == Package.id)
+            .join(PackageCounter, PackageCounter.package_id == Package.id)
             .group_by(Suite.suite)
         )
     elif stat == "sloccount":
@@ -474,17 +579,17 @@ def get_licenses(session, suite=None):
         return dict(q.all())
 
 
-def _hist_copyright_sample(session, interval, projection, suite=None):
-    q = "\
-      SELECT * \
-      FROM history_copyright \
-      WHERE timestamp >= now() - interval '%(interval)s' \
-      %(filter)s \
-      ORDER BY %(projection)s DESC, timestamp DESC"
-    kw = {"projection": projection, "interval": interval, "filter": ""}
+def _hist_copyright_sample(session, interval, granularity, suite=None):
     if suite:
-        kw["filter"] = "AND suite = '%s'" % suite
-    results = session.execute(q % kw)
+        q = "SELECT h.* " + _rollup_samples_q("copyright", granularity, interval, suite)
+    else:
+        q = "\
+          SELECT * \
+          FROM history_copyright \
+          WHERE timestamp >= now() - interval '%(interval)s' \
+          ORDER BY %(projection)s DESC, timestamp DESC"
+        q = q % {"projection": _projection(granularity), "interval": interval}
+    results = session.execute(q)
     copyright = dict()
     for row in results:
         if row["license"] in copyright.keys():
@@ -497,25 +602,19 @@ def _hist_copyright_sample(session, interval, projection, suite=None):
 def history_copyright_hourly(session, interval, suite):
     """return recent size history of license, over the past `interval`"""
     logging.debug("take hourly copyright sample of %s for suite %s" % (interval, suite))
-    return _hist_copyright_sample(
-        session, interval, projection="date_trunc('hour', timestamp)", suite=suite
-    )
+    return _hist_copyright_sample(session, interval, granularity="hourly", suite=suite)
 
 
 def history_copyright_daily(session, interval, suite):
     """like `history_copyright_full`, but taking daily samples"""
     logging.debug("take daily copyright sample of %s for suite %s" % (interval, suite))
-    return _hist_copyright_sample(
-        session, interval, projection="date_trunc('day', timestamp)", suite=suite
-    )
+    return _hist_copyright_sample(session, interval, granularity="daily", suite=suite)
 
 
 def history_copyright_weekly(session, interval, suite):
     """like `history_copyright_full`, but taking weekly samples"""
     logging.debug("take weekly copyright sample of %s for suite %s" % (interval, suite))
-    return _hist_copyright_sample(
-        session, interval, projection="date_trunc('week', timestamp)", suite=suite
-    )
+    return _hist_copyright_sample(session, interval, granularity="weekly", suite=suite)
 
 
 def history_copyright_monthly(session, interval, suite):
@@ -523,9 +622,7 @@ def history_copyright_monthly(session, interval, suite):
     logging.debug(
         "take monthly copyright sample of %s for suite %s" % (interval, suite)
     )
-    return _hist_copyright_sample(
-        session, interval, projection="date_trunc('month', timestamp)", suite=suite
-    )
+    return _hist_copyright_sample(session, interval, granularity="monthly", suite=suite)
 
 
 def licenses_summary_w_dual(results):
@@ -17,10 +17,22 @@ import sqlalchemy
 import sqlalchemy.orm
 
 from debsources.subprocess_workaround import subprocess_setup
-from debsources.tests.testdata import TEST_DATA_DIR, TEST_DB_NAME
+from debsources.tests.testdata import TEST_DATA_DIR, TEST_DB_NAME, TEST_DIR
 
 TEST_DB_DUMP = TEST_DATA_DIR / "db" / "pg-dump-custom"
 
+MIGRATIONS_DIR = TEST_DIR.parent / "migrate"
+
+# schema migrations (in MIGRATIONS_DIR) postdating TEST_DB_DUMP, applied in
+# order to the restored test DB
+TEST_DB_MIGRATIONS = [
+    "013-to-014.sql",
+    "014-to-015.sql",
+    "015-to-016.sql",
+    "016-to-017.sql",
+    "017-to-018.sql",
+]
+
 # queries to compare two DB schemas (e.g. "public.*" and "ref.*")
 DB_COMPARE_QUERIES = {
     "package_names": "SELECT name \
@@ -100,6 +112,25 @@ def pg_restore(dbname, dumpfile):
     )
 
 
+def pg_migrate(dbname, migrations):
+    for migration in migrations:
+        subprocess.check_call(
+            [
+                "psql",
+                "--quiet",
+                "--no-psqlrc",
+                "--set",
+                "ON_ERROR_STOP=1",
+                "--dbname",
+                dbname,
+                "--file",
+                MIGRATIONS_DIR / migration,
+            ],
+            stdout=subprocess.DEVNULL,
+            preexec_fn=subprocess_setup,
+        )
+
+
 def pg_dump(dbname, dumpfile):
     subprocess.check_call(
         ["pg_dump", "--no-owner", "--no-privileges", "-Fc", "-f", dumpfile, dbname],
@@ -132,6 +163,7 @@ def db_setup(test_subj, dbname=TEST_DB_NAME, dbdump=TEST_DB_DUMP, echo=False):
     test_subj.dbname = dbname
     test_subj.db = sqlalchemy.create_engine("postgresql:///" + dbname, echo=echo)
     pg_restore(dbname, dbdump)
+    pg_migrate(dbname, TEST_DB_MIGRATIONS)
     Session = sqlalchemy.orm.sessionmaker()
     test_subj.session = Session(bind=test_subj.db)
 
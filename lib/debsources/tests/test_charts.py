@@ -0,0 +1,52 @@
+# Copyright (C) 2026  The Debsources developers
+# <qa-debsources@lists.alioth.debian.org>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/AUTHORS
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/COPYING
+
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from nose.plugins.attrib import attr
+from nose.tools import istest
+
+from debsources import charts
+
+
+@attr("charts")
+class ChartsTests(unittest.TestCase):
+    """Unit tests for debsources.charts"""
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(suffix=".debsources-test"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @istest
+    def redrawsOnlyChangedCharts(self):
+        series = [(datetime(2026, 1, day), day * 10) for day in range(1, 4)]
+        pie, size = self.tmpdir / "pie.png", self.tmpdir / "size.png"
+        jobs = [
+            (charts.pie_chart, pie, {"items": {"ansic": 10, "python": 5}}),
+            (charts.size_plot, size, {"series": series}),
+        ]
+
+        self.assertEqual((2, 0), charts.render_charts(jobs, workers=2))
+        self.assertTrue(pie.exists() and size.exists())
+        self.assertEqual((0, 2), charts.render_charts(jobs))
+
+        jobs[1][2]["series"] = series + [(datetime(2026, 1, 4), 40)]
+        self.assertEqual((1, 1), charts.render_charts(jobs))
+        size.unlink()
+        self.assertEqual((1, 1), charts.render_charts(jobs))
+        self.assertTrue(size.exists())
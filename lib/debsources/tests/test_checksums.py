@@ -0,0 +1,66 @@
+# Copyright (C) 2026  The Debsources developers
+# <qa-debsources@lists.alioth.debian.org>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/AUTHORS
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/COPYING
+
+import hashlib
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from nose.plugins.attrib import attr
+from nose.tools import istest
+
+from debsources.plugins import hook_checksums
+
+
+@attr("checksums")
+class ChecksumsTests(unittest.TestCase):
+    """Unit tests for the checksums hook"""
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(suffix=".debsources-test"))
+        self.pkgdir = self.tmpdir / "foo" / "1.0-1"
+        (self.pkgdir / "src").mkdir(parents=True)
+        (self.pkgdir / "README").write_bytes(b"readme\n")
+        (self.pkgdir / "src" / "main.c").write_bytes(b"int main;\n")
+        (self.pkgdir / "LINK").symlink_to("README")
+        self.saved_conf = hook_checksums.conf
+        hook_checksums.conf = {
+            "backends": set(["hooks", "hooks.fs"]),
+            "checksum_digests": ["sha256", "sha1", "md5"],
+        }
+
+    def tearDown(self):
+        hook_checksums.conf = self.saved_conf
+        shutil.rmtree(self.tmpdir)
+
+    @istest
+    def addsDigestsWithoutFileTable(self):
+        # package checksummed before extra digests were introduced
+        sumsfile = hook_checksums.sums_path(self.pkgdir)
+        sumsfile.write_bytes(b"0" * 64 + b"  README\n")
+
+        hook_checksums.add_package_fs(None, self.pkgdir, None)
+        self.assertEqual(b"0" * 64 + b"  README\n", sumsfile.read_bytes())
+        self.assertEqual(
+            {
+                Path(relpath): {
+                    "sha1": hashlib.sha1(content).hexdigest(),
+                    "md5": hashlib.md5(content).hexdigest(),
+                }
+                for relpath, content in [
+                    ("README", b"readme\n"),
+                    ("src/main.c", b"int main;\n"),
+                ]
+            },
+            hook_checksums.parse_digests(hook_checksums.digests_path(self.pkgdir)),
+        )
@@ -0,0 +1,68 @@
+# Copyright (C) 2026  The Debsources developers
+# <qa-debsources@lists.alioth.debian.org>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/AUTHORS
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/COPYING
+
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from nose.plugins.attrib import attr
+from nose.tools import istest
+
+from debsources.plugins.hook_ctags import CopyBuffer, _copy_value, parse_ctags
+
+
+@attr("ctags")
+class CtagsTests(unittest.TestCase):
+    """Unit tests for the ctags hook"""
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(suffix=".debsources-test"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @istest
+    def parsesTags(self):
+        tagsfile = self.tmpdir / "tags"
+        tagsfile.write_bytes(
+            b"!_TAG_FILE_FORMAT\t2\n"
+            b'music\tsound.c\t13;"\tkind:v\tline:13\tlanguage:C\tfile:\n'
+            b"malformed\tsound.c\n"
+        )
+        self.assertEqual(
+            [
+                {
+                    "tag": "music",
+                    "path": Path("sound.c"),
+                    "line": 13,
+                    "kind": "v",
+                    "language": "c",
+                }
+            ],
+            list(parse_ctags(tagsfile)),
+        )
+
+    @istest
+    def copyBufferStreamsEscapedRows(self):
+        self.assertEqual("a\\\\b\\tc\\n", _copy_value("a\\b\tc\n"))
+        self.assertEqual("\\N", _copy_value(None))
+        rows = ["row %d\n" % i for i in range(50000)]
+        buf = CopyBuffer(iter(rows))
+        chunks = []
+        while True:
+            chunk = buf.read(8192)
+            if not chunk:
+                break
+            self.assertLessEqual(len(chunk), 8192)
+            chunks.append(chunk)
+        self.assertEqual("".join(rows), "".join(chunks))
@@ -0,0 +1,133 @@
+# Copyright (C) 2026  The Debsources developers
+# <qa-debsources@lists.alioth.debian.org>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/AUTHORS
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/COPYING
+
+
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from nose.plugins.attrib import attr
+from nose.tools import istest
+
+from debsources.debmirror import (
+    SOURCES_CACHE_FILE,
+    PackageTable,
+    SourceMirror,
+    SourcePackage,
+)
+from debsources.tests.testdata import TEST_DATA_DIR
+
+
+def ls_summary(mirror):
+    """list `mirror`, keeping only package information used by Debsources"""
+    pkgs = [
+        (str(pkg), pkg.archive_area(), pkg.dsc_path(), pkg.get("vcs-browser"))
+        for pkg in mirror.ls()
+    ]
+    return pkgs, mirror.suites, mirror.packages
+
+
+@attr("debmirror")
+class SourceMirrorTests(unittest.TestCase):
+    """Unit tests for debsources.debmirror"""
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(suffix=".debsources-test"))
+        self.mirror_dir = TEST_DATA_DIR / "mirror"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @istest
+    def cachedListingMatchesParsing(self):
+        expected = ls_summary(SourceMirror(self.mirror_dir))
+        fresh = ls_summary(SourceMirror(self.mirror_dir, cache_dir=self.tmpdir))
+        self.assertTrue((self.tmpdir / SOURCES_CACHE_FILE).exists())
+        cached = ls_summary(SourceMirror(self.mirror_dir, cache_dir=self.tmpdir))
+        self.assertEqual(expected, fresh)
+        self.assertEqual(expected, cached)
+
+    @istest
+    def parallelListingMatchesSequential(self):
+        expected = ls_summary(SourceMirror(self.mirror_dir))
+        parallel = ls_summary(SourceMirror(self.mirror_dir, workers=4))
+        self.assertEqual(expected, parallel)
+
+    @istest
+    def packageTableListsSuitesInOrder(self):
+        table = PackageTable()
+        self.assertTrue(table.add("sid", "foo", "1.0-2"))
+        self.assertTrue(table.add("sid", "bar", "2.0"))
+        self.assertTrue(table.add("bookworm", "foo", "1.0-1"))
+        self.assertFalse(table.add("bookworm", "bar", "2.0"))
+        self.assertEqual(
+            {
+                "sid": [("foo", "1.0-2"), ("bar", "2.0")],
+                "bookworm": [("foo", "1.0-1"), ("bar", "2.0")],
+            },
+            dict(table.suites),
+        )
+        self.assertEqual({("foo", "1.0-2"), ("bar", "2.0"), ("foo", "1.0-1")}, table)
+        self.assertIn(("foo", "1.0-1"), table)
+        self.assertNotIn(("foo", "2.0"), table)
+        self.assertNotIn(("baz", "1.0"), table)
+
+        # suites are views of the table, listing pairs as they are added
+        sid = table.suites["sid"]
+        self.assertEqual(2, len(sid))
+        self.assertEqual(("bar", "2.0"), sid[-1])
+        self.assertEqual([("foo", "1.0-2")], sid[:1])
+        table.add("sid", "baz", "1.0")
+        self.assertEqual(("baz", "1.0"), sid[2])
+
+    @istest
+    def origTarballsIgnoreDebianChanges(self):
+        def mk_pkg(version, debian_sum):
+            return SourcePackage(
+                "Package: foo\n"
+                "Version: %s\n"
+                "Directory: pool/main/f/foo\n"
+                "X-Debsources-Mirror-Root: /srv/mirror\n"
+                "Checksums-Sha256:\n"
+                " %s 10 foo_%s.dsc\n"
+                " %s 20 foo_1.0.orig.tar.xz\n"
+                " %s 30 foo_1.0.orig.tar.xz.asc\n"
+                " %s 40 foo_1.0.orig-doc.tar.gz\n"
+                " %s 50 foo_%s.debian.tar.xz\n"
+                % (
+                    version,
+                    debian_sum,
+                    version,
+                    "a" * 64,
+                    "b" * 64,
+                    "c" * 64,
+                    debian_sum,
+                    version,
+                )
+            )
+
+        old, new = mk_pkg("1.0-1", "d" * 64), mk_pkg("1.0-2", "e" * 64)
+        self.assertEqual(
+            frozenset(
+                [
+                    ("foo_1.0.orig.tar.xz", "a" * 64),
+                    ("foo_1.0.orig-doc.tar.gz", "c" * 64),
+                ]
+            ),
+            new.orig_tarballs(),
+        )
+        self.assertEqual(old.orig_tarballs(), new.orig_tarballs())
+        self.assertEqual(
+            Path("/srv/mirror/pool/main/f/foo/foo_1.0-2.debian.tar.xz"),
+            new.debian_tarball_path(),
+        )
@@ -0,0 +1,94 @@
+# Copyright (C) 2026  The Debsources developers
+# <qa-debsources@lists.alioth.debian.org>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/AUTHORS
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/COPYING
+
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from nose.plugins.attrib import attr
+from nose.tools import istest
+
+from debsources import dedup, fs_storage
+
+
+def mk_package(pkgdir: Path, files):
+    for relpath, content in files.items():
+        path = pkgdir / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+
+
+@attr("dedup")
+class DedupTests(unittest.TestCase):
+    """Unit tests for debsources.dedup"""
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(suffix=".debsources-test"))
+        self.store = dedup.store_dir(self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @istest
+    def linksSharedFiles(self):
+        v1, v2 = self.tmpdir / "foo" / "1.0-1", self.tmpdir / "foo" / "1.0-2"
+        mk_package(v1, {"README": b"readme\n", "src/main.c": b"int main;\n"})
+        mk_package(v2, {"README": b"readme\n", "src/main.c": b"int main(void);\n"})
+
+        self.assertEqual((0, 0), dedup.dedup_package(v1, self.store))
+        files, nbytes = dedup.dedup_package(v2, self.store)
+        self.assertEqual(1, files)
+        self.assertEqual(os.stat(v2 / "README").st_blocks * 512, nbytes)
+        self.assertTrue(os.path.samefile(v1 / "README", v2 / "README"))
+        self.assertFalse(os.path.samefile(v1 / "src/main.c", v2 / "src/main.c"))
+        self.assertEqual(b"int main(void);\n", (v2 / "src/main.c").read_bytes())
+
+        stats = dedup.store_stats(self.store)
+        self.assertEqual(3, stats["objects"])
+        self.assertEqual(0, stats["orphans"])
+        self.assertEqual(nbytes, stats["saved"])
+
+    @istest
+    def removalReleasesObjects(self):
+        v1, v2 = self.tmpdir / "foo" / "1.0-1", self.tmpdir / "foo" / "1.0-2"
+        mk_package(v1, {"README": b"readme\n", "NEWS": b"1.0-1\n"})
+        mk_package(v2, {"README": b"readme\n"})
+        dedup.dedup_package(v1, self.store)
+        dedup.dedup_package(v2, self.store)
+
+        fs_storage.remove_package(None, v1, self.store)
+        self.assertEqual(
+            [dedup.object_path(self.store, dedup.hashutil.sha256sum(v2 / "README"))],
+            [path for path, _is_object in dedup.walk_store(self.store)],
+        )
+        fs_storage.remove_package(None, v2, self.store)
+        self.assertEqual(0, dedup.store_stats(self.store)["objects"])
+
+    @istest
+    def trashedPackagesAreReleasedWhenReaped(self):
+        v1 = self.tmpdir / "main" / "f" / "foo" / "1.0-1"
+        mk_package(v1, {"README": b"readme\n"})
+        dedup.dedup_package(v1, self.store)
+        trash = fs_storage.trash_dir(self.tmpdir)
+
+        fs_storage.remove_package(None, v1, self.store, trash)
+        self.assertFalse(v1.exists())
+        self.assertFalse(v1.parent.exists())
+        [(entry, pkgdirs)] = list(fs_storage.trash_entries(trash))
+        self.assertEqual([Path("main/f/foo/1.0-1")], pkgdirs)
+        self.assertEqual(1, dedup.store_stats(self.store)["objects"])
+
+        self.assertEqual(1, fs_storage.reap_trash(trash, self.store))
+        self.assertEqual([], list(fs_storage.trash_entries(trash)))
+        self.assertEqual(0, dedup.store_stats(self.store)["objects"])
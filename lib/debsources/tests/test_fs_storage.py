@@ -11,12 +11,20 @@
 # https://salsa.debian.org/qa/debsources/blob/master/COPYING
 
 
+import difflib
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
 import unittest
+from pathlib import Path
 
 from nose.plugins.attrib import attr
 from nose.tools import istest
 
-from debsources.fs_storage import parse_path, walk
+from debsources.debmirror import SourcePackage
+from debsources.fs_storage import extract_package, parse_path, walk
 from debsources.tests.testdata import TEST_DATA_DIR
 
 
@@ -60,3 +68,222 @@ class FsStorageTests(unittest.TestCase):
                 "ext": ".checksums",
             },
         )
+
+
+# upstream tree of the test packages of IncrementalExtractionTests
+UPSTREAM_FILES = {
+    "README": "foo, the upstream README\n",
+    "configure": "#!/bin/sh\necho configured\n",
+    "src/main.c": "int main(void) {\n    return 0;\n}\n",
+    "src/util.c": "int util(void) {\n    return 1;\n}\n",
+    "doc/manual.txt": "the manual\n",
+    "doc/obsolete.txt": "obsolete documentation\n",
+}
+
+# quilt patches of the test packages, by version: <name, {relpath: content}>
+# pairs, where content None stands for a deleted file
+PATCHES = {
+    "1.0-1": [
+        (
+            "fix-util.patch",
+            {
+                "src/util.c": "int util(void) {\n    return 2;\n}\n",
+                "src/v1-only.c": "int v1_only;\n",
+                "doc/manual.txt": None,
+            },
+        ),
+    ],
+    "1.0-2": [
+        (
+            "update-readme.patch",
+            {
+                "README": "foo, the patched README\n",
+                "src/main.c": "int main(void) {\n    return 42;\n}\n",
+            },
+        ),
+        (
+            "add-plugin.patch",
+            {
+                "src/plugins/core/plugin.c": "int plugin;\n",
+                "src/new.c": "int new;\n",
+            },
+        ),
+        ("drop-obsolete-doc.patch", {"doc/obsolete.txt": None}),
+    ],
+}
+
+
+def mk_patch(tree: Path, changes):
+    """unified diff applying `changes` (see PATCHES) to `tree`, in which the
+    previous patches are applied"""
+    diff = []
+    for relpath, content in sorted(changes.items()):
+        old_path = tree / relpath
+        old = old_path.read_text().splitlines(True) if old_path.exists() else []
+        new = content.splitlines(True) if content is not None else []
+        diff += difflib.unified_diff(
+            old,
+            new,
+            "a/" + relpath if old else "/dev/null",
+            "b/" + relpath if content is not None else "/dev/null",
+        )
+        if content is None:
+            old_path.unlink()
+        else:
+            old_path.parent.mkdir(parents=True, exist_ok=True)
+            old_path.write_text(content)
+    return "".join(diff)
+
+
+def snapshot(tree: Path):
+    """map paths in `tree` to their type, mode and content"""
+    entries = {}
+    for root, dirs, files in os.walk(tree):
+        for name in dirs + files:
+            path = Path(root) / name
+            st = path.lstat()
+            if stat.S_ISLNK(st.st_mode):
+                content = os.readlink(path)
+            elif stat.S_ISREG(st.st_mode):
+                content = path.read_bytes()
+            else:
+                content = None
+            entries[path.relative_to(tree)] = (st.st_mode, content)
+    return entries
+
+
+@attr("fs_storage")
+@attr("slow")
+class IncrementalExtractionTests(unittest.TestCase):
+    """Unit tests for incremental extraction (see fs_storage.extract_package)"""
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(suffix=".debsources-test"))
+        self.mirror = self.tmpdir / "mirror"
+        self.mirror.mkdir()
+        upstream = self.tmpdir / "build" / "foo-1.0"
+        for relpath, content in UPSTREAM_FILES.items():
+            (upstream / relpath).parent.mkdir(parents=True, exist_ok=True)
+            (upstream / relpath).write_text(content)
+        (upstream / "configure").chmod(0o755)
+        subprocess.check_call(
+            ["tar", "-czf", self.mirror / "foo_1.0.orig.tar.gz", "foo-1.0"],
+            cwd=upstream.parent,
+        )
+        self.pkgs = {
+            version: self.mk_package(version, "3.0 (quilt)")
+            for version in ["1.0-1", "1.0-2"]
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def mk_package(self, version, source_format):
+        """build version `version` of source package foo in the mirror"""
+        builddir = self.tmpdir / "build"
+        tree = builddir / "foo-1.0"
+        subprocess.check_call(
+            ["tar", "-xzf", self.mirror / "foo_1.0.orig.tar.gz"], cwd=builddir
+        )
+        shutil.copy(self.mirror / "foo_1.0.orig.tar.gz", builddir)
+        debian = tree / "debian"
+        (debian / "source").mkdir(parents=True)
+        (debian / "source" / "format").write_text(source_format + "\n")
+        (debian / "control").write_text(
+            "Source: foo\nSection: misc\nMaintainer: A <a@example.org>\n\n"
+            "Package: foo\nArchitecture: all\nDescription: foo\n foo\n"
+        )
+        (debian / "changelog").write_text(
+            "foo (%s) unstable; urgency=low\n\n  * Test.\n\n"
+            " -- A <a@example.org>  Mon, 01 Jan 2024 00:00:00 +0000\n" % version
+        )
+        (debian / "rules").write_text("#!/usr/bin/make -f\n")
+        (debian / "rules").chmod(0o755)
+        if source_format == "3.0 (quilt)":
+            patched = builddir / "patched"
+            shutil.copytree(tree, patched, symlinks=True)
+            (debian / "patches").mkdir()
+            series = []
+            for name, changes in PATCHES[version]:
+                (debian / "patches" / name).write_text(mk_patch(patched, changes))
+                series.append(name)
+            (debian / "patches" / "series").write_text("\n".join(series) + "\n")
+        subprocess.check_call(
+            ["dpkg-source", "-b", "foo-1.0"],
+            cwd=builddir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        for path in self.mirror.glob("foo_%s.*" % version):
+            path.unlink()  # rebuilt in another source format
+        files = []
+        for path in sorted(builddir.glob("foo_%s.*" % version)):
+            shutil.move(path, self.mirror)
+            files.append(" 0 0 " + path.name)
+        shutil.rmtree(builddir)
+        builddir.mkdir()
+        return SourcePackage(
+            "Package: foo\nVersion: %s\nDirectory: .\n"
+            "X-Debsources-Mirror-Root: %s\nFiles:\n%s\n"
+            % (version, self.mirror, "\n".join(files))
+        )
+
+    def extract(self, version, bases=[]):
+        """extract `version` to the FS storage, return its extraction dir and
+        whether it has been extracted incrementally"""
+        destdir = self.tmpdir / "sources" / "main" / "f" / "foo" / version
+        extract_package(self.pkgs[version], destdir, bases)
+        log = Path(str(destdir) + ".log").read_text()
+        incremental = "incremental extraction from" in log and "failed" not in log
+        return destdir, incremental
+
+    def full_extraction(self, version):
+        """extract `version` with a plain dpkg-source -x"""
+        destdir = self.tmpdir / "reference" / version
+        destdir.parent.mkdir(exist_ok=True)
+        subprocess.check_call(
+            ["dpkg-source", "--no-copy", "--no-check", "-x"]
+            + [self.pkgs[version].dsc_path(), destdir],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return snapshot(destdir)
+
+    def assertExtractedFromBase(self, base, expect_incremental=True):
+        v1_before = snapshot(base)
+        v2, incremental = self.extract("1.0-2", bases=[base])
+        self.assertEqual(expect_incremental, incremental)
+        self.assertEqual(self.full_extraction("1.0-2"), snapshot(v2))
+        # the hardlinked tree of the base is left untouched
+        self.assertEqual(v1_before, snapshot(base))
+
+    @istest
+    def extractsIncrementally(self):
+        v1, incremental = self.extract("1.0-1")
+        self.assertFalse(incremental)
+        self.assertEqual(self.full_extraction("1.0-1"), snapshot(v1))
+        self.assertExtractedFromBase(v1)
+
+    @istest
+    def skipsBaseNotDone(self):
+        v1, _ = self.extract("1.0-1")
+        Path(str(v1) + ".done").unlink()
+        self.assertExtractedFromBase(v1, expect_incremental=False)
+
+    @istest
+    def fallsBackWithoutPatchBackups(self):
+        v1, _ = self.extract("1.0-1")
+        shutil.rmtree(v1 / ".pc" / "fix-util.patch")
+        self.assertExtractedFromBase(v1, expect_incremental=False)
+
+    @istest
+    def skipsNonQuiltBase(self):
+        v1, _ = self.extract("1.0-1")
+        (v1 / "debian" / "source" / "format").write_text("1.0\n")
+        self.assertExtractedFromBase(v1, expect_incremental=False)
+
+    @istest
+    def fallsBackForNonQuiltPackage(self):
+        self.pkgs["1.0-2"] = self.mk_package("1.0-2", "1.0")
+        v1, _ = self.extract("1.0-1")
+        self.assertExtractedFromBase(v1, expect_incremental=False)
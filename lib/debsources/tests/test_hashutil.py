@@ -11,13 +11,16 @@
 # https://salsa.debian.org/qa/debsources/blob/master/COPYING
 
 
+import hashlib
+import os
+import tempfile
 import unittest
 from pathlib import Path
 
 from nose.plugins.attrib import attr
 from nose.tools import istest
 
-from debsources.hashutil import sha256sum
+from debsources.hashutil import HASH_MMAP_THRESHOLD, checksums, sha256sum
 from debsources.tests.testdata import TEST_DATA_DIR
 
 
@@ -36,3 +39,27 @@ class HashutilTests(unittest.TestCase):
             sha256sum(make_path(path)),
             "d10f0447c835a590ef137d99dd0e3ed29b5e032e7434a87315b30402bf14e7fd",
         )
+
+    @istest
+    def assertSha256SumOfLargeFile(self):
+        content = os.urandom(HASH_MMAP_THRESHOLD + 12345)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(content)
+            f.flush()
+            self.assertEqual(sha256sum(f.name), hashlib.sha256(content).hexdigest())
+
+    @istest
+    def assertMultipleChecksums(self):
+        for size in [0, 42, HASH_MMAP_THRESHOLD + 12345]:
+            content = os.urandom(size)
+            with tempfile.NamedTemporaryFile() as f:
+                f.write(content)
+                f.flush()
+                self.assertEqual(
+                    checksums(f.name, ["sha256", "sha1", "md5"]),
+                    {
+                        "sha256": hashlib.sha256(content).hexdigest(),
+                        "sha1": hashlib.sha1(content).hexdigest(),
+                        "md5": hashlib.md5(content).hexdigest(),
+                    },
+                )
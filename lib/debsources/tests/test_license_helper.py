@@ -0,0 +1,75 @@
+# Copyright (C) 2026  The Debsources developers
+# <qa-debsources@lists.alioth.debian.org>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/AUTHORS
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/COPYING
+
+import io
+import unittest
+
+from debian import copyright
+from nose.plugins.attrib import attr
+from nose.tools import istest
+
+from debsources.license_helper import FilesMatcher
+
+COPYRIGHT = """\
+Format: https://www.debian.org/doc/packaging-manuals/copyright-format/1.0/
+
+Files: *
+Copyright: 2026 Upstream
+License: GPL-2+
+
+Files: src/* doc/manual.txt
+Copyright: 2026 Upstream
+License: BSD-3-clause
+
+Files: src/compat/*.c src/main.c
+Copyright: 2026 Other
+License: MIT
+
+Files: src/*.h
+Copyright: 2026 Upstream
+License: LGPL-2.1
+
+Files: debian/*
+Copyright: 2026 Maintainer
+License: GPL-2+
+"""
+
+
+@attr("copyright")
+class FilesMatcherTests(unittest.TestCase):
+    """Unit tests for license_helper.FilesMatcher"""
+
+    @istest
+    def lastMatchingParagraphWins(self):
+        c = copyright.Copyright(io.StringIO(COPYRIGHT))
+        matcher = FilesMatcher(c)
+        for path in [
+            "README",
+            "src/main.c",
+            "src/util.c",
+            "src/util.h",
+            "src/compat/util.c",
+            "src/compat/util.h",
+            "doc/manual.txt",
+            "doc/manual.txt.orig",
+            "debian/rules",
+            "debian",
+        ]:
+            paragraph = matcher.find_files_paragraph(path)
+            self.assertIs(c.find_files_paragraph(path), paragraph)
+        self.assertEqual(
+            "MIT", matcher.find_files_paragraph("src/main.c").license.synopsis
+        )
+        self.assertEqual(
+            "LGPL-2.1",
+            matcher.find_files_paragraph("src/compat/util.h").license.synopsis,
+        )
@@ -0,0 +1,51 @@
+# Copyright (C) 2026  The Debsources developers
+# <qa-debsources@lists.alioth.debian.org>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/AUTHORS
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/COPYING
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from nose.plugins.attrib import attr
+from nose.tools import istest
+
+from debsources.plugins.hook_metrics import compute_metrics
+
+
+@attr("metrics")
+class MetricsTests(unittest.TestCase):
+    """Unit tests for the metrics hook"""
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(suffix=".debsources-test"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @istest
+    def sizeMatchesDu(self):
+        pkgdir = self.tmpdir / "foo" / "1.0-1"
+        (pkgdir / "src" / "empty").mkdir(parents=True)
+        (pkgdir / "README").write_text("readme\n")
+        (pkgdir / "src" / "main.c").write_bytes(b"x" * 10000)
+        os.link(pkgdir / "src" / "main.c", pkgdir / "src" / "main-link.c")
+        os.symlink("README", pkgdir / "LINK")
+
+        metrics = compute_metrics(pkgdir)
+        du = subprocess.check_output(["du", "--summarize", pkgdir])
+        du_bytes = subprocess.check_output(["du", "--summarize", "--bytes", pkgdir])
+        self.assertEqual(int(du.split()[0]), metrics["size"])
+        self.assertEqual(int(du_bytes.split()[0]), metrics["apparent_size"])
+        self.assertEqual(4, metrics["files"])
+        self.assertEqual(10000, metrics["max_file_size"])
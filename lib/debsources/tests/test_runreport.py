@@ -0,0 +1,67 @@
+# Copyright (C) 2026  The Debsources developers
+# <qa-debsources@lists.alioth.debian.org>.
+# See the AUTHORS file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/AUTHORS
+#
+# This file is part of Debsources. Debsources is free software: you can
+# redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.  For more information
+# see the COPYING file at the top-level directory of this distribution and at
+# https://salsa.debian.org/qa/debsources/blob/master/COPYING
+
+
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from nose.plugins.attrib import attr
+from nose.tools import istest
+
+from debsources.runreport import RunReport
+
+
+@attr("runreport")
+class RunReportTests(unittest.TestCase):
+    """Unit tests for debsources.runreport"""
+
+    @istest
+    def keepsSlowestPackages(self):
+        report = RunReport(top=2)
+        for pkg, elapsed in [("foo/1", 3.0), ("bar/1", 1.0), ("baz/1", 2.0)]:
+            with report.package(pkg, "add-package", {"time": elapsed, "hooks": {}}):
+                report.hook("add-package", "ctags", elapsed / 2)
+        self.assertEqual(
+            ["foo/1", "baz/1"],
+            [entry["package"] for entry in report.slowest_packages],
+        )
+        self.assertEqual({"ctags": 1.5}, report.slowest_packages[0]["hooks"])
+        self.assertEqual({"calls": 3, "time": 3.0}, report.hooks["add-package/ctags"])
+
+    @istest
+    def countsWorkerHookCallsOnce(self):
+        report = RunReport()
+        worker_timings = {"time": 2.0, "hooks": {"ctags": 1.0}}
+        with report.package("foo/1", "add-package", worker_timings):
+            # DB side of the hook, run after its FS side in a worker
+            report.hook("add-package", "ctags", 0.5)
+        self.assertEqual({"calls": 1, "time": 1.5}, report.hooks["add-package/ctags"])
+        self.assertEqual({"ctags": 1.5}, report.slowest_packages[0]["hooks"])
+
+    @istest
+    def savesJsonReport(self):
+        tmpdir = Path(tempfile.mkdtemp(suffix=".debsources-test"))
+        try:
+            report = RunReport()
+            with report.stage("extract"):
+                report.hook("add-package", "sloccount", 0.5)
+            report.save(tmpdir / "report.json")
+            with (tmpdir / "report.json").open() as f:
+                saved = json.load(f)
+            self.assertEqual(["extract"], [s["stage"] for s in saved["stages"]])
+            self.assertEqual(1, saved["hooks"]["add-package/sloccount"]["calls"])
+            self.assertEqual([], saved["slowest_packages"])
+        finally:
+            shutil.rmtree(tmpdir)
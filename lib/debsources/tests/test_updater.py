@@ -12,6 +12,8 @@
 
 
 import glob
+import hashlib
+import json
 import logging
 import os
 import shutil
@@ -24,7 +26,16 @@ import sqlalchemy
 from nose.plugins.attrib import attr
 from nose.tools import istest
 
-from debsources import db_storage, mainlib, models, statistics, updater
+from debsources import (
+    aggregates,
+    db_storage,
+    mainlib,
+    models,
+    rollups,
+    runreport,
+    statistics,
+    updater,
+)
 from debsources.subprocess_workaround import subprocess_setup
 from debsources.tests.db_testing import DB_COMPARE_QUERIES, DbTestFixture
 from debsources.tests.testdata import TEST_DATA_DIR
@@ -95,6 +106,22 @@ def assert_dir_equal(test_subj, dir1, dir2, exclude=[]):
     test_subj.assertTrue(dir_eq, "file system storages differ")
 
 
+def assert_hook_outputs_equal(test_subj, exts, dir1, dir2):
+    """compare the hook outputs (files with extensions `exts`) of two FS
+    storages, ignoring line order, which follows os.walk() order"""
+    for ext in exts:
+        paths1 = sorted(path.relative_to(dir1) for path in dir1.rglob("*" + ext))
+        paths2 = sorted(path.relative_to(dir2) for path in dir2.rglob("*" + ext))
+        test_subj.assertTrue(paths1, "no %s hook output" % ext)
+        test_subj.assertEqual(paths1, paths2)
+        for relpath in paths1:
+            test_subj.assertEqual(
+                sorted((dir1 / relpath).read_bytes().splitlines()),
+                sorted((dir2 / relpath).read_bytes().splitlines()),
+                "hook output %s differs" % relpath,
+            )
+
+
 @attr("infra")
 @attr("postgres")
 @attr("slow")
@@ -138,6 +165,107 @@ class Updater(unittest.TestCase, DbTestFixture):
 
         assert_db_schema_equal(self, "ref", "public")
 
+    @istest
+    def extractsInParallel(self):
+        db_mv_tables_to_schema(self.session, "ref")
+        self.conf["extract_workers"] = 2
+        self.do_update()
+
+        # hooks run in workers, then in the DB writer, count as a single call
+        packages = self.session.execute("SELECT count(*) FROM packages").scalar()
+        with (self.conf["cache_dir"] / runreport.REPORT_FILE).open() as f:
+            hooks = json.load(f)["hooks"]
+        for hook in self.conf["hooks"]:
+            self.assertEqual(packages, hooks["add-package/" + hook]["calls"])
+
+        exclude_pat = ["*" + ext for ext in self.conf["file_exts"]] + ["*.log"]
+        assert_dir_equal(
+            self,
+            self.tmpdir / "sources",
+            TEST_DATA_DIR / "sources",
+            exclude=exclude_pat,
+        )
+        assert_db_schema_equal(self, "ref", "public")
+
+    @istest
+    def parallelExtractionFailureSkipsPackage(self):
+        BROKEN_PACKAGE = ("ocaml-curses", "1.0.3-1")
+
+        # break the package in a fresh copy of the mirror, so that its
+        # extraction fails in a worker
+        new_mirror = self.tmpdir / "mirror2"
+        shutil.copytree(TEST_DATA_DIR / "mirror", new_mirror)
+        self.conf["mirror_dir"] = new_mirror
+        [dsc] = new_mirror.glob("pool/*/*/{0}/{0}_{1}.dsc".format(*BROKEN_PACKAGE))
+        dsc.unlink()
+
+        db_mv_tables_to_schema(self.session, "ref")
+        self.conf["extract_workers"] = 2
+        self.do_update()
+        self.assertFalse(
+            db_storage.lookup_package(self.session, *BROKEN_PACKAGE),
+            "package %s/%s added despite failed extraction" % BROKEN_PACKAGE,
+        )
+        # other packages are added as usual
+        count_q = "SELECT count(*) FROM %s.packages"
+        self.assertEqual(
+            self.session.execute(count_q % "ref").scalar() - 1,
+            self.session.execute(count_q % "public").scalar(),
+        )
+
+    @istest
+    def concurrentHookPhasesMatchSerialRun(self):
+        db_mv_tables_to_schema(self.session, "ref")
+        serial_sources = self.tmpdir / "sources-serial"
+        self.conf["sources_dir"] = serial_sources
+        self.conf["hook_workers"] = 1
+        self.do_update()
+        db_mv_tables_to_schema(self.session, "serial")
+
+        self.conf["sources_dir"] = self.tmpdir / "sources"
+        self.conf["hook_workers"] = 4
+        self.do_update()
+        phased = [
+            title
+            for title, action in self.conf["observers"]["add-package"]
+            if isinstance(action, updater.PhasedHook)
+        ]
+        self.assertGreater(len(phased), 1)
+        assert_hook_outputs_equal(
+            self, self.conf["file_exts"], serial_sources, self.tmpdir / "sources"
+        )
+        assert_db_schema_equal(self, "serial", "public")
+
+    @istest
+    def failingHookPhaseRollsBackPackage(self):
+        FAILING_PACKAGE = "ocaml-curses"
+
+        def failing_fs_phase(pkg, pkgdir, file_table):
+            if pkg["package"] == FAILING_PACKAGE:
+                raise RuntimeError("FS phase failure")
+
+        db_mv_tables_to_schema(self.session, "ref")
+        self.conf["hook_workers"] = 4
+        mainlib.init_logging(self.conf, console_verbosity=logging.WARNING)
+        obs, exts = mainlib.load_hooks(self.conf)
+        obs["add-package"].append(
+            ("failing", updater.PhasedHook(lambda *args: None, failing_fs_phase))
+        )
+        self.conf["observers"], self.conf["file_exts"] = obs, exts
+        updater.update(self.conf, self.session, self.TEST_STAGES)
+
+        packages_q = (
+            "SELECT count(*) FROM %s.packages p, %s.package_names n "
+            "WHERE p.name_id = n.id AND n.name %s '" + FAILING_PACKAGE + "'"
+        )
+        self.assertEqual(
+            0, self.session.execute(packages_q % ("public", "public", "=")).scalar()
+        )
+        self.assertEqual(
+            self.session.execute(packages_q % ("ref", "ref", "!=")).scalar(),
+            self.session.execute(packages_q % ("public", "public", "!=")).scalar(),
+        )
+
     @istest
     def producesReferenceSourcesTxt(self):
         def parse_sources_txt(fname):
@@ -227,6 +355,8 @@ class Updater(unittest.TestCase, DbTestFixture):
             db_storage.lookup_package(self.session, *GC_PACKAGE),
             "gone package %s/%s persisted in DB storage" % GC_PACKAGE,
         )
+        # incrementally maintained aggregates account for the removal
+        self.assertEqual([], aggregates.check(self.session))
 
     @istest
     def excludeFiles(self):
@@ -265,6 +395,42 @@ Action: remove""" % (
             self.session.delete(pkg)
         self.do_update()
         self.assertFalse(glob.glob(str(excluded_paths)))
+        # per-package file counters do not account for excluded files
+        for pkg in pkgs:
+            self.assertEqual(
+                self.session.query(models.File).filter_by(package_id=pkg.id).count(),
+                self.session.query(models.PackageCounter.value)
+                .filter_by(package_id=pkg.id, counter="files")
+                .scalar(),
+            )
+
+    @istest
+    def forcedChecksumsTriggerAddsDigests(self):
+        # the test DB and sources predate extra digests: sha1 and md5 are NULL
+        orig_sources = TEST_DATA_DIR / "sources"
+        dest_sources = self.tmpdir / "sources"
+        shutil.copytree(orig_sources, dest_sources)
+        self.conf["force_triggers"] = [("add-package", "checksums")]
+        self.do_update()
+
+        checksums = self.session.query(models.Checksum)
+        self.assertEqual(
+            0,
+            checksums.filter(
+                sqlalchemy.or_(
+                    models.Checksum.sha1.is_(None), models.Checksum.md5.is_(None)
+                )
+            ).count(),
+        )
+        checksum = checksums.first()
+        file_ = self.session.query(models.File).get(checksum.file_id)
+        db_package = self.session.query(models.Package).get(checksum.package_id)
+        [pkgdir] = glob.glob(
+            str(dest_sources / "*" / "*" / db_package.name.name / db_package.version)
+        )
+        content = (Path(pkgdir) / file_.path).read_bytes()
+        self.assertEqual(hashlib.sha1(content).hexdigest(), checksum.sha1)
+        self.assertEqual(hashlib.md5(content).hexdigest(), checksum.md5)
 
 
 @attr("infra")
@@ -326,6 +492,14 @@ class MetadataCache(unittest.TestCase, DbTestFixture):
         }
         self.assertDictContainsSubset(expected_stats, self.stats)
 
+    @istest
+    def historyIsRolledUp(self):
+        for granularity in rollups.GRANULARITIES:
+            sample = getattr(statistics, "history_size_" + granularity)(
+                self.session, "ctags", rollups.RETENTION[granularity], "sid"
+            )
+            self.assertEqual(self.stats["debian_sid.ctags"], sample[0][1])
+
     @istest
     def licenseStatsMatchReferenceDb(self):
         license_stats_data = self.conf["cache_dir"] / "license_stats.data"
@@ -342,3 +516,75 @@ class MetadataCache(unittest.TestCase, DbTestFixture):
         }
 
         self.assertDictContainsSubset(expected_stats, license_stats)
+
+
+@attr("infra")
+class NotifyPlugins(unittest.TestCase):
+    """tests for the notification of Python hooks"""
+
+    @istest
+    def failingFsPhaseIsReraised(self):
+        calls = []
+
+        def fs_phase(title, fail=False):
+            def run(pkg, pkgdir, file_table):
+                calls.append(title)
+                if fail:
+                    raise RuntimeError("FS phase failure")
+
+            return run
+
+        def action(session, pkg, pkgdir, file_table):
+            calls.append("action")
+
+        observers = {
+            "add-package": [
+                ("good", updater.PhasedHook(action, fs_phase("good"))),
+                ("bad", updater.PhasedHook(action, fs_phase("bad", fail=True))),
+            ]
+        }
+        pkg = {"package": "foo", "version": "1.0-1"}
+        with self.assertRaises(RuntimeError):
+            updater.notify_plugins(
+                observers, "add-package", None, pkg, Path("foo"), fs_workers=2
+            )
+        # all FS phases completed, no hook action was run
+        self.assertEqual(["bad", "good"], sorted(calls))
+
+
+@attr("infra")
+class ShellHooks(unittest.TestCase):
+    """tests for the selection of shell hooks"""
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(suffix=".debsources-test"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def mk_hook(self, name, mode=0o755):
+        path = self.tmpdir / name
+        path.write_text("#!/bin/sh\n")
+        path.chmod(mode)
+
+    @istest
+    def selectsHooksLikeRunParts(self):
+        for name in ["50-ctags", "10_sloccount", "20-Foo"]:
+            self.mk_hook(name)
+        self.mk_hook("30-hook.sh")  # names with dots are skipped
+        self.mk_hook("35-backup~")
+        self.mk_hook(".40-hidden")
+        self.mk_hook("45-disabled", mode=0o644)  # not executable
+        (self.tmpdir / "05-subdir").mkdir()
+
+        expected = tuple(
+            self.tmpdir / name for name in ["10_sloccount", "20-Foo", "50-ctags"]
+        )
+        self.assertEqual(expected, updater.list_shell_hooks(self.tmpdir))
+        # hooks are listed once, upon first use
+        self.mk_hook("60-late")
+        self.assertEqual(expected, updater.list_shell_hooks(self.tmpdir))
+
+    @istest
+    def noHooksWithoutDirectory(self):
+        self.assertEqual((), updater.list_shell_hooks(self.tmpdir / "missing.d"))
@@ -14,6 +14,8 @@
 import datetime
 import json
 import os
+import shutil
+import tempfile
 import unittest
 from pathlib import Path
 
@@ -620,6 +622,27 @@ class DebsourcesTestCase(DebsourcesBaseWebTests, unittest.TestCase):
         self.assertIn("ansic", rv["languages"])
         self.assertEqual(rv["results"]["debian_sid.sloccount.ansic"], 208800)
 
+    def test_stats_trend_chart(self):
+        config = self.app_wrapper.app.config
+        cache_dir = config["CACHE_DIR"]
+        config["CACHE_DIR"] = Path(tempfile.mkdtemp(suffix=".debsources-test"))
+        try:
+            rv = self.app.get("/stats/sid/trends/ctags/1-year.png")
+            self.assertEqual(200, rv.status_code)
+            self.assertEqual("image/png", rv.mimetype)
+            chart = config["CACHE_DIR"] / "charts" / "sid-ctags-1-year.png"
+            self.assertEqual(chart.read_bytes(), rv.data)
+            if config.get("BLUEPRINT_COPYRIGHT"):
+                rv = self.app.get("/copyright/stats/ALL/trends/5-years.svg")
+                self.assertEqual("image/svg+xml", rv.mimetype)
+            rv = self.app.get("/stats/nosuchsuite/trends/ctags/1-year.png")
+            self.assertEqual(404, rv.status_code)
+            rv = self.app.get("/stats/sid/trends/license/1-year.png")
+            self.assertEqual(404, rv.status_code)
+        finally:
+            shutil.rmtree(config["CACHE_DIR"])
+            config["CACHE_DIR"] = cache_dir
+
     def test_suggestions_when_404(self):
         rv = self.app.get("/src/libcaca/0.NOPE.beta17-1/src/cacaview.c")
         self.assertIn(b"other versions of this package are available", rv.data)
@@ -29,6 +29,15 @@ def mk_conf(tmpdir: Path):
         "single_transaction": "true",
         "dry_run": False,
         "expire_days": 0,
+        "extract_workers": 1,
+        "sources_workers": 1,
+        "hook_workers": 1,
+        "charts_workers": 1,
+        "bulk_flush_threshold": 20000,
+        "checksum_digests": ["sha256", "sha1", "md5"],
+        "metrics": ["size"],
+        "dedup": False,
+        "extract_incremental": False,
         "force_triggers": "",
         "hooks": ["sloccount", "checksums", "ctags", "metrics", "copyright"],
         "mirror_dir": TEST_DATA_DIR / "mirror",
@@ -11,18 +11,34 @@
 # https://salsa.debian.org/qa/debsources/blob/master/COPYING
 
 
+import concurrent.futures
+import contextlib
+import functools
 import glob
 import logging
+import multiprocessing
 import os
+import re
 import subprocess
+import threading
+import time
+from collections import defaultdict
 from datetime import datetime
 from email.utils import formatdate
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 
 from sqlalchemy import not_, sql
-
-from debsources import db_storage, fs_storage, statistics
+from sqlalchemy.orm import joinedload
+
+from debsources import (
+    aggregates,
+    db_storage,
+    dedup,
+    fs_storage,
+    rollups,
+    statistics,
+)
 from debsources.consts import DEBIAN_RELEASES, SLOCCOUNT_LANGUAGES
 from debsources.debmirror import SourceMirror, SourcePackage
 from debsources.models import (
@@ -34,6 +50,7 @@ from debsources.models import (
     SuiteAlias,
     SuiteInfo,
 )
+from debsources.runreport import REPORT_FILE, RunReport
 from debsources.subprocess_workaround import subprocess_setup
 
 from . import query as qry
@@ -44,12 +61,25 @@ NO_OBSERVERS = {e: [] for e in KNOWN_EVENTS}
 # maximum number of pending rows before performing a (bulk) insert
 BULK_FLUSH_THRESHOLD = 50000
 
+# names of the shell hooks that will be run, same as RUN-PARTS(8) default
+SHELL_HOOK_RE = re.compile(r"^[a-zA-Z0-9_-]+$")
+
 
 class UpdateStatus:
     """store update status during update runs"""
 
     def __init__(self):
         self._sources = {}
+        self._package_ids = None
+        self.report = RunReport()  # timings of the update run
+        self.reaper = None  # thread deleting removed packages, see reap_trash
+
+    def wait_for_reaper(self):
+        """wait for the trash reaper thread, if any, to complete"""
+        if self.reaper is not None:
+            logging.info("wait for trash reaper...")
+            self.reaper.join()
+            self.reaper = None
 
     @property
     def sources(self):
@@ -65,12 +95,62 @@ class UpdateStatus:
     def sources(self, new_sources):
         self._sources = new_sources
 
+    def package_ids(self, session):
+        """index of the packages in the DB (see `db_storage.package_ids`)
+
+        the index is loaded via `session` upon first use, and then kept up to
+        date by the update stages as packages are added and removed
+
+        """
+        if self._package_ids is None:
+            self._package_ids = db_storage.package_ids(session)
+        return self._package_ids
+
+
+class PhasedHook(object):
+    """a hook action that declares an independent FS phase
+
+    `fs_phase(pkg, pkgdir, file_table)` only writes the hook output to FS
+    storage: it neither uses the DB, nor depends on other hooks. `action`
+    (with the usual hook signature) does the whole job, skipping FS work whose
+    output already exists. This allows running the FS phases of several hooks
+    concurrently, before running their actions serially (see `notify_plugins`)
+
+    """
+
+    def __init__(self, action, fs_phase):
+        self.action = action
+        self.fs_phase = fs_phase
+
+    def __call__(self, session, pkg, pkgdir, file_table):
+        return self.action(session, pkg, pkgdir, file_table)
+
 
 # TODO fill tables: BinaryPackage, BinaryVersion
 # TODO get rid of shell hooks; they shall die a horrible death
 
 
-def notify(conf, event, session, pkg, pkgdir, file_table=None):
+@functools.lru_cache(maxsize=None)
+def list_shell_hooks(hooks_dir: Path) -> Tuple[Path, ...]:
+    """list the shell hooks contained in `hooks_dir`
+
+    hooks are selected and sorted as RUN-PARTS(8) would do: executable files
+    with names matching SHELL_HOOK_RE, in lexical order. The directory is
+    scanned only once, upon first use
+
+    """
+    if not hooks_dir.is_dir():
+        return ()
+    return tuple(
+        hooks_dir / name
+        for name in sorted(os.listdir(hooks_dir))
+        if SHELL_HOOK_RE.match(name)
+        and (hooks_dir / name).is_file()
+        and os.access(hooks_dir / name, os.X_OK)
+    )
+
+
+def notify(conf, event, session, pkg, pkgdir, file_table=None, report=None):
     """notify (Python and shell) hooks of occurred events
 
     Currently supported events:
@@ -100,57 +180,126 @@ def notify(conf, event, session, pkg, pkgdir, file_table=None):
       If None, the hook will have to redo the scanning work.
 
     Shell hoks re invoked with the following arguments: pkgdir, package name,
-    package version
+    package version. They are run in lexical order (see `list_shell_hooks`),
+    stopping at the first failing one
+
+    If given, `report` (a runreport.RunReport) is told how long hooks took
 
     """
     logging.debug("notify {} for {}".format(event, pkg))
     package, version = pkg["package"], pkg["version"]
-    # TODO: useless, they were removed
-    cmd = [
-        "run-parts",
-        "--exit-on-error",
-        "--arg",
-        pkgdir,
-        "--arg",
-        package,
-        "--arg",
-        version,
-        conf["bin_dir"] / f"{event}.d",
-    ]
 
-    # fire shell hooks
-    try:
-        subprocess.check_output(
-            cmd, stderr=subprocess.STDOUT, preexec_fn=subprocess_setup
-        )
-    except subprocess.CalledProcessError as e:
-        logging.error(
-            "shell hooks for %s on %s returned exit code %d."
-            " Output: %s" % (event, pkg, e.returncode, e.output)
-        )
-        raise e
+    # fire shell hooks, if any
+    hooks = list_shell_hooks(conf["bin_dir"] / f"{event}.d")
+    start = time.perf_counter()
+    for hook in hooks:
+        try:
+            subprocess.check_output(
+                [hook, pkgdir, package, version],
+                stderr=subprocess.STDOUT,
+                preexec_fn=subprocess_setup,
+            )
+        except subprocess.CalledProcessError as e:
+            logging.error(
+                "shell hook %s for %s on %s returned exit code %d."
+                " Output: %s" % (hook.name, event, pkg, e.returncode, e.output)
+            )
+            raise e
+    if hooks and report is not None:
+        report.hook(event, "shell", time.perf_counter() - start)
 
     notify_plugins(
-        conf["observers"], event, session, pkg, pkgdir, file_table=file_table
+        conf["observers"],
+        event,
+        session,
+        pkg,
+        pkgdir,
+        file_table=file_table,
+        report=report,
+        fs_workers=conf["hook_workers"],
     )
 
 
+def _run_fs_phases(event, fs_phases, pkg, pkgdir, file_table, workers):
+    """run the FS phases of hooks (see `PhasedHook`) concurrently, in a pool
+    of `workers` threads
+
+    `fs_phases` is a list of <title, fs_phase> pairs. Return a dictionary
+    mapping titles to the time their FS phase took. Once all phases have
+    completed, re-raise the first failure (in `fs_phases` order), if any
+
+    """
+
+    def run_phase(fs_phase):
+        start = time.perf_counter()
+        fs_phase(pkg, pkgdir, file_table)
+        return time.perf_counter() - start
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        futures = [
+            (title, executor.submit(run_phase, fs_phase))
+            for title, fs_phase in fs_phases
+        ]
+    elapsed = {}
+    for title, future in futures:
+        try:
+            elapsed[title] = future.result()
+        except Exception:
+            logging.error("plugin hooks for {} on {} failed".format(event, pkg))
+            raise
+    return elapsed
+
+
 def notify_plugins(
-    observers, event, session, pkg, pkgdir, triggers=None, dry=False, file_table=None
+    observers,
+    event,
+    session,
+    pkg,
+    pkgdir,
+    triggers=None,
+    dry=False,
+    file_table=None,
+    report=None,
+    fs_workers=1,
 ):
     """notify Python hooks of occurred events
 
     If triggers is not None, only Python hooks whose names are listed in them
     will be triggered. Note: shell hooks will not be triggered in that case.
+
+    If fs_workers is greater than 1, the FS phases declared by hooks (see
+    `PhasedHook`) are first run concurrently in that many threads; hook
+    actions, and hence all DB work, are then run serially, in subscription
+    order, within `session`.
+
+    If given, `report` (a runreport.RunReport) is told how long each hook took
     """
+    fs_elapsed = {}
+    if triggers is None and fs_workers > 1:
+        fs_phases = [
+            (title, action.fs_phase)
+            for title, action in observers[event]
+            if isinstance(action, PhasedHook)
+        ]
+        if len(fs_phases) > 1:
+            fs_elapsed = _run_fs_phases(
+                event, fs_phases, pkg, pkgdir, file_table, fs_workers
+            )
+
     for title, action in observers[event]:
         try:
+            start = time.perf_counter()
             if triggers is None:
                 action(session, pkg, pkgdir, file_table)
             elif (event, title) in triggers:
                 logging.info("notify (forced) %s/%s for %s" % (event, title, pkg))
                 if not dry:
                     action(session, pkg, pkgdir, file_table)
+            else:
+                continue
+            if report is not None:
+                elapsed = time.perf_counter() - start + fs_elapsed.get(title, 0.0)
+                report.hook(event, title, elapsed)
         except Exception:
             logging.error("plugin hooks for {} on {} failed".format(event, pkg))
             raise
@@ -169,11 +318,10 @@ def ensure_stats_dir(conf):
     ensure_dir(conf["cache_dir"] / "stats")
 
 
-def exclude_files(session, pkg, pkgdir, file_table, exclude_specs):
-    """remove files matching `exclude_specs` from storage and exclude them from
-    further processing
+def _exclusion_candidates(pkg, exclude_specs):
+    """list files of `pkg` matching file-based `exclude_specs`
 
-    Side effect: excluded files will be removed from `file_table`
+    ASSUMPTION: the package directory is the CWD
 
     """
     # enforce spec's Package field
@@ -190,6 +338,17 @@ def exclude_files(session, pkg, pkgdir, file_table, exclude_specs):
             # ASSUMPTION: `pkgdir` is the CWD; enforced by _add_package
             for relpath in glob.iglob(pat):
                 candidates.append(Path(relpath))
+    return candidates
+
+
+def exclude_files(session, pkg, pkgdir, file_table, exclude_specs):
+    """remove files matching `exclude_specs` from storage and exclude them from
+    further processing
+
+    Side effect: excluded files will be removed from `file_table`
+
+    """
+    candidates = _exclusion_candidates(pkg, exclude_specs)
 
     # remove exclusion candidates from FS and DB storage
     if candidates:
@@ -215,9 +374,27 @@ def is_excluded_package(pkg, exclude_specs):
     return bool(specs)
 
 
-def _add_package(pkg, conf, session, sticky=False):
+def _add_package(
+    pkg,
+    conf,
+    session,
+    sticky=False,
+    extracted=False,
+    package_ids=None,
+    report=None,
+    bases=[],
+):
     """add package `pkg` to both FS and DB storage, and notify plugins
 
+    if `extracted` is set, `pkg` has already been extracted to FS storage
+    (e.g. by an extraction worker, see `extract_new`) and will not be
+    extracted again; otherwise it might be extracted incrementally from
+    `bases` (see `fs_storage.extract_package`)
+
+    if given, the `package_ids` index (see `db_storage.package_ids`) will be
+    updated with the newly added package, and `report` (a runreport.RunReport)
+    will be told about hook timings
+
     handles and logs exceptions
     """
     logging.info("add %s..." % pkg)
@@ -228,7 +405,8 @@ def _add_package(pkg, conf, session, sticky=False):
             logging.warning("package %s has no extracion dir, skipping" % pkg)
             return
         if not conf["dry_run"] and "fs" in conf["backends"]:
-            fs_storage.extract_package(pkg, pkgdir)
+            if not extracted:
+                fs_storage.extract_package(pkg, pkgdir, bases)
             os.chdir(pkgdir)
         with session.begin_nested():
             # single db session for package addition and hook execution: if the
@@ -239,16 +417,120 @@ def _add_package(pkg, conf, session, sticky=False):
                 file_table = db_storage.add_package(session, pkg, pkgdir, sticky)
             exclude_files(session, pkg, pkgdir, file_table, conf["exclude"])
             if not conf["dry_run"] and "hooks" in conf["backends"]:
-                notify(conf, "add-package", session, pkg, pkgdir, file_table)
+                notify(
+                    conf,
+                    "add-package",
+                    session,
+                    pkg,
+                    pkgdir,
+                    file_table,
+                    report=report,
+                )
+            if (
+                not extracted
+                and conf["dedup"]
+                and not conf["dry_run"]
+                and "fs" in conf["backends"]
+            ):
+                _dedup_package(conf, pkg, pkgdir, report)
+            if file_table is not None:  # package newly added to the db
+                db_package = db_storage.lookup_package(
+                    session, pkg["package"], pkg["version"]
+                )
+                aggregates.update_package(session, db_package.id)
+                if package_ids is not None:
+                    package_ids[(pkg["package"], pkg["version"])] = db_package.id
     except Exception:
         logging.exception("failed to add %s" % pkg)
     finally:
         os.chdir(workdir)
 
 
-def _rm_package(pkg, conf, session, db_package=None):
+def _dedup_package(conf, pkg, pkgdir, report=None):
+    """deduplicate the files of freshly extracted package `pkg` against the
+    deduplication store (see `dedup`), telling `report` about saved space"""
+    store = dedup.store_dir(conf["sources_dir"])
+    files, nbytes = dedup.dedup_package(pkgdir, store)
+    logging.debug("dedup %s: %d files linked, %d bytes saved" % (pkg, files, nbytes))
+    if report is not None:
+        report.deduplicated(files, nbytes)
+
+
+# configuration of extraction workers, see `_init_extract_worker`
+_worker_conf = None
+
+
+def _init_extract_worker(conf):
+    """initialize an extraction worker process
+
+    workers only act on FS storage: DB-related backends are disabled in the
+    worker copy of `conf`. As plugins keep a reference to the very same
+    configuration dictionary, this requires the "fork" start method
+
+    """
+    global _worker_conf
+    conf["backends"] = conf["backends"] - set(["db", "hooks.db"])
+    _worker_conf = conf
+
+
+def _extract_package_fs(job):
+    """extraction worker: extract a package to FS storage, apply file
+    exclusions, and run the FS side of add-package hooks on it
+
+    `job` is a pair <package, bases>, where the package is passed as its
+    Sources paragraph, as `SourcePackage` instances cannot be pickled, and
+    bases are as per `fs_storage.extract_package`. Return the package timings
+    (see `RunReport.package`) on success, None on failure
+
+    """
+    conf = _worker_conf
+    pkg_paragraph, bases = job
+    pkg = SourcePackage(pkg_paragraph)
+    report = RunReport()
+    workdir: Path = Path.cwd()
+    try:
+        pkgdir = pkg.extraction_dir(conf["sources_dir"])
+        if pkgdir is None:
+            return None
+        with report.package(pkg, "add-package") as timings:
+            fs_storage.extract_package(pkg, pkgdir, bases)
+            os.chdir(pkgdir)
+            for relpath in _exclusion_candidates(pkg, conf["exclude"]):
+                fs_storage.rm_file(pkgdir, relpath)
+            if "hooks" in conf["backends"]:
+                # hooks only need file names, file IDs will be known to the DB
+                # writer only
+                file_table = {
+                    relpath: None
+                    for relpath, _abspath in fs_storage.walk_pkg_files(pkgdir)
+                }
+                notify_plugins(
+                    conf["observers"],
+                    "add-package",
+                    None,
+                    pkg,
+                    pkgdir,
+                    file_table=file_table,
+                    report=report,
+                    fs_workers=conf["hook_workers"],
+                )
+            if conf["dedup"]:
+                _dedup_package(conf, pkg, pkgdir, report)
+    except Exception:
+        logging.exception("failed to extract %s" % pkg)
+        return None
+    finally:
+        os.chdir(workdir)
+    return timings
+
+
+def _rm_package(pkg, conf, session, db_package=None, package_ids=None, report=None):
     """remove package `pkg` from both FS and DB storage, and notify plugins
 
+    if given, the `package_ids` index (see `db_storage.package_ids`) will be
+    updated to forget about the removed package, and `report` (a
+    runreport.RunReport) will be told about hook timings
+
     handles and logs exceptions
     """
     logging.info("remove %s..." % pkg)
@@ -258,22 +540,59 @@ def _rm_package(pkg, conf, session, db_package=None):
         if not db_package:
             logging.warn("cannot find package %s, not removing" % pkg)
             return
+    changes = contextlib.nullcontext()
+    if not conf["dry_run"] and "db" in conf["backends"]:
+        # hooks remove package statistics: account for them in suite aggregates
+        changes = aggregates.package_changes(session, db_package.id)
     try:
-        if not conf["dry_run"] and "hooks" in conf["backends"]:
-            notify(conf, "rm-package", session, pkg, pkgdir)
-        if not conf["dry_run"] and "fs" in conf["backends"]:
-            fs_storage.remove_package(pkg, pkgdir)
-        if not conf["dry_run"] and "db" in conf["backends"]:
-            if not conf["single_transaction"]:
-                with session.begin():
-                    db_storage.rm_package(session, pkg, db_package)
-            else:
-                with session.begin_nested():
-                    db_storage.rm_package(session, pkg, db_package)
+        with changes:
+            if not conf["dry_run"] and "hooks" in conf["backends"]:
+                notify(conf, "rm-package", session, pkg, pkgdir, report=report)
+            if not conf["dry_run"] and "fs" in conf["backends"]:
+                fs_storage.remove_package(
+                    pkg,
+                    pkgdir,
+                    dedup.store_dir(conf["sources_dir"]),
+                    fs_storage.trash_dir(conf["sources_dir"]),
+                )
+            if not conf["dry_run"] and "db" in conf["backends"]:
+                if not conf["single_transaction"]:
+                    with session.begin():
+                        db_storage.rm_package(session, pkg, db_package)
+                else:
+                    with session.begin_nested():
+                        db_storage.rm_package(session, pkg, db_package)
+                if package_ids is not None:
+                    package_ids.pop((pkg["package"], pkg["version"]), None)
     except Exception:
         logging.exception("failed to remove %s" % pkg)
 
 
+def _force_triggers(conf, session, event, pkg, pkgdir, package_id=None):
+    """notify forced triggers (see the force_triggers setting) of `event` for
+    package `pkg`, accounting for the resulting changes to its statistics in
+    suite aggregates, if the package is in the db with id `package_id`
+
+    handles and logs exceptions
+    """
+    try:
+        changes = contextlib.nullcontext()
+        if package_id and not conf["dry_run"] and "db" in conf["backends"]:
+            changes = aggregates.package_changes(session, package_id)
+        with changes:
+            notify_plugins(
+                conf["observers"],
+                event,
+                session,
+                pkg,
+                pkgdir,
+                triggers=conf["force_triggers"],
+                dry=conf["dry_run"],
+            )
+    except Exception:
+        logging.exception("trigger failure on %s" % pkg)
+
+
 def _add_suite(conf, session, suite, sticky=False, aliases=[]):
     """add suite to the table of static suite info"""
     suite_version = None
@@ -296,33 +615,87 @@ def _add_suite(conf, session, suite, sticky=False, aliases=[]):
         session.add(db_suite)
 
 
+def _extraction_bases(pkgs, conf):
+    """index the extraction directories of `pkgs` by package name and upstream
+    tarballs, for incremental extraction (see `fs_storage.extract_package`)
+
+    packages subject to file exclusions are left out, as their extracted trees
+    lack some upstream files
+
+    """
+    file_excluded = set(spec["package"] for spec in conf["exclude"] if "files" in spec)
+    bases = defaultdict(list)
+    for pkg in pkgs:
+        if pkg["package"] in file_excluded:
+            continue
+        try:
+            origs = pkg.orig_tarballs()
+        except ValueError:
+            continue
+        pkgdir = pkg.extraction_dir(conf["sources_dir"])
+        if origs and pkgdir is not None:
+            bases[(pkg["package"], origs)].append(pkgdir)
+    return bases
+
+
 def extract_new(status, conf, session, mirror):
-    """update stage: list mirror and extract new packages"""
+    """update stage: list mirror and extract new packages
+
+    if more than one extraction worker is configured, new packages are
+    extracted (and their FS hooks run) in parallel by a pool of worker
+    processes, while DB insertions are still done serially, in mirror order.
+    If incremental extraction is enabled, new packages sharing upstream
+    tarballs with already extracted versions are extracted from their trees
+
+    """
     ensure_cache_dir(conf)
+    package_ids = status.package_ids(session)
+    fs_enabled = not conf["dry_run"] and "fs" in conf["backends"]
+    pkgs = mirror.ls()
+    index = {}
+    if conf["extract_incremental"] and fs_enabled:
+        pkgs = list(pkgs)
+        index = _extraction_bases(pkgs, conf)
+
+    def extraction_bases(pkg):
+        if not index:
+            return []
+        pkgdir = pkg.extraction_dir(conf["sources_dir"])
+        try:
+            key = (pkg["package"], pkg.orig_tarballs())
+        except ValueError:
+            return []
+        return [basedir for basedir in index.get(key, []) if basedir != pkgdir]
+
+    def is_new(pkg):
+        if is_excluded_package(pkg, conf["exclude"]):
+            return False
+        return (pkg["package"], pkg["version"]) not in package_ids
 
-    def add_package(pkg):
+    def add_package(pkg, extracted=None, timings=None):
         if is_excluded_package(pkg, conf["exclude"]):
             logging.info("skipping excluded package %s" % pkg)
             return
-        if not db_storage.lookup_package(session, pkg["package"], pkg["version"]):
+        if extracted is False:
+            logging.error("extraction of %s failed, not adding it" % pkg)
+        elif extracted or (pkg["package"], pkg["version"]) not in package_ids:
             # use DB as completion marker: if the package has been inserted, it
             # means everything went fine last time we tried. If not, we redo
             # everything, just to be safe
-            _add_package(pkg, conf, session)
-        pkgdir = pkg.extraction_dir(conf["sources_dir"])
-        if conf["force_triggers"]:
-            try:
-                notify_plugins(
-                    conf["observers"],
-                    "add-package",
-                    session,
+            with status.report.package(pkg, "add-package", timings):
+                _add_package(
                     pkg,
-                    pkgdir,
-                    triggers=conf["force_triggers"],
-                    dry=conf["dry_run"],
+                    conf,
+                    session,
+                    extracted=bool(extracted),
+                    package_ids=package_ids,
+                    report=status.report,
+                    bases=extraction_bases(pkg),
                 )
-            except Exception:
-                logging.exception("trigger failure on %s" % pkg)
+        pkgdir = pkg.extraction_dir(conf["sources_dir"])
+        if conf["force_triggers"]:
+            package_id = package_ids.get((pkg["package"], pkg["version"]))
+            _force_triggers(conf, session, "add-package", pkg, pkgdir, package_id)
         # add entry for sources.txt, temporarily with no suite associated
         pkg_id = (pkg["package"], pkg["version"])
         dsc_rel = pkg.dsc_path().relative_to(conf["mirror_dir"])
@@ -331,19 +704,83 @@ def extract_new(status, conf, session, mirror):
         )
         status.sources[pkg_id] = pkg.archive_area(), dsc_rel, pkgdir_rel, []
 
+    def add_packages(pkgs, extracting=set(), results=None):
+        """add `pkgs`, in order. Packages in `extracting` are being extracted by
+        workers, whose outcomes will be yielded by `results`, in order"""
+        for pkg in pkgs:
+            extracted, timings = None, None
+            if pkg in extracting:
+                timings = next(results)
+                extracted = timings is not None
+            if not conf["single_transaction"]:
+                with session.begin():
+                    add_package(pkg, extracted, timings)
+            else:
+                add_package(pkg, extracted, timings)
+
     logging.info("add new packages...")
-    for pkg in mirror.ls():
-        if not conf["single_transaction"]:
-            with session.begin():
-                add_package(pkg)
-        else:
-            add_package(pkg)
+    workers = conf["extract_workers"]
+    if workers > 1 and fs_enabled:
+        pkgs = list(pkgs)
+        new_pkgs = [pkg for pkg in pkgs if is_new(pkg)]
+        logging.info(
+            "extract %d new packages using %d workers..." % (len(new_pkgs), workers)
+        )
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool(
+            workers, initializer=_init_extract_worker, initargs=(conf,)
+        ) as pool:
+            # imap yields results in submission order, i.e., in mirror order
+            jobs = [(pkg.dump(), extraction_bases(pkg)) for pkg in new_pkgs]
+            results = pool.imap(_extract_package_fs, jobs)
+            add_packages(pkgs, set(new_pkgs), results)
+    else:
+        add_packages(pkgs)
+
+
+def _lower_io_priority():
+    """move the calling thread to the idle I/O scheduling class, if possible"""
+    cmd = ["ionice", "-c", "3", "-p", str(threading.get_native_id())]
+    try:
+        subprocess.check_call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        logging.debug("cannot lower I/O priority of the trash reaper")
+
+
+def reap_trash(conf):
+    """delete the package directories moved to the trash by package removals
+
+    meant to be run in a background thread (see `garbage_collect`), with idle
+    I/O priority. Handles and logs exceptions
+
+    """
+    _lower_io_priority()
+    try:
+        reaped = fs_storage.reap_trash(
+            fs_storage.trash_dir(conf["sources_dir"]),
+            dedup.store_dir(conf["sources_dir"]),
+        )
+        logging.info("trash: %d removed package(s) deleted" % reaped)
+    except Exception:
+        logging.exception("failed to reap trash")
 
 
 def garbage_collect(status, conf, session, mirror):
-    """update stage: list db and remove disappeared and expired packages"""
+    """update stage: list db and remove disappeared and expired packages
+
+    removed package directories are only moved to the trash; they are deleted
+    in the background, while the next update stages run (see `reap_trash`)
+
+    """
     logging.info("garbage collection...")
-    for version in session.query(Package).filter(not_(Package.sticky)):
+    package_ids = status.package_ids(session)
+    # eager load package names, to avoid one query per package
+    q = (
+        session.query(Package)
+        .options(joinedload(Package.name))
+        .filter(not_(Package.sticky))
+    )
+    for version in q:
         pkg = SourcePackage.from_db_model(version)
         pkg_id = (pkg["package"], pkg["version"])
         pkgdir = pkg.extraction_dir(conf["sources_dir"])
@@ -355,31 +792,44 @@ def garbage_collect(status, conf, session, mirror):
             if pkgdir.exists():
                 age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(pkgdir))
             if not age or age.days >= expire_days:
-                _rm_package(pkg, conf, session, db_package=version)
+                with status.report.package(pkg, "rm-package"):
+                    _rm_package(
+                        pkg,
+                        conf,
+                        session,
+                        db_package=version,
+                        package_ids=package_ids,
+                        report=status.report,
+                    )
             else:
                 logging.debug("not removing %s as it is too young" % pkg)
 
         if conf["force_triggers"]:
-            try:
-                notify_plugins(
-                    conf["observers"],
-                    "rm-package",
-                    session,
-                    pkg,
-                    pkgdir,
-                    triggers=conf["force_triggers"],
-                    dry=conf["dry_run"],
-                )
-            except Exception:
-                logging.exception("trigger failure on %s" % pkg)
+            package_id = package_ids.get(pkg_id)
+            _force_triggers(conf, session, "rm-package", pkg, pkgdir, package_id)
+
+    if not conf["dry_run"] and "fs" in conf["backends"]:
+        if fs_storage.trash_dir(conf["sources_dir"]).is_dir():
+            status.reaper = threading.Thread(
+                target=reap_trash, args=(conf,), name="trash-reaper"
+            )
+            status.reaper.start()
 
 
 def update_suites(status, conf, session, mirror):
-    """update stage: sweep and recreate suite mappings"""
+    """update stage: update suite mappings
+
+    suite mappings are updated incrementally: only mappings that have
+    appeared in (or disappeared from) the mirror since the last run are
+    inserted (or deleted)
+
+    """
     logging.info("update suites mappings...")
 
     insert_q = sql.insert(Suite.__table__)
     insert_params = []
+    package_ids = status.package_ids(session)
+    db_mappings = db_storage.suite_mappings(session, list(mirror.suites.keys()))
 
     # load suites aliases
     suites_aliases = mirror.ls_suites_with_aliases()
@@ -387,20 +837,17 @@ def update_suites(status, conf, session, mirror):
         session.query(SuiteAlias).delete()
 
     for suite, pkgs in mirror.suites.items():
-        if not conf["dry_run"] and "db" in conf["backends"]:
-            session.query(Suite).filter_by(suite=suite).delete()
+        mirror_mappings = set()  # IDs of packages in suite, as per mirror
         for pkg_id in pkgs:
             (pkg, version) = pkg_id
-            db_package = db_storage.lookup_package(session, pkg, version)
-            if not db_package:
+            package_id = package_ids.get(pkg_id)
+            if not package_id:
                 logging.warn(
                     "package %s/%s not found in suite %s, skipping"
                     % (pkg, version, suite)
                 )
             else:
-                logging.debug("add suite mapping: %s/%s -> %s" % (pkg, version, suite))
-                params = {"package_id": db_package.id, "suite": suite}
-                insert_params.append(params)
+                mirror_mappings.add(package_id)
                 if pkg_id in status.sources:
                     # fill-in incomplete suite information in status
                     status.sources[pkg_id][-1].append(suite)
@@ -409,6 +856,24 @@ def update_suites(status, conf, session, mirror):
                     logging.warn(
                         "cannot find %s/%s during suite update" % (pkg, version)
                     )
+
+        new_mappings = mirror_mappings - db_mappings[suite]
+        old_mappings = db_mappings[suite] - mirror_mappings
+        logging.debug(
+            "suite %s: %d new and %d old mappings"
+            % (suite, len(new_mappings), len(old_mappings))
+        )
+        if not conf["dry_run"] and "db" in conf["backends"]:
+            if old_mappings:
+                aggregates.update_suite(session, suite, old_mappings, -1)
+                session.query(Suite).filter(Suite.suite == suite).filter(
+                    Suite.package_id.in_(old_mappings)
+                ).delete(synchronize_session=False)
+            aggregates.update_suite(session, suite, new_mappings)
+            insert_params.extend(
+                {"package_id": package_id, "suite": suite}
+                for package_id in sorted(new_mappings)
+            )
         if (
             not conf["dry_run"]
             and "db" in conf["backends"]
@@ -495,11 +960,14 @@ def update_statistics(status, conf, session, suites=None):
     siz = HistorySize(suite, timestamp=now)
     loc = HistorySlocCount(suite, timestamp=now)
     for stat in ["disk_usage", "source_packages", "source_files", "ctags"]:
-        v = getattr(statistics, stat)(session)
+        v = getattr(statistics, stat)(session, aggregates=True)
         stats["total." + stat] = v
         setattr(siz, stat, v)
     store_sloccount_stats(
-        statistics.sloccount_summary(session), stats, "total.sloccount", loc
+        statistics.sloccount_summary(session, aggregates=True),
+        stats,
+        "total.sloccount",
+        loc,
     )
     if not conf["dry_run"] and "db" in conf["backends"]:
         session.add(siz)
@@ -509,7 +977,7 @@ def update_statistics(status, conf, session, suites=None):
     suite_key = "debian_"
     hist_siz = {suite: HistorySize(suite, timestamp=now) for suite in suites}
     for stat in ["disk_usage", "source_packages", "source_files", "ctags"]:
-        stats_result = statistics.stats_grouped_by(session, stat)
+        stats_result = statistics.stats_grouped_by(session, stat, aggregates=True)
         for res in stats_result:
             if res[0] in suites:
                 stats[suite_key + res[0] + "." + stat] = res[1]
@@ -520,7 +988,7 @@ def update_statistics(status, conf, session, suites=None):
             session.add(siz)
 
     # update historySlocCount
-    sloccount_res = statistics.stats_grouped_by(session, "sloccount")
+    sloccount_res = statistics.stats_grouped_by(session, "sloccount", aggregates=True)
     hist_loc = {suite: HistorySlocCount(suite, timestamp=now) for suite in suites}
     for suite in suites:
         temp = {item[1]: item[2] for item in sloccount_res if item[0] == suite}
@@ -590,6 +1058,11 @@ def update_statistics(status, conf, session, suites=None):
     if "copyright" in conf["hooks"]:
         update_license_statistics(suites)
 
+    # downsample the new history samples, for trend charts
+    if not conf["dry_run"] and "db" in conf["backends"]:
+        session.flush()
+        rollups.update(session, since=now)
+
 
 def update_metadata(status, conf, session):
     """update stage: update metadata"""
@@ -615,44 +1088,22 @@ def update_metadata(status, conf, session):
 
 
 def update_charts(status, conf, session, suites=None):
-    """update stage: rebuild charts"""
+    """update stage: rebuild charts of the current content of suites
+
+    chart series are queried serially, charts are then drawn by a pool of
+    conf["charts_workers"] processes, redrawing only those whose series changed
+    since the previous run (see `charts.render_charts`). Trend charts, from the
+    history_* tables, are drawn on demand by the web app (see `charts.trend_chart`)
+
+    """
 
     from debsources import charts
 
     logging.info("update charts...")
     ensure_stats_dir(conf)
     suites = __target_suites(session, suites)
-
-    CHARTS = [  # <period, granularity> paris
-        ("1 month", "hourly"),
-        ("1 year", "daily"),
-        ("5 years", "weekly"),
-        ("20 years", "monthly"),
-    ]
-
-    # size charts, various metrics
-    for metric in ["source_packages", "disk_usage", "source_files", "ctags"]:
-        for period, granularity in CHARTS:
-            for suite in suites + ["ALL"]:
-                series = getattr(statistics, "history_size_" + granularity)(
-                    session, metric, interval=period, suite=suite
-                )
-                filename = "%s-%s-%s.png" % (suite, metric, period.replace(" ", "-"))
-                chart_file = conf["cache_dir"] / "stats" / filename
-                if not conf["dry_run"]:
-                    charts.size_plot(series, chart_file)
-
-    # sloccount: historical histograms
-    for period, granularity in CHARTS:
-        for suite in suites + ["ALL"]:
-            # historical histogram
-            mseries = getattr(statistics, "history_sloc_" + granularity)(
-                session, interval=period, suite=suite
-            )
-            filename = "%s-sloc-%s.png" % (suite, period.replace(" ", "-"))
-            chart_file = conf["cache_dir"] / "stats" / filename
-            if not conf["dry_run"]:
-                charts.multiseries_plot(mseries, chart_file)
+    stats_dir = conf["cache_dir"] / "stats"
+    jobs = []  # <plot, chart file, plot arguments> triples
 
     # sloccount: current pie charts
     sloc_per_suite = []
@@ -664,41 +1115,37 @@ def update_charts(status, conf, session, suites=None):
         if suite not in ["ALL"]:
             sloc_per_suite.append(slocs)
         filename = "%s-sloc_pie-current.png" % suite
-        chart_file = conf["cache_dir"] / "stats" / filename
-        if not conf["dry_run"]:
-            charts.pie_chart(slocs, chart_file)
+        jobs.append((charts.pie_chart, stats_dir / filename, {"items": slocs}))
 
     # sloccount: bar chart plot
     if "charts_top_langs" in conf.keys():
         top_langs = int(conf["charts_top_langs"])
     else:
         top_langs = 6
-    chart_file = conf["cache_dir"] / "stats" / "sloc_bar_plot.png"
-    charts.bar_chart(sloc_per_suite, suites, chart_file, top_langs, "SLOC")
-
-    def update_license_charts():
-        # License: historical histogramms
-        for period, granularity in CHARTS:
-            for suite in suites + ["ALL"]:
-                mseries = getattr(statistics, "history_copyright_" + granularity)(
-                    session, interval=period, suite=suite
-                )
-                filename = "copyright_%s-license-%s.png" % (
-                    suite,
-                    period.replace(" ", "-"),
-                )
-                chart_file = conf["cache_dir"] / "stats" / filename
-                if not conf["dry_run"]:
-                    charts.multiseries_plot(mseries, chart_file, cols=3)
+    jobs.append(
+        (
+            charts.bar_chart,
+            stats_dir / "sloc_bar_plot.png",
+            {
+                "items_per_suite": sloc_per_suite,
+                "suites": suites,
+                "N": top_langs,
+                "y_label": "SLOC",
+            },
+        )
+    )
 
+    def license_charts():
         # License: overall pie chart
         overall_licenses = statistics.licenses_summary(
             statistics.get_licenses(session, "ALL")
         )
         ratio = qry.get_ratio(session)
-        chart_file = conf["cache_dir"] / "stats" / "copyright_overall-license_pie.png"
-        if not conf["dry_run"]:
-            charts.pie_chart(overall_licenses, chart_file, ratio)
+        yield (
+            charts.pie_chart,
+            stats_dir / "copyright_overall-license_pie.png",
+            {"items": overall_licenses, "ratio": ratio},
+        )
 
         # License: bar chart and per suite pie chart.
         all_suites = statistics.sticky_suites(session) + __target_suites(session, None)
@@ -709,22 +1156,36 @@ def update_charts(status, conf, session, suites=None):
             )
             ratio = qry.get_ratio(session, suite=suite)
             # draw license pie chart
-            if not conf["dry_run"]:
-                filename = "copyright_%s-license_pie-current.png" % suite
-                chart_file = conf["cache_dir"] / "stats" / filename
-                charts.pie_chart(licenses, chart_file, ratio)
+            filename = "copyright_%s-license_pie-current.png" % suite
+            yield (
+                charts.pie_chart,
+                stats_dir / filename,
+                {"items": licenses, "ratio": ratio},
+            )
 
             licenses_per_suite.append(licenses)
 
-        chart_file = conf["cache_dir"] / "stats" / "copyright_license_bar_plot.png"
-        if not conf["dry_run"]:
-            charts.bar_chart(
-                licenses_per_suite, all_suites, chart_file, top_langs, "Number of files"
-            )
+        yield (
+            charts.bar_chart,
+            stats_dir / "copyright_license_bar_plot.png",
+            {
+                "items_per_suite": licenses_per_suite,
+                "suites": all_suites,
+                "N": top_langs,
+                "y_label": "Number of files",
+            },
+        )
 
     # LICENSE CHARTS
     if "copyright" in conf["hooks"]:
-        update_license_charts()
+        jobs.extend(license_charts())
+
+    if not conf["dry_run"]:
+        if conf["charts_workers"] > 1:
+            # forking chart workers is unsafe while the trash reaper runs
+            status.wait_for_reaper()
+        rendered, reused = charts.render_charts(jobs, conf["charts_workers"])
+        status.report.charts_rendered(rendered, reused)
 
 
 # update stages
@@ -770,20 +1231,39 @@ def update(conf, session, stages=UPDATE_STAGES):
     """do a full update run"""
     logging.info("start")
     logging.info("list mirror packages...")
-    mirror = SourceMirror(conf["mirror_dir"])
+    mirror = SourceMirror(
+        conf["mirror_dir"],
+        cache_dir=conf["cache_dir"],
+        workers=conf["sources_workers"],
+    )
     status = UpdateStatus()
+    report = status.report
 
-    if STAGE_EXTRACT in stages:
-        extract_new(status, conf, session, mirror)  # stage 1
-    if STAGE_SUITES in stages:
-        update_suites(status, conf, session, mirror)  # stage 2
-    if STAGE_GC in stages:
-        garbage_collect(status, conf, session, mirror)  # stage 3
-    if STAGE_STATS in stages:
-        update_statistics(status, conf, session)  # stage 4
-    if STAGE_CACHE in stages:
-        update_metadata(status, conf, session)  # stage 5
-    if STAGE_CHARTS in stages:
-        update_charts(status, conf, session)  # stage 6
+    try:
+        if STAGE_EXTRACT in stages:
+            with report.stage(pp_stage(STAGE_EXTRACT)):
+                extract_new(status, conf, session, mirror)  # stage 1
+        if STAGE_SUITES in stages:
+            with report.stage(pp_stage(STAGE_SUITES)):
+                update_suites(status, conf, session, mirror)  # stage 2
+        if STAGE_GC in stages:
+            with report.stage(pp_stage(STAGE_GC)):
+                garbage_collect(status, conf, session, mirror)  # stage 3
+        if STAGE_STATS in stages:
+            with report.stage(pp_stage(STAGE_STATS)):
+                update_statistics(status, conf, session)  # stage 4
+        if STAGE_CACHE in stages:
+            with report.stage(pp_stage(STAGE_CACHE)):
+                update_metadata(status, conf, session)  # stage 5
+        if STAGE_CHARTS in stages:
+            with report.stage(pp_stage(STAGE_CHARTS)):
+                update_charts(status, conf, session)  # stage 6
+    finally:
+        status.wait_for_reaper()
+        # report on the run, even if it failed midway
+        report.log_summary()
+        if not conf["dry_run"] and "fs" in conf["backends"]:
+            ensure_cache_dir(conf)
+            report.save(conf["cache_dir"] / REPORT_FILE)
 
     logging.info("finish")